@@ -0,0 +1,941 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains zone transfer clients. Full zone transfer (AXFR) is read in
+a background thread, so the network is used while the zone is being checked.
+Incremental zone transfer (IXFR) is read at once. Many zones can be
+transferred at once into spool files by L{AXFRFetcher}.
+
+  - B{File}: I{AXFRClient.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import os
+import time
+import hmac
+import random
+import base64
+import shutil
+import struct
+import socket
+import hashlib
+import tempfile
+import logging
+import threading
+import Queue
+import ldns
+
+import DNSWire
+from Exceptions import AXFRError
+
+RCODES = {1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMPL', 5: 'REFUSED',
+          6: 'YXDOMAIN', 7: 'YXRRSET', 8: 'NXRRSET', 9: 'NOTAUTH', 10: 'NOTZONE'}
+'''Names of response codes.'''
+
+TSIG_ERROR = "Could not create TSIG signature"
+'''Error message, when the query can't be signed (the same as ldns uses).'''
+
+TSIG_ERRORS = {16: 'BADSIG', 17: 'BADKEY', 18: 'BADTIME'}
+'''Names of TSIG errors.'''
+
+class TSIG(object):
+  '''
+  Transaction signature key used for signing of zone transfer queries (see
+  U{RFC 2845<http://tools.ietf.org/html/rfc2845>}). Signatures of answers are
+  verified by L{TSIGVerifier} objects (see L{verifier()}).
+  '''
+
+  algorithms = {'hmac-md5.sig-alg.reg.int.': hashlib.md5, 'hmac-sha1.': hashlib.sha1,
+                'hmac-sha224.': hashlib.sha224, 'hmac-sha256.': hashlib.sha256,
+                'hmac-sha384.': hashlib.sha384, 'hmac-sha512.': hashlib.sha512}
+  '''Supported algorithms, I{key} is algorithm name, value hash function.'''
+
+  fudge = 300
+  '''Allowed time difference (in seconds) between client and server.'''
+
+  def __init__(self, name, algorithm, secret):
+    '''
+    Raises L{AXFRError}, when the algorithm is not supported or the secret is
+    not valid base64.
+
+    @param name: Key name.
+    @param algorithm: Algorithm name, like C{hmac-sha1} or C{hmac-md5}.
+    @param secret: Key data in base64.
+    '''
+    self.name = DNSWire.canonical_name(name)
+    '''Key name in lower case ending with a dot.'''
+
+    alg = DNSWire.canonical_name(algorithm)
+    if alg == 'hmac-md5.':
+      alg = 'hmac-md5.sig-alg.reg.int.'
+    if not self.algorithms.has_key(alg):
+      raise AXFRError("Can't start AXFR. Error: " + TSIG_ERROR)
+
+    self.algorithm = alg
+    '''Algorithm name in lower case ending with a dot.'''
+
+    try:
+      self.secret = base64.b64decode(secret)
+      '''Key data.'''
+    except TypeError:
+      raise AXFRError("Can't start AXFR. Error: " + TSIG_ERROR)
+
+  def mac(self, data):
+    '''
+    Returns MAC of given data computed with the key.
+    '''
+    return hmac.new(self.secret, data, self.algorithms[self.algorithm]).digest()
+
+  def variables(self, timers, error = 0, other = ''):
+    '''
+    Returns TSIG variables in wire format, that are signed together with the
+    message (see U{RFC 2845, section 3.4.2<http://tools.ietf.org/html/rfc2845#section-3.4.2>}).
+
+    @param timers: I{Time Signed} and I{Fudge} fields in wire format.
+    @param error: I{Error} field.
+    @param other: I{Other Data} field.
+    '''
+    return DNSWire.name_to_wire(self.name) + struct.pack("!HI", 255, 0) + \
+           DNSWire.name_to_wire(self.algorithm) + timers + struct.pack("!HH", error, len(other)) + other
+
+  def sign(self, msg):
+    '''
+    Returns given message in wire format with TSIG record appended.
+    '''
+    now = int(time.time())
+    time_signed = struct.pack("!HIH", now >> 32, now & 0xFFFFFFFF, self.fudge)
+    name = DNSWire.name_to_wire(self.name)
+    alg = DNSWire.name_to_wire(self.algorithm)
+
+    mac = self.mac(msg + self.variables(time_signed))
+
+    rdata = alg + time_signed + struct.pack("!H", len(mac)) + mac + \
+            struct.pack("!HHH", DNSWire.message_id(msg), 0, 0)
+    rr = name + struct.pack("!HHIH", DNSWire.TSIG_TYPE, 255, 0, len(rdata)) + rdata
+
+    arcount = struct.unpack("!H", msg[10:12])[0] + 1
+    return msg[:10] + struct.pack("!H", arcount) + msg[12:] + rr
+
+  def verifier(self, request, title = "AXFR"):
+    '''
+    Returns L{TSIGVerifier} of answers to given query signed by L{sign()}.
+
+    @param title: Type of the transfer used in error messages.
+    '''
+    return TSIGVerifier(self, DNSWire.split_tsig(request)[1][4], title)
+
+class TSIGVerifier(object):
+  '''
+  Verifies TSIG records of answers to a signed zone transfer query (see
+  U{RFC 2845, section 4.4<http://tools.ietf.org/html/rfc2845#section-4.4>}).
+  The first answer has to be signed. Following ones may be unsigned, up to
+  L{max_unsigned} in a row, they are covered by MAC of the next signed one.
+  The last one has to be signed too (see L{finish()}).
+
+  Errors are raised as L{AXFRError}.
+  '''
+
+  max_unsigned = 99
+  '''The highest number of unsigned answers in a row.'''
+
+  def __init__(self, tsig, request_mac, title = "AXFR"):
+    '''
+    @param tsig: Key, by which the query was signed.
+    @type tsig: L{TSIG}
+    @param request_mac: MAC of the query.
+    @param title: Type of the transfer used in error messages.
+    '''
+    self.tsig = tsig
+    self.title = title
+    self.__prev = request_mac
+    '''MAC of the query or of the last signed answer.'''
+    self.__first = True
+    self.__unsigned = []
+    '''Unsigned answers since the last signed one.'''
+
+  def __error(self, text):
+    return AXFRError("Error in " + self.title + ": " + text)
+
+  def verify(self, data):
+    '''
+    Verifies next answer in wire format.
+    '''
+    try:
+      (msg, rr) = DNSWire.split_tsig(data)
+    except ValueError:
+      raise self.__error("Invalid message received.")
+
+    if rr is None:
+      if self.__first:
+        raise self.__error("Answer is not signed by TSIG.")
+      self.__unsigned.append(data)
+      if len(self.__unsigned) > self.max_unsigned:
+        raise self.__error("Too many answers not signed by TSIG.")
+      return
+
+    (name, algorithm, time_signed, fudge, mac, error, other) = rr
+    if name != self.tsig.name or algorithm != self.tsig.algorithm:
+      raise self.__error("Answer is signed by other TSIG key.")
+    if error != 0:
+      raise self.__error("TSIG " + TSIG_ERRORS.get(error, str(error)))
+
+    timers = struct.pack("!HIH", time_signed >> 32, time_signed & 0xFFFFFFFF, fudge)
+    digest = struct.pack("!H", len(self.__prev)) + self.__prev
+    if self.__first:
+      digest += msg + self.tsig.variables(timers, error, other)
+    else:
+      digest += ''.join(self.__unsigned) + msg + timers
+    if self.tsig.mac(digest) != mac:
+      raise self.__error("TSIG signature of answer is not valid.")
+    if abs(time.time() - time_signed) > fudge:
+      raise self.__error("TSIG signature of answer is out of time.")
+
+    self.__prev = mac
+    self.__first = False
+    self.__unsigned = []
+
+  def finish(self):
+    '''
+    Verifies, that the last answer was signed.
+    '''
+    if self.__first or self.__unsigned:
+      raise self.__error("The last answer is not signed by TSIG.")
+
+def soa_to_wire(soa):
+  '''
+  Returns given SOA record in wire format (without compression).
+
+  @type soa: U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+  '''
+  rdata = DNSWire.name_to_wire(str(soa.rdf(0))) + DNSWire.name_to_wire(str(soa.rdf(1))) + \
+          struct.pack("!IIIII", *[int(str(soa.rdf(i))) for i in range(2, 7)])
+  return DNSWire.name_to_wire(str(soa.owner())) + \
+         struct.pack("!HHIH", ldns.LDNS_RR_TYPE_SOA, ldns.LDNS_RR_CLASS_IN, int(soa.ttl()), len(rdata)) + rdata
+
+class IXFRReader(object):
+  '''
+  Reads incremental zone transfer (see
+  U{RFC 1995<http://tools.ietf.org/html/rfc1995>}) over TCP. Unlike
+  L{AXFRReader}, the whole answer is read at once, because it contains only
+  changes of the zone.
+  '''
+
+  def __init__(self, domain, soa):
+    '''
+    @param domain: Domain to be transferred.
+    @param soa: SOA record of the version of the zone, that the client has.
+    @type soa: U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    '''
+    self.domain = domain
+    '''Transferred domain.'''
+    self.soa = soa
+    '''SOA record of the version of the zone, that the client has.'''
+    self.messages = 0
+    '''Count of received messages.'''
+    self.bytes = 0
+    '''Count of received bytes.'''
+
+    self.__new = None
+    self.__state = None
+
+  def __end(self, rr):
+    '''
+    Processes next record of the answer. Returns True, when it is the last
+    one.
+    '''
+    is_soa = rr.get_type() == ldns.LDNS_RR_TYPE_SOA
+
+    if self.__new is None: #the first one, SOA of the current version
+      self.__new = int(str(rr.rdf(2)))
+      self.__state = 'first'
+      return False
+
+    if self.__state == 'first':
+      if is_soa: #SOA of the first old version
+        self.__state = 'deleted'
+      else: #whole zone sent
+        self.__state = 'axfr'
+      return False
+
+    if self.__state == 'axfr':
+      return is_soa
+    if self.__state == 'deleted':
+      if is_soa: #SOA of the next version, added records follow
+        self.__state = 'added'
+      return False
+    if is_soa: #SOA of the next old version or the current one at the end
+      if int(str(rr.rdf(2))) == self.__new:
+        return True
+      self.__state = 'deleted'
+    return False
+
+  def fetch(self, server, port, timeout, tsig = None):
+    '''
+    Sends IXFR query to given server and returns a list of all received
+    records. The list has only one SOA record, when the client has the
+    current version or the server closes the connection after SOA record of
+    a newer version (it can't send the changes). Otherwise the changes (or
+    the whole zone) may follow in next messages after the SOA record. Raises
+    C{socket.error}, when the server can't be connected, and L{AXFRError},
+    when the server refuses the transfer or does not support it.
+
+    @param server: IP address of the server.
+    @param port: Port of the server.
+    @param timeout: Connection and read timeout (in seconds).
+    @param tsig: Key for signing the query or None.
+    @type tsig: L{TSIG}
+    '''
+    qid = random.randint(0, 0xFFFF)
+    msg = DNSWire.build_query(qid, self.domain, ldns.LDNS_RR_TYPE_IXFR,
+                              ldns.LDNS_RR_CLASS_IN, False, False)
+    msg = msg[:8] + struct.pack("!H", 1) + msg[10:] + soa_to_wire(self.soa) #SOA in authority
+    verifier = None
+    if tsig is not None:
+      msg = tsig.sign(msg)
+      verifier = tsig.verifier(msg, "IXFR")
+
+    sock = socket.create_connection((server, port), timeout)
+    try:
+      sock.sendall(struct.pack("!H", len(msg)) + msg)
+      rrs = []
+
+      end = False
+      while not end:
+        try:
+          length = struct.unpack("!H", recv_all(sock, 2))[0]
+        except socket.error:
+          if len(rrs) != 1:
+            raise
+          break #only SOA of a newer version, server can't send the changes
+        data = recv_all(sock, length)
+        self.messages += 1
+        self.bytes += length + 2
+
+        if DNSWire.message_id(data) != qid:
+          continue
+
+        rcode = DNSWire.message_flags(data) & 0x000F
+        if rcode != 0:
+          raise AXFRError("Error in IXFR: " + RCODES.get(rcode, str(rcode)))
+        if verifier is not None:
+          verifier.verify(data)
+
+        pkt = DNSWire.wire2pkt(data)
+        if pkt is None:
+          raise AXFRError("Error in IXFR: Invalid message received.")
+
+        if not rrs and pkt.answer().rr_count() == 0: #IXFR not supported
+          raise AXFRError("Error in IXFR: Not supported by server")
+
+        for rr in pkt.answer().rrs():
+          rrs.append(rr.clone())
+          if self.__end(rr):
+            end = True
+            break
+
+        if len(rrs) == 1 and int(str(rrs[0].rdf(2))) == int(str(self.soa.rdf(2))):
+          end = True #client has the current version, nothing more will come
+
+      if verifier is not None:
+        verifier.finish()
+      return rrs
+    except struct.error, detail:
+      raise socket.error(str(detail))
+    finally:
+      sock.close()
+
+def recv_all(sock, length):
+  '''
+  Reads exactly given number of bytes from given socket.
+  '''
+  data = ''
+  while len(data) < length:
+    chunk = sock.recv(length - len(data))
+    if not chunk:
+      raise socket.error("Connection closed by server.")
+    data += chunk
+  return data
+
+class AXFRReader(object):
+  '''
+  Reads zone transfer over TCP in a background thread and puts records of
+  each received message as one batch to a bounded queue, from which they are
+  taken by L{next_batch()}. Records of a batch are already grouped by owner
+  name, so the consumer handles each owner name once per message instead of
+  each record. When the queue is full, the thread waits, so the zone is never
+  held in memory as a whole.
+
+  Time, that the thread spent waiting for free space in the queue, and time,
+  that L{next_batch()} spent waiting for records, are measured.
+  '''
+
+  queue_size = 64
+  '''The highest number of batches (messages) waiting in the queue.'''
+
+  __END = 'END'
+  '''Queue item marking the end of transfer.'''
+
+  def __init__(self, domain):
+    '''
+    @param domain: Domain to be transferred.
+    '''
+    self.domain = domain
+    '''Transferred domain.'''
+    self.server = None
+    '''Address of the server, from which is the zone transferred.'''
+
+    self.producer_stall = 0.0
+    '''Time (in seconds) the reading thread waited for free space in the queue.'''
+    self.consumer_stall = 0.0
+    '''Time (in seconds) L{next_batch()} waited for records.'''
+    self.records = 0
+    '''Count of received records.'''
+    self.messages = 0
+    '''Count of received messages.'''
+    self.bytes = 0
+    '''Count of received bytes.'''
+    self.writer = None
+    '''L{ZoneSpool.SpoolWriter} copying received messages to a spool or None.'''
+    self.ttfr = None
+    '''Time (in seconds) from the start of the transfer to the first record, None until received.'''
+    self.duration = None
+    '''Time (in seconds) of the whole transfer, None until finished.'''
+    self.soa = None
+    '''SOA record from the start of the transfer, None until received.'''
+    self.path = None
+    '''Path to the spool file, from which is the transfer read, None when read from the network.'''
+    self.__started = None
+
+    self.__queue = Queue.Queue(self.queue_size)
+    self.__stop = threading.Event()
+    self.__thread = None
+    self.__sock = None
+    self.__spool = None
+    self.__qid = None
+    self.__verifier = None
+    '''L{TSIGVerifier} of received messages or None, when the query was not signed.'''
+    self.__done = False
+    self.__complete = False
+
+  def start(self, server, port, timeout, tsig = None, writer = None):
+    '''
+    Connects to given server, sends AXFR query and starts reading thread.
+    Raises C{socket.error}, when the server can't be connected.
+
+    @param server: IP address of the server.
+    @param port: Port of the server.
+    @param timeout: Connection and read timeout (in seconds).
+    @param tsig: Key for signing the query or None.
+    @type tsig: L{TSIG}
+    @param writer: Writer of a spool, to which received messages are copied,
+    or None.
+    @type writer: L{ZoneSpool.SpoolWriter}
+    '''
+    self.server = server
+    self.writer = writer
+    self.__started = time.time()
+    self.__qid = random.randint(0, 0xFFFF)
+    msg = DNSWire.build_query(self.__qid, self.domain, ldns.LDNS_RR_TYPE_AXFR,
+                              ldns.LDNS_RR_CLASS_IN, False, False)
+    if tsig is not None:
+      msg = tsig.sign(msg)
+      self.__verifier = tsig.verifier(msg)
+
+    self.__sock = socket.create_connection((server, port), timeout)
+    self.__sock.sendall(struct.pack("!H", len(msg)) + msg)
+    self.__start_thread()
+
+  def start_spool(self, path, server = None, writer = None):
+    '''
+    Starts reading thread, which reads the transfer from a spool file written
+    by L{AXFRFetcher} or L{ZoneSpool.SpoolWriter} instead of the network.
+    Raises C{IOError}, when the file can't be opened.
+
+    @param path: Path to the spool file.
+    @param server: IP address of the server, from which the zone was
+    transferred.
+    @param writer: Writer of a spool, to which read messages are copied, or
+    None.
+    @type writer: L{ZoneSpool.SpoolWriter}
+    '''
+    self.server = server
+    self.writer = writer
+    self.path = path
+    self.__started = time.time()
+    self.__spool = open(path, "rb")
+    self.__start_thread()
+
+  def __start_thread(self):
+    self.__thread = threading.Thread(target = self.__read)
+    self.__thread.daemon = True
+    self.__thread.start()
+
+  def __recv(self, length):
+    '''
+    Reads exactly given number of bytes from the socket or the spool file.
+    '''
+    if self.__spool is None:
+      return recv_all(self.__sock, length)
+
+    data = self.__spool.read(length)
+    if len(data) < length:
+      raise socket.error("Spool file is truncated.")
+    return data
+
+  def __put(self, item):
+    '''
+    Puts an item to the queue, waits while it is full. Returns False, if the
+    reading should stop.
+    '''
+    try:
+      self.__queue.put_nowait(item)
+      return True
+    except Queue.Full:
+      pass
+
+    start = time.time()
+    while not self.__stop.is_set():
+      try:
+        self.__queue.put(item, True, 0.1)
+        self.producer_stall += time.time() - start
+        return True
+      except Queue.Full:
+        continue
+    return False
+
+  def __read(self):
+    '''
+    Body of the reading thread. Errors are put to the queue as L{AXFRError}
+    objects.
+    '''
+    soa_count = 0
+    try:
+      while soa_count < 2 and not self.__stop.is_set():
+        length = struct.unpack("!H", self.__recv(2))[0]
+        data = self.__recv(length)
+        self.messages += 1
+        self.bytes += length + 2
+
+        if self.__qid is not None and DNSWire.message_id(data) != self.__qid:
+          continue
+
+        rcode = DNSWire.message_flags(data) & 0x000F
+        if rcode != 0:
+          raise AXFRError("Error in AXFR: " + RCODES.get(rcode, str(rcode)))
+        if self.__verifier is not None:
+          self.__verifier.verify(data)
+
+        pkt = DNSWire.wire2pkt(data)
+        if pkt is None:
+          raise AXFRError("Error in AXFR: Invalid message received.")
+
+        if self.writer is not None:
+          self.__copy(data)
+
+        batch = []
+        key = None
+        for rr in pkt.answer().rrs():
+          if rr.get_type() == ldns.LDNS_RR_TYPE_SOA:
+            soa_count += 1
+            if soa_count == 2: #end of transfer
+              break
+            self.soa = rr.clone()
+          elif soa_count == 0:
+            raise AXFRError("Error in AXFR: Transfer does not start with SOA record.")
+
+          owner = str(rr.owner())
+          if owner != key: #records of an owner name usually follow each other
+            key = owner
+            group = []
+            batch.append((owner, group))
+          group.append(rr.clone())
+
+        if batch:
+          if self.ttfr is None:
+            self.ttfr = time.time() - self.__started
+          self.records += sum(len(rrs) for (name, rrs) in batch)
+          if not self.__put(batch):
+            return
+
+      if self.__verifier is not None and soa_count == 2:
+        self.__verifier.finish()
+      if self.duration is None:
+        self.duration = time.time() - self.__started
+      self.__put(self.__END)
+    except AXFRError, detail:
+      self.__put(detail)
+    except (socket.error, struct.error), detail:
+      self.__put(AXFRError("Transfer not fully completed (" + str(detail) + ")."))
+    except Exception, detail: #anything else would leave the consumer waiting
+      self.__put(AXFRError("Error in AXFR: " + detail.__class__.__name__ + " - " + str(detail)))
+    finally:
+      if self.__spool is not None:
+        self.__spool.close()
+      else:
+        self.__sock.close()
+
+  def __copy(self, data):
+    '''
+    Copies a message to the spool. On error the spool is not written any more
+    and a warning is written out using L{logging} module.
+    '''
+    try:
+      self.writer.write(data)
+    except (ValueError, IOError), detail:
+      logging.warning("Spool of " + str(self.domain) + " can't be written (" + str(detail) + ").")
+      self.writer.abort()
+      self.writer = None
+
+  def next_batch(self):
+    '''
+    Returns records of the next message of the transfer or None, when the
+    transfer is complete. Raises L{AXFRError} on error.
+
+    @return: List of tuples C{(<owner name>, <list of records>)}, where owner
+    name is a string and records are
+    U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    objects. The same owner name appears more times only, when its records
+    are not consecutive.
+    '''
+    if self.__done:
+      return None
+
+    try:
+      item = self.__queue.get_nowait()
+    except Queue.Empty:
+      start = time.time()
+      item = self.__wait()
+      self.consumer_stall += time.time() - start
+
+    if item is self.__END:
+      self.__done = True
+      self.__complete = True
+      return None
+    if isinstance(item, AXFRError):
+      self.__done = True
+      raise item
+    return item
+
+  def __wait(self):
+    '''
+    Waits for next item of the queue. Raises L{AXFRError}, when the reading
+    thread ended without putting anything there.
+    '''
+    while True:
+      try:
+        return self.__queue.get(True, 0.1)
+      except Queue.Empty:
+        pass
+
+      thread = self.__thread
+      if thread is None or not thread.is_alive():
+        try: #the last item could be put just before the check
+          return self.__queue.get_nowait()
+        except Queue.Empty:
+          self.__done = True
+          raise AXFRError("Transfer not fully completed (reading stopped).")
+
+  def complete(self):
+    '''
+    Returns True, when the whole transfer was received.
+    '''
+    return self.__complete
+
+  def close(self):
+    '''
+    Stops the reading thread, if it is still running.
+    '''
+    self.__stop.set()
+    if self.__thread is not None:
+      try: #wake up the thread waiting for data
+        if self.__sock is not None:
+          self.__sock.shutdown(socket.SHUT_RDWR)
+      except socket.error:
+        pass
+      self.__thread.join()
+      self.__thread = None
+
+class AXFRFetcher(object):
+  '''
+  Transfers many zones at once, each into its own spool file, so checking of
+  one zone does not wait for transfers of the following ones. Transferred
+  zones are read by L{AXFRReader} objects returned by L{reader()}.
+
+  The count of transfers running at once is limited globally by L{parallel}
+  and for each name server by L{per_server}. When a name server can't be
+  connected, the transfer is tried from the next one.
+  '''
+
+  class Job(object):
+    '''
+    Transfer of one zone.
+    '''
+    def __init__(self, domain, servers, tsig, path):
+      self.domain = domain
+      self.servers = list(servers)
+      '''Tuples C{(<IP address>, <port>)} of name servers not tried yet.'''
+      self.tsig = tsig
+      self.path = path
+      '''Path to the spool file.'''
+      self.server = None
+      '''Address of the server, from which is the zone transferred.'''
+      self.error = None
+      '''L{AXFRError} describing, why the transfer failed.'''
+      self.ttfr = None
+      '''Time (in seconds) from the start of the transfer to the first record.'''
+      self.duration = None
+      '''Time (in seconds) of the whole transfer.'''
+      self.done = threading.Event()
+
+  def __init__(self, parallel = 4, per_server = 2, timeout = 10.0, spool_dir = None):
+    '''
+    @param parallel: The highest number of transfers running at once.
+    @param per_server: The highest number of transfers from one name server
+    running at once.
+    @param timeout: Connection and read timeout (in seconds).
+    @param spool_dir: Directory for spool files. A temporary directory, that
+    is removed by L{close()}, is used when None.
+    '''
+    self.parallel = parallel
+    self.per_server = per_server
+    self.timeout = timeout
+
+    self.__own_dir = spool_dir is None
+    if spool_dir is None:
+      spool_dir = tempfile.mkdtemp(prefix = "dnssec_spool_")
+    self.spool_dir = spool_dir
+    '''Directory with spool files.'''
+
+    self.messages = 0
+    '''Count of received messages of all transfers.'''
+    self.bytes = 0
+    '''Count of received bytes of all transfers.'''
+
+    self.__jobs = Queue.Queue()
+    '''Transfers waiting for a free thread.'''
+    self.__zones = {}
+    '''L{Job} objects, I{key} is domain name.'''
+    self.__running = {}
+    '''Count of running transfers, I{key} is IP address of name server.'''
+    self.__lock = threading.Lock()
+    self.__stop = threading.Event()
+    self.__threads = []
+
+  def add(self, domain, servers, tsig = None):
+    '''
+    Adds a zone to be transferred. Zones are transferred in order, in which
+    they were added.
+
+    @param domain: Domain to be transferred.
+    @param servers: List of tuples C{(<IP address>, <port>)} of name servers
+    in order, in which they should be tried.
+    @param tsig: Key for signing the query or None.
+    @type tsig: L{TSIG}
+    '''
+    key = DNSWire.canonical_name(domain)
+    if self.__zones.has_key(key):
+      return
+
+    job = self.Job(domain, servers, tsig, os.path.join(self.spool_dir, key + "axfr"))
+    self.__zones[key] = job
+    self.__jobs.put(job)
+
+  def start(self):
+    '''
+    Starts transfers in background threads.
+    '''
+    for i in range(min(self.parallel, len(self.__zones))):
+      t = threading.Thread(target = self.__work)
+      t.daemon = True
+      t.start()
+      self.__threads.append(t)
+
+  def __acquire(self, server):
+    '''
+    Reserves a transfer from given server. Returns False, if there are
+    already L{per_server} transfers running from it.
+    '''
+    self.__lock.acquire()
+    try:
+      if self.__running.get(server, 0) >= self.per_server:
+        return False
+      self.__running[server] = self.__running.get(server, 0) + 1
+      return True
+    finally:
+      self.__lock.release()
+
+  def __release(self, server):
+    self.__lock.acquire()
+    try:
+      self.__running[server] -= 1
+    finally:
+      self.__lock.release()
+
+  def __work(self):
+    '''
+    Body of a transfer thread. Takes transfers from the queue, until it is
+    empty. Transfers from busy name servers are put back to the queue. Every
+    error is stored in L{Job.error}, so L{reader()} never waits for a thread,
+    that died.
+    '''
+    while not self.__stop.is_set():
+      try:
+        job = self.__jobs.get_nowait()
+      except Queue.Empty:
+        return
+
+      if not job.servers: #all failed or none given
+        if job.error is None:
+          job.error = AXFRError("Can't start AXFR. Error: No name server available.")
+        job.done.set()
+        continue
+
+      (server, port) = job.servers[0]
+      if not self.__acquire(server): #try it later
+        self.__jobs.put(job)
+        time.sleep(0.01)
+        continue
+
+      job.servers.pop(0)
+      done = True
+      try:
+        try:
+          self.__transfer(job, server, port)
+          job.server = server
+        except socket.error, detail:
+          logging.debug("Can't transfer %s from %s. Error: %s" % (job.domain, server, str(detail)))
+          job.error = AXFRError("Can't start AXFR. Error: %s" % str(detail))
+          if job.servers: #try next name server
+            self.__jobs.put(job)
+            done = False
+        except AXFRError, detail:
+          job.error = detail
+        except Exception, detail: #like spool file, that can't be written
+          job.error = AXFRError("Error in AXFR: " + detail.__class__.__name__ + " - " + str(detail))
+      finally:
+        self.__release(server)
+        if done:
+          job.done.set()
+
+  def __transfer(self, job, server, port):
+    '''
+    Transfers a zone from given server to its spool file. The file contains
+    received messages, each preceded by its length, as they were received
+    over TCP.
+    '''
+    qid = random.randint(0, 0xFFFF)
+    msg = DNSWire.build_query(qid, job.domain, ldns.LDNS_RR_TYPE_AXFR,
+                              ldns.LDNS_RR_CLASS_IN, False, False)
+    verifier = None
+    if job.tsig is not None:
+      msg = job.tsig.sign(msg)
+      verifier = job.tsig.verifier(msg)
+
+    started = time.time()
+    job.ttfr = None #from this attempt only
+    sock = socket.create_connection((server, port), self.timeout)
+    try:
+      spool = open(job.path + ".tmp", "wb")
+    except IOError:
+      sock.close()
+      raise
+    try:
+      sock.sendall(struct.pack("!H", len(msg)) + msg)
+
+      soa_count = 0
+      while soa_count < 2:
+        if self.__stop.is_set():
+          raise socket.error("Transfer stopped.")
+
+        length = struct.unpack("!H", recv_all(sock, 2))[0]
+        data = recv_all(sock, length)
+        if DNSWire.message_id(data) != qid:
+          continue
+
+        rcode = DNSWire.message_flags(data) & 0x000F
+        if rcode != 0:
+          raise AXFRError("Error in AXFR: " + RCODES.get(rcode, str(rcode)))
+        if verifier is not None:
+          verifier.verify(data)
+
+        try:
+          types = DNSWire.answer_types(data)
+        except ValueError:
+          raise AXFRError("Error in AXFR: Invalid message received.")
+        if soa_count == 0 and types and types[0] != ldns.LDNS_RR_TYPE_SOA:
+          raise AXFRError("Error in AXFR: Transfer does not start with SOA record.")
+
+        if types and job.ttfr is None:
+          job.ttfr = time.time() - started
+        soa_count += types.count(ldns.LDNS_RR_TYPE_SOA)
+        spool.write(struct.pack("!H", length) + data)
+        self.messages += 1
+        self.bytes += length + 2
+      if verifier is not None:
+        verifier.finish()
+    except struct.error, detail:
+      raise socket.error(str(detail))
+    finally:
+      sock.close()
+      spool.close()
+
+    job.duration = time.time() - started
+    os.rename(job.path + ".tmp", job.path) #readers never see half written file
+
+  def reader(self, domain, writer = None):
+    '''
+    Waits until given zone is transferred and returns started L{AXFRReader}
+    reading it from the spool file. Returns None, if the zone was not added
+    or its spool file was already released. Raises L{AXFRError}, when the
+    transfer failed.
+
+    @param writer: Writer of a spool, to which read messages are copied, or
+    None.
+    @type writer: L{ZoneSpool.SpoolWriter}
+    '''
+    job = self.__zones.get(DNSWire.canonical_name(domain))
+    if job is None:
+      return None
+
+    while not job.done.wait(0.1): #wait with timeout, so the main thread can be interrupted
+      pass
+
+    if job.server is None:
+      raise job.error
+    if not os.path.exists(job.path): #already read and released
+      return None
+
+    reader = AXFRReader(job.domain)
+    reader.ttfr = job.ttfr #times of the transfer, not of reading the spool
+    reader.duration = job.duration
+    try:
+      reader.start_spool(job.path, job.server, writer)
+    except IOError, detail:
+      raise AXFRError("Can't start AXFR. Error: %s" % str(detail))
+    return reader
+
+  def release(self, domain):
+    '''
+    Removes spool file of given zone, when it is no longer needed.
+    '''
+    job = self.__zones.get(DNSWire.canonical_name(domain))
+    if job is not None and os.path.exists(job.path):
+      os.remove(job.path)
+
+  def close(self):
+    '''
+    Stops running transfers and removes spool files.
+    '''
+    self.__stop.set()
+    for t in self.__threads:
+      t.join()
+    self.__threads = []
+
+    if self.__own_dir:
+      shutil.rmtree(self.spool_dir, True)
+    else:
+      for job in self.__zones.values():
+        for path in (job.path, job.path + ".tmp"):
+          if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,176 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains a store of DNS records, which can answer queries of
+L{ZoneChecker.SafeResolver} without any network access.
+
+  - B{File}: I{AnswerStore.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import logging
+import ldns
+
+from Exceptions import FileError
+from Statistics import Statistics
+
+class AnswerStore(object):
+  '''
+  Keeps DNS records (DNSKEY, DS and RRSIG records covering them) and answers
+  queries from them. The store is loaded from an answer store file, which has
+  one record per line in zone master file format. Empty lines and lines
+  starting with a semicolon are ignored.
+
+  The file can be exported by L{record()} and L{save()} during a run with
+  network access and used later by a run without it.
+  '''
+
+  types = (ldns.LDNS_RR_TYPE_DNSKEY, ldns.LDNS_RR_TYPE_DS)
+  '''Types of records kept in the store (RRSIGs covering them are kept too).'''
+
+  def __init__(self):
+    self.__rrs = {}
+    '''
+    Dictionary of records, I{key} is a tuple C{(<owner>, <type>)}, where type
+    is a string, for RRSIG records the type covered. Value is a list of
+    records in text form.
+    '''
+
+    self.stat = Statistics("Answer store")
+    '''Store usage L{Statistics} object (answered queries and queries without records).'''
+
+  @staticmethod
+  def __key(owner, rr_type):
+    '''
+    Returns a key to L{__rrs} for given owner name and type string.
+    '''
+    owner = str(owner).strip().lower()
+    if not owner.endswith('.'):
+      owner += '.'
+    return (owner, rr_type.upper())
+
+  def add(self, rr):
+    '''
+    Adds a record to the store. Duplicate records are ignored.
+
+    @type rr: U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    '''
+    if rr.get_type() == ldns.LDNS_RR_TYPE_RRSIG:
+      key = self.__key(rr.owner(), str(rr.rrsig_typecovered()))
+    else:
+      key = self.__key(rr.owner(), rr.get_type_str())
+
+    text = str(rr).strip()
+    rrs = self.__rrs.setdefault(key, [])
+    if text not in rrs:
+      rrs.append(text)
+
+  def load(self, path):
+    '''
+    Loads records from an answer store file.
+
+    May raise L{FileError} exception, when the file can't be read or
+    contains an invalid record.
+    '''
+    try:
+      f = open(path, 'r')
+    except IOError, detail:
+      raise FileError("Answer store file " + str(path) + " can't be opened (" +
+                      str(detail) + ").")
+
+    try:
+      num = 0
+      for line in f:
+        num += 1
+        line = line.strip()
+        if not line or line.startswith(';'):
+          continue
+        try:
+          self.add(ldns.ldns_rr.new_frm_str(line))
+        except Exception:
+          raise FileError("Invalid record on line " + str(num) + " of answer store file " +
+                          str(path) + ".")
+    finally:
+      f.close()
+
+    logging.debug("Answer store loaded from " + str(path) + ".")
+
+  def record(self, pkt):
+    '''
+    Adds records of kept types from answer section of given answer.
+
+    @param pkt: Answer or None.
+    @type pkt: U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    '''
+    if pkt is None:
+      return
+
+    for rr in pkt.answer().rrs():
+      if rr.get_type() in self.types:
+        self.add(rr)
+      elif rr.get_type() == ldns.LDNS_RR_TYPE_RRSIG and \
+           str(rr.rrsig_typecovered()).upper() in ('DNSKEY', 'DS'):
+        self.add(rr)
+
+  def save(self, path):
+    '''
+    Writes all records to an answer store file, which can be loaded by
+    L{load()}. On error a warning is written out using L{logging} module.
+    '''
+    keys = self.__rrs.keys()
+    keys.sort()
+
+    try:
+      f = open(path, 'w')
+      try:
+        f.write("; DNSSEC-Verificator answer store\n")
+        for key in keys:
+          for text in self.__rrs[key]:
+            f.write(text + "\n")
+      finally:
+        f.close()
+    except IOError, detail:
+      logging.warning("Answer store file " + str(path) + " can't be written (" +
+                      str(detail) + ").")
+
+  def answer(self, name, rr_type, rr_class = ldns.LDNS_RR_CLASS_IN):
+    '''
+    Returns an answer to given query made of records in the store. When there
+    are no records, the answer has no records in answer section (as if the
+    data did not exist).
+
+    @param name: Queried domain name.
+    @param rr_type: Queried type number.
+    @param rr_class: Queried class number.
+    @return: U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    instance.
+    '''
+    rr_type_str = ldns.ldns_rr_type2str(rr_type)
+    pkt = ldns.ldns_pkt.new_query_frm_str(str(name), rr_type, rr_class, ldns.LDNS_RD)
+    pkt.set_qr(True)
+    pkt.set_ra(True)
+    pkt.set_rcode(ldns.LDNS_RCODE_NOERROR)
+
+    rrs = self.__rrs.get(self.__key(name, rr_type_str), [])
+    if rrs:
+      self.stat.inc('answered')
+    else:
+      self.stat.inc('empty')
+      logging.debug("No " + rr_type_str + " records for " + str(name) + " in answer store.")
+
+    for text in rrs:
+      pkt.push_rr(ldns.LDNS_SECTION_ANSWER, ldns.ldns_rr.new_frm_str(text))
+
+    return pkt
+
+  def log_stats(self):
+    '''
+    Writes out store usage statistics using L{logging} module with info
+    severity. Nothing is written, when the store was not used at all.
+    '''
+    if self.stat.get('answered') + self.stat.get('empty') == 0:
+      return
+
+    logging.info(self.stat.title + ' - ' + str(self.stat.get('answered')) + ' queries answered, ' +
+                 str(self.stat.get('empty')) + ' queries without records.')
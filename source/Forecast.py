@@ -0,0 +1,181 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains forecast of RRSIG expirations of checked zones, so the next check
+can be scheduled just before the first signature expires.
+
+  - B{File}: I{Forecast.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import time
+import json
+import heapq
+import logging
+
+import DNSWire
+
+class ExpirationForecast(object):
+  '''
+  Collects expiration times of RRsets while zones are being checked. An RRset
+  expires, when the last of its RRSIG records expires. For each zone there is
+  a bounded heap with L{size} RRsets expiring first and a histogram of time
+  left until expiration of all RRsets, so memory needed does not depend on
+  the size of the zone.
+
+  The object is meant to live during the whole run of the application, zones
+  are checked one after another (see L{start()} and L{finish()}).
+  '''
+
+  size = 10
+  '''Count of RRsets expiring first, that are reported.'''
+
+  buckets = (3600, 21600, 86400, 259200, 604800, 1209600, 2592000)
+  '''Upper bounds (in seconds) of histogram buckets of time left. Longer times are counted in an extra bucket.'''
+
+  def __init__(self):
+    self.__zones = {}
+    '''Forecasts of finished zones, I{key} is zone apex, value dictionary (see L{as_dict()}).'''
+    self.__zone = None
+    '''Zone apex of the zone being checked, None when there is none.'''
+    self.__now = 0
+    self.__heap = []
+    '''Bounded heap of tuples C{(<-expiration>, <owner name>, <type>)}, the latest one on top.'''
+    self.__histogram = []
+    self.__count = 0
+    self.__expired = 0
+
+  def start(self, zone, now):
+    '''
+    Starts collecting expirations of given zone.
+
+    @param zone: Zone apex (SOA owner name).
+    @param now: Time (UTC epoch), to which time left is computed.
+    '''
+    self.__zone = DNSWire.canonical_name(zone)
+    self.__now = int(now)
+    self.__heap = []
+    self.__histogram = [0] * (len(self.buckets) + 1)
+    self.__count = 0
+    self.__expired = 0
+
+  def add(self, owner, rr_type, expiration):
+    '''
+    Adds expiration time of one RRset. RRsets already expired are only
+    counted, they are reported by the time check.
+
+    @param owner: Owner name of the RRset.
+    @param rr_type: Type of the RRset.
+    @param expiration: The latest C{Signature Expiration} of RRSIGs of the
+    RRset as UTC epoch (see L{ZoneChecker.TimeVerify.normalize_time()}).
+    '''
+    if self.__zone is None:
+      return
+    if expiration < self.__now:
+      self.__expired += 1
+      return
+
+    self.__count += 1
+    left = expiration - self.__now
+    i = 0
+    while i < len(self.buckets) and left > self.buckets[i]:
+      i += 1
+    self.__histogram[i] += 1
+
+    item = (-int(expiration), str(owner), str(rr_type))
+    if len(self.__heap) < self.size:
+      heapq.heappush(self.__heap, item)
+    elif item > self.__heap[0]: #expires sooner than the latest one kept
+      heapq.heapreplace(self.__heap, item)
+
+  def finish(self, complete = True):
+    '''
+    Finishes the zone being checked and writes out the forecast using
+    L{logging} module with info severity.
+
+    @param complete: Were all RRsets of the zone seen? Forecast of a zone
+    checked only partially (like changes from incremental zone transfer) is
+    not kept, the previous one stays valid.
+    '''
+    zone = self.__zone
+    self.__zone = None
+    if zone is None:
+      return
+    if not complete:
+      logging.debug("Expiration forecast - " + zone + " - zone not checked completely, forecast not updated.")
+      return
+
+    items = sorted([(-e, owner, rr_type) for (e, owner, rr_type) in self.__heap])
+    data = {'checked': self.__now, 'rrsets': self.__count, 'expired': self.__expired,
+            'histogram': list(self.__histogram),
+            'next': [{'owner': owner, 'type': rr_type, 'expiration': e, 'time_left': e - self.__now}
+                     for (e, owner, rr_type) in items]}
+    if items:
+      data['first_expiration'] = items[0][0]
+      data['time_left'] = items[0][0] - self.__now
+    else:
+      data['first_expiration'] = None
+      data['time_left'] = None
+    self.__zones[zone] = data
+
+    if not items:
+      logging.info("Expiration forecast - " + zone + " - no RRSIGs valid in future (" +
+                   str(self.__expired) + " RRsets expired).")
+      return
+
+    logging.info("Expiration forecast - " + zone + " - first RRSIG expires in " + str(data['time_left']) +
+                 " s (" + self.date(data['first_expiration']) + "), " + str(self.__count) +
+                 " RRsets valid, " + str(self.__expired) + " expired.")
+    for (e, owner, rr_type) in items:
+      logging.info("Expiration forecast - " + owner + " " + rr_type + " - expires in " +
+                   str(e - self.__now) + " s (" + self.date(e) + ").")
+
+  @staticmethod
+  def date(t):
+    '''
+    Returns UTC epoch as a string in format used by L{ZoneChecker.TimeVerify}.
+    '''
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(t))
+
+  def as_dict(self):
+    '''
+    Returns forecasts of all finished zones as a dictionary, which can be
+    written as JSON. Each zone has time of the check (I{checked}), count of
+    valid (I{rrsets}) and I{expired} RRsets, I{histogram} of time left (see
+    L{buckets}), the first expiration (I{first_expiration}, I{time_left}) and
+    the list of RRsets expiring first (I{next}). The earliest expiration of
+    all zones is I{first_expiration}.
+    '''
+    first = [z['first_expiration'] for z in self.__zones.values() if z['first_expiration'] is not None]
+    return {'buckets': list(self.buckets), 'zones': dict(self.__zones),
+            'first_expiration': min(first or [None])}
+
+  def save(self, path):
+    '''
+    Writes forecasts (see L{as_dict()}) to a file in JSON format. Forecasts of
+    zones not checked in this run (like zones skipped for unchanged serial
+    number) are kept from the previous file. On error a warning is written out
+    using L{logging} module.
+    '''
+    try:
+      f = open(path, 'r')
+      try:
+        old = json.load(f)
+      finally:
+        f.close()
+      for (zone, data) in old.get('zones', {}).items():
+        if zone not in self.__zones:
+          self.__zones[zone] = data
+    except (IOError, ValueError, AttributeError):
+      pass #no previous forecasts
+
+    try:
+      f = open(path, 'w')
+      try:
+        json.dump(self.as_dict(), f, indent = 2, sort_keys = True)
+        f.write("\n")
+      finally:
+        f.close()
+    except IOError, detail:
+      logging.warning("Forecast file " + str(path) + " can't be written (" + str(detail) + ").")
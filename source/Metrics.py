@@ -0,0 +1,165 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains transport metrics of queries and zone transfers, so it can be told,
+whether a slow run waited for the network or for checks.
+
+  - B{File}: I{Metrics.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import json
+import logging
+
+from Statistics import Statistics
+
+class TransportMetrics(object):
+  '''
+  Collects counters of queries (sent messages, answers, timeouts, retries,
+  failovers to other name servers and fallbacks to TCP), round trip time
+  (RTT) histograms of each name server and timings of zone transfers.
+
+  The object is meant to live during the whole run of the application, it is
+  shared by L{AsyncResolver.AsyncResolver} objects and zone providers.
+  '''
+
+  buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+  '''Upper bounds (in seconds) of RTT histogram buckets. Longer RTTs are counted in an extra bucket.'''
+
+  def __init__(self):
+    self.stat = Statistics("Transport")
+    '''
+    Counters of queries - I{sent} messages, I{answered} and I{timeout}
+    queries, I{retry} (message sent again to the same or next name server),
+    I{failover} (answer from other, than the first name server), I{tcp}
+    (fallback to TCP after truncated answer) and I{transfer failover} (zone
+    transfer from other, than the first name server).
+    '''
+    self.__rtt = {}
+    '''RTT histograms, I{key} is IP address, value list of counts for L{buckets}.'''
+    self.__transfers = []
+    '''List of dictionaries describing finished zone transfers.'''
+
+  def inc(self, name, value = 1):
+    '''
+    Increases a counter (see L{stat}).
+    '''
+    self.stat.inc(name, value)
+
+  def rtt(self, server, seconds):
+    '''
+    Adds a RTT sample of given name server to its histogram.
+    '''
+    histogram = self.__rtt.get(server)
+    if histogram is None:
+      histogram = self.__rtt[server] = [0] * (len(self.buckets) + 1)
+
+    i = 0
+    while i < len(self.buckets) and seconds > self.buckets[i]:
+      i += 1
+    histogram[i] += 1
+
+  def transfer(self, domain, server, records, messages, length, ttfr, duration):
+    '''
+    Records a finished zone transfer.
+
+    @param domain: Transferred domain.
+    @param server: IP address of the name server.
+    @param records: Count of received records.
+    @param messages: Count of received messages.
+    @param length: Count of received bytes.
+    @param ttfr: Time (in seconds) from the start of the transfer to the first
+    record, None if not known.
+    @param duration: Time (in seconds) of the whole transfer, None if not
+    known.
+    '''
+    self.__transfers.append({'domain': str(domain), 'server': server, 'records': records,
+                             'messages': messages, 'bytes': length, 'ttfr': ttfr,
+                             'duration': duration})
+
+  @staticmethod
+  def rate(count, duration):
+    '''
+    Returns count per second or None, if duration is not known.
+    '''
+    if not duration:
+      return None
+    return count / duration
+
+  def as_dict(self):
+    '''
+    Returns all metrics as a dictionary, which can be written as JSON.
+    '''
+    counters = {}
+    for name in ('sent', 'answered', 'timeout', 'retry', 'failover', 'tcp', 'transfer failover'):
+      counters[name] = self.stat.get(name)
+
+    transfers = []
+    for t in self.__transfers:
+      t = dict(t)
+      t['records_per_sec'] = self.rate(t['records'], t['duration'])
+      t['bytes_per_sec'] = self.rate(t['bytes'], t['duration'])
+      transfers.append(t)
+
+    return {'queries': counters, 'rtt_buckets': list(self.buckets),
+            'rtt_histograms': dict(self.__rtt), 'transfers': transfers}
+
+  def log_summary(self):
+    '''
+    Writes out query counters, RTT percentiles of name servers and zone
+    transfer rates using L{logging} module with info severity. Nothing is
+    written, when nothing was sent.
+    '''
+    if self.stat.get('sent') > 0:
+      logging.info(self.stat.title + ' - ' + str(self.stat.get('sent')) + ' messages sent, ' +
+                   str(self.stat.get('answered')) + ' queries answered, ' +
+                   str(self.stat.get('timeout')) + ' timed out, ' + str(self.stat.get('retry')) +
+                   ' retries, ' + str(self.stat.get('failover')) + ' failovers, ' +
+                   str(self.stat.get('tcp')) + ' TCP fallbacks.')
+
+    servers = self.__rtt.keys()
+    servers.sort()
+    for server in servers:
+      logging.info(self.stat.title + ' - RTT of ' + server + ': ' + str(sum(self.__rtt[server])) +
+                   ' samples, median ' + self.__percentile(server, 0.5) + ', 90th percentile ' +
+                   self.__percentile(server, 0.9) + '.')
+
+    for t in self.__transfers:
+      if t['duration']:
+        logging.info("%s - transfer of %s from %s - first record after %.3f s, %.0f records/s, "
+                     "%.0f bytes/s, %d messages." % (self.stat.title, t['domain'], t['server'],
+                     t['ttfr'] or 0.0, self.rate(t['records'], t['duration']),
+                     self.rate(t['bytes'], t['duration']), t['messages']))
+
+  def __percentile(self, server, p):
+    '''
+    Returns bound of histogram bucket with given percentile of RTT samples of
+    given server as a string.
+    '''
+    histogram = self.__rtt[server]
+    limit = p * sum(histogram)
+    count = 0
+    for i in range(len(histogram)):
+      count += histogram[i]
+      if count >= limit:
+        break
+
+    if i < len(self.buckets):
+      return "<= %g s" % self.buckets[i]
+    return "> %g s" % self.buckets[-1]
+
+  def save(self, path):
+    '''
+    Writes all metrics (see L{as_dict()}) to a file in JSON format. On error a
+    warning is written out using L{logging} module.
+    '''
+    try:
+      f = open(path, 'w')
+      try:
+        json.dump(self.as_dict(), f, indent = 2, sort_keys = True)
+        f.write("\n")
+      finally:
+        f.close()
+    except IOError, detail:
+      logging.warning("Metrics file " + str(path) + " can't be written (" + str(detail) + ").")
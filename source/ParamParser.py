@@ -58,7 +58,7 @@ class ZoneParams(object):
     @param z_name: Name of the source.
     @type z_name: String
     @param z_type: Type of the source.
-    @type z_type: "file" | "axfr"
+    @type z_type: "file" | "axfr" | "ixfr" | "spool"
     @param z_source: Source type specific string.
     @type z_source: String - filename or domain
     @param z_trust: List of files with trust anchors.
@@ -174,7 +174,10 @@ class ParamParser(object):
     self.__paramLong = { '--time': 0, '--level': 0, '--input': 0, '--anchor': 0,
                          '--type': 0, '--resolver': 0, '--config': 0,
                          '--sformat': 0, '--dformat': 0, '--key': 0, '--bs': 0,
-                         '--bw': 0, '--check': 0, '--nocheck': 0}
+                         '--bw': 0, '--check': 0, '--nocheck': 0, '--cache': 0,
+                         '--offline': 0, '--record': 0, '--parallel': 0,
+                         '--perserver': 0, '--spool': 0, '--metrics': 0,
+                         '--columns': 0, '--forecast': 0}
     '''
     Dictionary that lists available parameters from command line, with char =
     '''
@@ -219,6 +222,70 @@ class ParamParser(object):
     Returns a L{TimeVerify} object, that is based on users configuration.
     '''
     return self.__paramLong['--time']
+  
+  def get_cache(self):
+    '''
+    Returns a path to the trust chain cache file or None, if it should not be
+    used.
+    '''
+    return self.__paramLong['--cache']
+  
+  def get_offline(self):
+    '''
+    Returns a path to the answer store file, from which should be queries
+    answered instead of name servers, or None, if name servers should be used.
+    '''
+    return self.__paramLong['--offline']
+  
+  def get_record(self):
+    '''
+    Returns a path to the answer store file, where should be answers of name
+    servers written, or None, if they should not be written.
+    '''
+    return self.__paramLong['--record']
+  
+  def get_parallel(self):
+    '''
+    Returns the highest number of zone transfers running at once. Value 1
+    means, that zones are transferred one after another, while being checked.
+    '''
+    return self.__paramLong['--parallel']
+  
+  def get_per_server(self):
+    '''
+    Returns the highest number of zone transfers from one name server running
+    at once.
+    '''
+    return self.__paramLong['--perserver']
+  
+  def get_columns(self):
+    '''
+    Returns count of RRSIG records checked at once by
+    L{RRSIGColumns.RRSIGColumns}, or None, if they should be checked one
+    owner name at a time.
+    '''
+    return self.__paramLong['--columns']
+  
+  def get_spool(self):
+    '''
+    Returns a path to the spool directory, where zone transfers should be
+    written, or None, if they should not be written.
+    '''
+    return self.__paramLong['--spool']
+  
+  def get_metrics(self):
+    '''
+    Returns a path to the file, where transport metrics should be written in
+    JSON format, or None, if they should not be written.
+    '''
+    return self.__paramLong['--metrics']
+  
+  def get_forecast(self):
+    '''
+    Returns a path to the file, where RRSIG expiration forecast should be
+    written in JSON format, or None, if it should not be collected.
+    '''
+    return self.__paramLong['--forecast']
     
   def __erase_params(self):
     '''
@@ -273,6 +340,69 @@ class ParamParser(object):
           raise ParamError(6, "Parameter time can't be empty.")
       except ConfigParser.NoOptionError:
         pass
+      
+      try:
+        self.__paramLong['--cache'] = p.get("general", "cache", True)
+        if self.__paramLong['--cache'] == "":
+          raise ParamError(6, "Parameter cache can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--offline'] = p.get("general", "offline", True)
+        if self.__paramLong['--offline'] == "":
+          raise ParamError(6, "Parameter offline can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--record'] = p.get("general", "record", True)
+        if self.__paramLong['--record'] == "":
+          raise ParamError(6, "Parameter record can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--parallel'] = p.get("general", "parallel", True)
+        if self.__paramLong['--parallel'] == "":
+          raise ParamError(6, "Parameter parallel can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--perserver'] = p.get("general", "perserver", True)
+        if self.__paramLong['--perserver'] == "":
+          raise ParamError(6, "Parameter perserver can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--columns'] = p.get("general", "columns", True)
+        if self.__paramLong['--columns'] == "":
+          raise ParamError(6, "Parameter columns can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--spool'] = p.get("general", "spool", True)
+        if self.__paramLong['--spool'] == "":
+          raise ParamError(6, "Parameter spool can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--metrics'] = p.get("general", "metrics", True)
+        if self.__paramLong['--metrics'] == "":
+          raise ParamError(6, "Parameter metrics can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
+      
+      try:
+        self.__paramLong['--forecast'] = p.get("general", "forecast", True)
+        if self.__paramLong['--forecast'] == "":
+          raise ParamError(6, "Parameter forecast can't be empty.")
+      except ConfigParser.NoOptionError:
+        pass
     except ConfigParser.NoSectionError:
       pass
     
@@ -445,7 +575,8 @@ class ParamParser(object):
   def __check_parsed(self):
     '''
     Checks parsed parameters C{--level}, C{--time}, C{--input}, C{--anchor},
-    C{--bs} and C{--bw}, if they contain valid values.
+    C{--bs}, C{--bw}, C{--parallel}, C{--perserver} and C{--columns}, if they
+    contain valid values.
     
     The C{--time} parameter is passed directly to L{TimeVerify} object, which
     can be obtained later using L{get_time()} method.
@@ -476,6 +607,26 @@ class ParamParser(object):
     if not self.__paramLong['--resolver']: #put default value
       self.__paramLong['--resolver'] = None
       
+    if not self.__paramLong['--cache']: #put default value
+      self.__paramLong['--cache'] = None
+      
+    if not self.__paramLong['--offline']: #put default value
+      self.__paramLong['--offline'] = None
+      
+    if not self.__paramLong['--record']: #put default value
+      self.__paramLong['--record'] = None
+    elif self.__paramLong['--offline']: #nothing to record
+      raise ParamError(2, "Parameters --offline and --record can't be used together.")
+      
+    if not self.__paramLong['--spool']: #put default value
+      self.__paramLong['--spool'] = None
+      
+    if not self.__paramLong['--metrics']: #put default value
+      self.__paramLong['--metrics'] = None
+      
+    if not self.__paramLong['--forecast']: #put default value
+      self.__paramLong['--forecast'] = None
+      
     if not self.__paramLong['--key']: #put default value
       self.__paramLong['--key'] = [None, None, None]
     else:
@@ -493,6 +644,18 @@ class ParamParser(object):
         raise ParamError(8, "Parameter --bs has invalid value ("+str(self.__paramLong['--bs'])+\
                          "). Use positive integer number higher or equal to 1.")
         
+    for (name, default) in (('--parallel', 1), ('--perserver', 2), ('--columns', None)):
+      if not self.__paramLong[name]: #put default value
+        self.__paramLong[name] = default
+      else:
+        try:
+          self.__paramLong[name] = int(self.__paramLong[name])
+          if self.__paramLong[name] <= 0:
+            raise ValueError("")
+        except ValueError:
+          raise ParamError(8, "Parameter "+name+" has invalid value ("+str(self.__paramLong[name])+\
+                           "). Use positive integer number higher or equal to 1.")
+        
     if not self.__paramLong['--bw']: #put default value
       self.__paramLong['--bw'] = True
     else:
@@ -528,7 +691,7 @@ class ParamParser(object):
       if z.type is None:
         logging.critical("Source " + str(z.name) + ": Type not set. Disabling.")
         self.zones.pop(i)
-      elif not z.type in ("file","axfr"):
+      elif not z.type in ("file","axfr","ixfr","spool"):
         logging.critical("Source " + str(z.name) + ": Invalid type \"" + str(z.type) + "\". Disabling.")
         self.zones.pop(i)
       elif not z.source:
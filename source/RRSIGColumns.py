@@ -0,0 +1,304 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains columnar store of RRSIG metadata, so time and TTL checks of RRSIG
+records can run over whole blocks of records instead of one record at a time.
+
+  - B{File}: I{RRSIGColumns.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import array
+import logging
+
+try:
+  import numpy
+except ImportError: #plain arrays are used
+  numpy = None
+
+import DNSWire
+from ZoneChecker import TimeVerify
+
+UINT32 = 'I' if array.array('I').itemsize >= 4 else 'L'
+'''Type code of arrays with unsigned 32 bit numbers.'''
+
+class RRSIGColumns(object):
+  '''
+  Fills compact arrays (see U{array<http://docs.python.org/library/array.html>})
+  with inception, expiration, TTL, original TTL, algorithm, key tag and
+  covered type of RRSIG records, while the zone is being loaded. Fields are
+  read from the
+  U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+  objects only once. When there are L{block_size} records, signature times
+  (like L{ZoneChecker.RRCollection.verify_rrsigs_times()}), remaining validity
+  time (like L{ZoneChecker.RRCollection.verify_rrsigs_remaining()}) and TTLs
+  (like L{ZoneChecker.RRCollection.verify_rrsigs_ttl()}) of the whole block
+  are checked at once. Operations run over NumPy arrays, when NumPy is
+  installed.
+
+  Messages are the same as of the checks of single L{ZoneChecker.RRCollection}
+  objects, but they are written out for the whole block, so they can come
+  after messages of other checks of the same owner names.
+  '''
+
+  def __init__(self, tv, block_size, times = True, ttls = True):
+    '''
+    @param tv: Object to be used in time-verifying operations.
+    @type tv: L{ZoneChecker.TimeVerify}
+    @param block_size: Count of RRSIG records checked at once.
+    @param times: Check signature times?
+    @param ttls: Check remaining validity time and TTLs?
+    '''
+    self.tv = tv
+    self.block_size = block_size
+    self.times = times
+    self.ttls = ttls
+    self.tmin = 0
+    '''Minimum remaining validity time, that is acceptable (highest TTL from SOA).'''
+    self.__clear()
+
+  def __clear(self):
+    '''
+    Creates empty arrays for next block.
+    '''
+    #columns of RRSIG records
+    self.__inception = array.array(UINT32)
+    self.__expiration = array.array(UINT32)
+    self.__ttl = array.array(UINT32)
+    self.__orig_ttl = array.array(UINT32)
+    self.__algorithm = array.array('B')
+    self.__keytag = array.array('H')
+    self.__covered = array.array('H')
+    self.__group = array.array(UINT32)
+    '''Index of group (RRSIGs of one owner name covering one type) of each record.'''
+
+    #columns of groups
+    self.__group_start = array.array(UINT32)
+    '''Index of the first record of each group.'''
+    self.__group_name = []
+    '''Covered type of each group as upper case string.'''
+    self.__rr_min = array.array(UINT32)
+    '''The lowest TTL of records covered by each group.'''
+    self.__rr_max = array.array(UINT32)
+    '''The highest TTL of records covered by each group.'''
+    self.__rr_ttls = {}
+    '''Sets of TTLs of covered records, I{key} is index of group. Only for groups with mixed TTLs.'''
+
+    self.__owners = []
+    '''Tuples C{(<owner name>, <index of the first group>)}.'''
+
+  def add(self, rrs):
+    '''
+    Adds RRSIG records of given object. Checks the block, when it is full.
+
+    @type rrs: L{ZoneChecker.RRCollection}
+    '''
+    self.__owners.append((rrs.owner(), len(self.__group_start)))
+
+    covered = None
+    for rrsig in rrs.rrsigs(): #grouped by covered type
+      name = str(rrsig.rrsig_typecovered()).upper()
+      if name != covered: #new group
+        covered = name
+        rr_type = DNSWire.rdf_to_type(rrsig.rrsig_typecovered())
+        self.__add_group(rrs, name)
+
+      self.__inception.append(TimeVerify.epoch(rrsig.rrsig_inception()))
+      self.__expiration.append(TimeVerify.epoch(rrsig.rrsig_expiration()))
+      self.__ttl.append(int(rrsig.ttl()))
+      self.__orig_ttl.append(DNSWire.rdf_to_int(rrsig.rrsig_origttl()))
+      self.__algorithm.append(DNSWire.rdf_to_int(rrsig.rrsig_algorithm()))
+      self.__keytag.append(DNSWire.rdf_to_int(rrsig.rrsig_keytag()))
+      self.__covered.append(rr_type)
+      self.__group.append(len(self.__group_start) - 1)
+
+    if len(self.__ttl) >= self.block_size:
+      self.flush()
+
+  def __add_group(self, rrs, name):
+    '''
+    Starts a group of RRSIGs covering given type and remembers TTLs of
+    covered records.
+    '''
+    group = len(self.__group_start)
+    self.__group_start.append(len(self.__ttl))
+    self.__group_name.append(name)
+
+    ttls = set([int(rr.ttl()) for rr in rrs.get_rrs(name) or []])
+    if not ttls: #no record to cover, TTLs can't be matched
+      ttls = set([0])
+      self.__rr_ttls[group] = set()
+    elif len(ttls) > 1:
+      self.__rr_ttls[group] = ttls
+    self.__rr_min.append(min(ttls))
+    self.__rr_max.append(max(ttls))
+
+  def __column(self, values, group = None):
+    '''
+    Returns a column as NumPy array of 64 bit integers (or a list, when NumPy
+    is not installed). Column of groups is expanded to records, when
+    L{group} column is given.
+    '''
+    if numpy is not None:
+      column = self.__array(values)
+      if group is not None:
+        column = column[self.__array(group)]
+      return column
+
+    if group is not None:
+      return [values[g] for g in group]
+    return values.tolist()
+
+  @staticmethod
+  def __array(values):
+    '''
+    Returns NumPy array of 64 bit integers with values of given array.
+    '''
+    if not values: #empty buffer can't be used
+      return numpy.zeros(0, numpy.int64)
+    return numpy.frombuffer(values, dtype = values.typecode).astype(numpy.int64)
+
+  def __normalize(self, values, now):
+    '''
+    Places 32 bit times in time closest to L{now} using serial number
+    arithmetic, like L{ZoneChecker.TimeVerify.normalize_time()}.
+    '''
+    if numpy is not None:
+      return now + ((((values - now) & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000)
+    return [now + ((((v - now) & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000) for v in values]
+
+  def flush(self):
+    '''
+    Checks all records added so far and writes out the results using
+    L{logging} module. Has to be called at the end of the zone.
+    '''
+    if not self.__owners:
+      return
+
+    now = int(self.tv.now())
+    inception = self.__normalize(self.__column(self.__inception), now)
+    expiration = self.__normalize(self.__column(self.__expiration), now)
+    ttl = self.__column(self.__ttl)
+    results = {}
+
+    if numpy is not None:
+      if self.times:
+        results['status'] = numpy.where(now < inception, self.tv.RRSIG_FUTURE,
+                                        numpy.where(now <= expiration, self.tv.RRSIG_VALID,
+                                                    self.tv.RRSIG_INVALID)).tolist()
+      if self.ttls:
+        rr_min = self.__column(self.__rr_min, self.__group)
+        rr_max = self.__column(self.__rr_max, self.__group)
+        orig_ttl = self.__column(self.__orig_ttl)
+        results['left'] = numpy.maximum(expiration - now, 0).tolist()
+        results['long'] = (ttl > expiration - inception).tolist()
+        results['ttl'] = ((rr_min == rr_max) & (ttl == rr_min)).tolist()
+        results['orig'] = ((rr_min == rr_max) & (orig_ttl == rr_min)).tolist()
+    else:
+      if self.times:
+        results['status'] = [self.tv.RRSIG_FUTURE if now < i else
+                             (self.tv.RRSIG_VALID if now <= e else self.tv.RRSIG_INVALID)
+                             for (i, e) in zip(inception, expiration)]
+      if self.ttls:
+        rr_min = self.__column(self.__rr_min, self.__group)
+        rr_max = self.__column(self.__rr_max, self.__group)
+        results['left'] = [max(e - now, 0) for e in expiration]
+        results['long'] = [t > e - i for (t, i, e) in zip(ttl, inception, expiration)]
+        results['ttl'] = [l == h and t == l for (t, l, h) in zip(ttl, rr_min, rr_max)]
+        results['orig'] = [l == h and t == l for (t, l, h) in zip(self.__orig_ttl, rr_min, rr_max)]
+
+    self.__report(results)
+    self.__clear()
+
+  def __groups(self, owner):
+    '''
+    Returns iterator of tuples C{(<covered type>, <group index>, <list of
+    record indexes>)} of given owner name index.
+    '''
+    last = len(self.__group_start)
+    if owner + 1 < len(self.__owners):
+      last = self.__owners[owner + 1][1]
+
+    for g in range(self.__owners[owner][1], last):
+      end = len(self.__ttl)
+      if g + 1 < len(self.__group_start):
+        end = self.__group_start[g + 1]
+      yield (self.__group_name[g], g, range(self.__group_start[g], end))
+
+  def __report(self, results):
+    '''
+    Writes out results of the checks of the block for each owner name.
+    '''
+    for i in range(len(self.__owners)):
+      owner = self.__owners[i][0]
+      groups = list(self.__groups(i))
+      if self.times:
+        self.__report_times(owner, groups, results['status'])
+      if self.ttls:
+        self.__report_remaining(owner, groups, results['left'])
+        self.__report_ttls(owner, groups, results)
+
+  def __report_times(self, owner, groups, status):
+    '''
+    Writes out results of the time check of one owner name.
+    '''
+    total = { 'count': 0, 'invalid': 0, 'valid': 0, 'future': 0 }
+
+    for (name, g, rows) in groups:
+      type = { 'count': len(rows), 'invalid': 0, 'valid': 0, 'future': 0 }
+      for r in rows:
+        if status[r] == self.tv.RRSIG_VALID:
+          type['valid'] += 1
+        elif status[r] == self.tv.RRSIG_INVALID:
+          type['invalid'] += 1
+        else:
+          type['future'] += 1
+      for key in type.keys():
+        total[key] += type[key]
+
+      if type['valid'] == 0: #none of the signatures is valid for current type
+        logging.error('Signatures time check - ' + owner + " " + name +\
+        ' - 0 valid, ' + str(type['count']) + " total, " + str(type['invalid']) +
+        ' old, ' + str(type['future']) + ' future.')
+      else: #some of them are time-valid
+        logging.info('Signatures time check - ' + owner + " " + name + ' - ' + \
+        str(type['count']) + " total, " + str(type['valid']) + ' valid, ' +
+        str(type['invalid']) + ' old, ' + str(type['future']) + ' future.')
+
+    #statistics
+    if total['count'] == 0: #no signatures checked
+      logging.debug('Signatures time check - ' + owner + ' no signatures.')
+    elif len(groups) > 1: #needed only if multiple records per type
+      logging.info('Signatures time check - ' + owner + ' ' + \
+      str(total['count']) + " total, " + str(total['valid']) + ' valid, ' +
+      str(total['invalid']) + ' old, ' + str(total['future']) + ' future.')
+
+  def __report_remaining(self, owner, groups, left):
+    '''
+    Writes out results of the remaining validity time check of one owner name.
+    '''
+    for (name, g, rows) in groups:
+      tlmax = max([left[r] for r in rows])
+      if tlmax < self.tmin:
+        logging.warning(owner + " RRSIG Remaining validity time of RRSIG is too low (" +
+                        str(tlmax) + " < " + str(self.tmin) + ").")
+
+  def __report_ttls(self, owner, groups, results):
+    '''
+    Writes out results of the TTL checks of one owner name. TTLs of groups
+    with mixed TTLs of covered records are matched one by one.
+    '''
+    for (name, g, rows) in groups:
+      for r in rows:
+        if results['long'][r]:
+          logging.warning(owner + " " + name + " - TTL of the RRSIG record should be lower, than the total validity time.")
+
+        ttls = self.__rr_ttls.get(g)
+        if ttls is not None and not ttls: #no record to cover
+          continue
+
+        if not (results['ttl'][r] or (ttls and self.__ttl[r] in ttls)):
+          logging.warning(owner + " " + name + " - TTL of RRSIG does not match TTL of RR it covers.")
+        if not (results['orig'][r] or (ttls and self.__orig_ttl[r] in ttls)):
+          logging.warning(owner + " " + name + " - Original TTL of RRSIG does not match TTL of RR it covers.")
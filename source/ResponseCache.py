@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains a cache of DNS answers used by L{ZoneChecker.SafeResolver}, so the
+same query is not sent again while its answer is still valid.
+
+  - B{File}: I{ResponseCache.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import time
+import logging
+import collections
+import ldns
+
+import DNSWire
+from Statistics import Statistics
+
+class ResponseCache(object):
+  '''
+  Remembers answers to queries. Positive answers are kept for the lowest TTL
+  of records in them, negative answers (name or data does not exist) for the
+  negative TTL taken from SOA record in authority section (see
+  U{RFC 2308, section 5<http://tools.ietf.org/html/rfc2308#section-5>}).
+  Negative answers without SOA record and other failures are not cached.
+
+  Entries are bound to a set of name servers, which sent them. When the cache
+  is full, the least recently used entry is removed.
+  '''
+
+  size = 4096
+  '''The highest number of entries in the cache.'''
+
+  def __init__(self, size = None):
+    '''
+    @param size: The highest number of entries, default is L{size}.
+    '''
+    if size is not None:
+      self.size = size
+
+    self.__entries = collections.OrderedDict()
+    '''
+    Cached answers ordered from the least recently used, I{key} is returned by
+    L{key()}, value a tuple C{(<expiration time>, <ldns_pkt>)}.
+    '''
+
+    self.stat = Statistics("Response cache")
+    '''Cache usage L{Statistics} object (hits, negative hits, misses, expired, stored and evicted entries).'''
+
+  @staticmethod
+  def key(name, rr_type, rr_class, rd, servers):
+    '''
+    Returns cache key of given query sent to given name servers.
+
+    @param servers: List of name servers IP addresses.
+    '''
+    return (DNSWire.canonical_name(name), int(rr_type), int(rr_class), bool(rd),
+            tuple(sorted(servers)))
+
+  @staticmethod
+  def __is_negative(pkt):
+    '''
+    Returns True, if given answer says, that queried name or data does not
+    exist.
+    '''
+    if pkt.get_rcode() == ldns.LDNS_RCODE_NXDOMAIN:
+      return True
+    return pkt.get_rcode() == ldns.LDNS_RCODE_NOERROR and pkt.answer().rr_count() == 0
+
+  @staticmethod
+  def ttl(pkt):
+    '''
+    Returns how long (in seconds) can be given answer cached, or None, if it
+    should not be cached at all.
+
+    @param pkt: Answer.
+    @type pkt: U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    '''
+    if ResponseCache.__is_negative(pkt):
+      for rr in pkt.authority().rrs():
+        if rr.get_type() == ldns.LDNS_RR_TYPE_SOA: #negative TTL
+          return min(rr.ttl(), int(str(rr.rdf(6))))
+      return None
+
+    if pkt.get_rcode() != ldns.LDNS_RCODE_NOERROR:
+      return None
+
+    ttl = None
+    for section in (pkt.answer(), pkt.authority()):
+      for rr in section.rrs():
+        if ttl is None or rr.ttl() < ttl:
+          ttl = rr.ttl()
+    return ttl
+
+  def get(self, key):
+    '''
+    Returns a copy of cached answer for given key or None, if there is no such
+    entry or it has already expired.
+
+    @param key: Key returned by L{key()}.
+    '''
+    entry = self.__entries.pop(key, None)
+
+    if entry is None:
+      self.stat.inc('miss')
+      return None
+
+    (expires, pkt) = entry
+    if expires <= time.time():
+      self.stat.inc('expired')
+      self.stat.inc('miss')
+      return None
+
+    self.__entries[key] = entry #most recently used now
+
+    if self.__is_negative(pkt):
+      self.stat.inc('negative')
+    self.stat.inc('hit')
+
+    return pkt.clone() #callers may change the packet, so give them a copy
+
+  def store(self, key, pkt):
+    '''
+    Stores given answer, if it can be cached.
+
+    @param key: Key returned by L{key()}.
+    @param pkt: Answer or None.
+    @type pkt: U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    '''
+    if pkt is None:
+      return
+
+    ttl = self.ttl(pkt)
+    if not ttl: #not cacheable or zero TTL
+      return
+
+    self.__entries.pop(key, None)
+    self.__entries[key] = (time.time() + ttl, pkt.clone())
+    self.stat.inc('store')
+
+    while len(self.__entries) > self.size: #remove the least recently used
+      self.__entries.popitem(False)
+      self.stat.inc('evict')
+
+  def log_stats(self):
+    '''
+    Writes out cache usage statistics using L{logging} module with info
+    severity. Nothing is written, when the cache was not used at all.
+    '''
+    if self.stat.get('hit') + self.stat.get('miss') == 0:
+      return
+
+    logging.info(self.stat.title + ' - ' + str(self.stat.get('hit')) + ' hits (' +
+                 str(self.stat.get('negative')) + ' negative), ' + str(self.stat.get('miss')) +
+                 ' misses (' + str(self.stat.get('expired')) + ' expired), ' +
+                 str(self.stat.get('store')) + ' answers stored, ' + str(self.stat.get('evict')) +
+                 ' evicted.')
@@ -10,14 +10,29 @@ Contains verifying functions, which are using PyLDNS library.
 I{Bachelor thesis - Automatic tracking of DNSSEC configuration on DNS servers} 
 '''
 
+import os
 import time
+import struct
+import calendar
+import binascii
 import ldns
+import bisect
+import socket
 import logging
 from copy import deepcopy
+from collections import Counter, OrderedDict
 import ConfigParser
 
 from Exceptions import AXFRError, FileError, LoadingDone, ResolverError
 from Statistics import Statistics
+from TrustCache import TrustCache
+import DNSWire
+from AsyncResolver import AsyncResolver, ServerHealth
+from ResponseCache import ResponseCache
+from Metrics import TransportMetrics
+from NSECChain import NSECChain, NSEC3Chain, NSEC3Hasher
+from ZoneCuts import ZoneCuts
+from AXFRClient import AXFRReader, IXFRReader, TSIG
 
 class Alg:
   '''
@@ -46,6 +61,11 @@ class TimeVerify(object):
   compare and verify provided time. It can handle both formats of time as
   specified in
   U{RFC 4034, section 3.2<http://tools.ietf.org/html/rfc4034#section-3.2>}.
+  
+  Times are integer seconds since the epoch (UTC). Signature Inception and
+  Expiration fields are taken as 32 bit numbers from rdata and placed in time
+  using serial number arithmetic (see
+  U{RFC 4034, section 3.1.5<http://tools.ietf.org/html/rfc4034#section-3.1.5>}).
   '''
   RRSIG_VALID = 1
   '''RRSIG time validity identificator - RRSIG is time-valid, used by L{is_valid()} method.'''
@@ -90,11 +110,12 @@ class TimeVerify(object):
     @param t_inception: C{Signature Inception} field value.
     @param t_expiration: C{Signature Expiration} field value.
     '''
-    ti = self.normalize_time(t_inception)
+    now = self.now()
+    ti = self.normalize_time(t_inception, now)
     
-    if self.__get_time() >= ti and self.__get_time() <= self.normalize_time(t_expiration):
+    if now >= ti and now <= self.normalize_time(t_expiration, now):
       return self.RRSIG_VALID
-    elif self.__get_time() < ti:
+    elif now < ti:
       return self.RRSIG_FUTURE
     else:
       return self.RRSIG_INVALID
@@ -105,15 +126,15 @@ class TimeVerify(object):
     expiration time. If the value is lower than a zero, 0 is returned.
     @param t_expiration: C{Signature Expiration} field value. 
     '''
-    te = self.normalize_time(t_expiration)
-    tdiff = te - self.__get_time()
+    now = self.now()
+    tdiff = self.normalize_time(t_expiration, now) - now
     
     if tdiff < 0:
       return 0
     else:
       return int(tdiff)
   
-  def __get_time(self):
+  def now(self):
     '''
     Gets current time according to how was the object initialized.
     '''
@@ -123,29 +144,84 @@ class TimeVerify(object):
       return time.time() #get current time
   
   @staticmethod
-  def normalize_time(t_denorm):
+  def epoch(t_denorm):
     '''
-    Takes as parameter time in two possible formats (see 
-    U{RFC 4034, section 3.2<http://tools.ietf.org/html/rfc4034#section-3.2>})
-    and makes from it a time as a floating point number expressed in seconds
-    since the epoch.
+    Returns C{Signature Inception} or C{Signature Expiration} field value as
+    unsigned 32 bit number of seconds since the epoch, which wraps around (see
+    L{normalize_time()}). The number is taken from rdata of
+    U{ldns_rdf<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rdf.html>}
+    object, other values are converted from format C{YYYYMMDDHHmmSS} (UTC)
+    or from a decimal number.
     
     May raise L{ValueError} exception if time not in correct format.
     
     @param t_denorm: Input time value.
     '''
+    if hasattr(t_denorm, 'data_as_bytearray'): #raw field from rdata
+      data = t_denorm.data_as_bytearray()
+      if len(data) == 4:
+        return struct.unpack("!I", str(data))[0]
+    
     strt = str(t_denorm)
-    if len(strt) == 14: #in format YYYYMMDDHHmmSS
-      return time.mktime(time.strptime(strt, '%Y%m%d%H%M%S'))
+    if len(strt) == 14 and strt.isdigit(): #in format YYYYMMDDHHmmSS
+      return calendar.timegm((int(strt[0:4]), int(strt[4:6]), int(strt[6:8]), int(strt[8:10]),
+                              int(strt[10:12]), int(strt[12:14]))) & 0xFFFFFFFF
     else: #should be already in needed format
-      return float(strt)
+      return int(strt) & 0xFFFFFFFF
+  
+  @staticmethod
+  def normalize_time(t_denorm, now = None):
+    '''
+    Takes as parameter time in two possible formats (see 
+    U{RFC 4034, section 3.2<http://tools.ietf.org/html/rfc4034#section-3.2>})
+    and makes from it a time as an integer number expressed in seconds since
+    the epoch. The 32 bit value (see L{epoch()}) is taken as the time closest
+    to L{now}, which is in range of 68 years.
+    
+    May raise L{ValueError} exception if time not in correct format.
+    
+    @param t_denorm: Input time value.
+    @param now: Time (in seconds since the epoch), to which is the value
+    related, current time when None.
+    '''
+    if now is None:
+      now = time.time()
+    now = int(now)
+    
+    diff = (TimeVerify.epoch(t_denorm) - now) & 0xFFFFFFFF
+    if diff >= 0x80000000: #in the past
+      diff -= 0x100000000
+    return now + diff
     
 class SafeResolver(object):
   '''
   Wrapper of U{ldns.ldns_resolver<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__resolver.html>}
-  providing safe cycling of name servers.
+  providing safe cycling of name servers. The ldns resolver is used for zone
+  transfers, other queries are sent using L{AsyncResolver} with the same name
+  servers.
+  
+  Name servers are tried in order given by L{ServerHealth} object, which lives
+  as long as this object, so name servers found slow or failing while checking
+  one zone are avoided also for the next zones.
+  
+  Answers to queries are kept in L{ResponseCache} shared by all zones too.
+  
+  In offline mode (see L{use_answer_store()}) queries are answered from
+  L{AnswerStore} and nothing is sent to name servers.
   '''
   
+  port = 53
+  '''Port of name servers, when not set by C{<ip>#<port>} address.'''
+  
+  timeout = 3.0
+  '''How long (in seconds) should L{AsyncResolver} wait for an answer.'''
+  
+  hedge = 0.5
+  '''After how many seconds without answer is a query sent also to next name server.'''
+  
+  axfr_timeout = 10.0
+  '''How long (in seconds) to wait for connection or data during zone transfer.'''
+  
   def __init__(self, res):
     '''
     Initialization of the object.
@@ -163,17 +239,43 @@ class SafeResolver(object):
     self.__res.set_fail(False) #continue with next nameserver in case of fail
     self.__res.set_recursive(False) 
     
+    self.__async = None
+    '''L{AsyncResolver} instance, created by L{set_resolver()}.'''
+    
+    self.health = ServerHealth()
+    '''L{ServerHealth} object shared by all zones.'''
+    
+    self.metrics = TransportMetrics()
+    '''L{TransportMetrics} of queries and zone transfers of all zones.'''
+    
+    self.cache = ResponseCache()
+    '''L{ResponseCache} with answers to queries sent by L{query()} and L{query_many()}.'''
+    
+    self.store = None
+    '''L{AnswerStore} used in offline mode or for recording answers, None if not used.'''
+    
+    self.offline = False
+    '''Are queries answered from L{store} instead of name servers?'''
+    
   def __res_addr_add(self, ip):
     '''
     Adds an IP address to a list of addresses to be used by resolver. Prints
     an error using L{logging} module with critical severity, when the provided
     IP address cannot be resolved.
-    @param ip: New IP address.
+    @param ip: New IP address, optionally followed by C{#<port>}.
     @type ip: String
     '''
     try: #catch error if IP invalid or other error
-      tmp = ldns.ldns_rdf.new_frm_str(ip, ldns.LDNS_RDF_TYPE_A)
+      if ip.find('#') != -1: #custom port
+        (addr, port) = ip.split('#', 1)
+        port = int(port)
+        if port <= 0 or port > 0xFFFF:
+          raise ValueError("Invalid port.")
+      else:
+        (addr, port) = (ip, self.port)
+      tmp = ldns.ldns_rdf.new_frm_str(addr, ldns.LDNS_RDF_TYPE_A)
       self.__res_ips.append(tmp)
+      self.__res_ports[str(tmp)] = port
     except Exception:
       logging.critical("IP address "+ip+" can't be resolved.") 
     
@@ -182,7 +284,8 @@ class SafeResolver(object):
     Sets a new addresses and TSIG parameters for resolver.
     May raise L{ResolverError} when no valid IP address provided.
     
-    @param ip_str: List or tuple of IP addresses.
+    @param ip_str: List or tuple of IP addresses, each can be followed by
+    C{#<port>} (one port per address).
     @type ip_str: [String, ...]
     @param keyname: Name part of TSIG
     @type keyname: String
@@ -198,6 +301,8 @@ class SafeResolver(object):
     List of IP addresses for U{ldns.ldns_resolver<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__resolver.html>}
     instance.
     '''
+    self.__res_ports = {}
+    '''Ports of name servers, I{key} is IP address string.'''
     
     while self.__res.pop_nameserver(): #pop all existing name servers
       pass
@@ -207,8 +312,16 @@ class SafeResolver(object):
       
     if len(self.__res_ips) <= 0: #none of given addresses valid or none given
       raise ResolverError("No valid IP address for resolver available.")
+    
+    #fastest healthy name servers first
+    order = self.health.order([str(ip) for ip in self.__res_ips])
+    self.__res_ips.sort(key = lambda ip: order.index(str(ip)))
       
+    self.tsig = None
+    '''TSIG key for zone transfers as a tuple C{(<name>, <algorithm>, <data>)} or None.'''
+    
     if keyname != None and keydata != None and keyalg != None: #all specified, set TSIG
+      self.tsig = (keyname, keyalg, keydata)
       ldns.ldns_resolver_set_tsig_keyname(self.__res, keyname)
       ldns.ldns_resolver_set_tsig_keydata(self.__res, keydata)
       ldns.ldns_resolver_set_tsig_algorithm(self.__res, keyalg.lower())
@@ -223,6 +336,17 @@ class SafeResolver(object):
     instance.
     '''
     self.__res.push_nameserver(self.__res_ips[0])
+    self.__res.set_port(self.__res_ports[str(self.__res_ips[0])])
+    
+    servers = [str(ip) for ip in self.__res_ips]
+    #for the same name servers keep the old one with open TCP connections
+    if self.__async is None or sorted(self.__async.servers) != sorted(servers) or \
+       self.__async.ports != self.__res_ports:
+      if self.__async is not None:
+        self.__async.close()
+      self.__async = AsyncResolver(servers, self.port, self.timeout, self.hedge,
+                                   self.health, self.__res_ports, self.metrics)
+      '''L{AsyncResolver} using the same name servers as L{__res}.'''
     
     return self.__res
       
@@ -236,8 +360,11 @@ class SafeResolver(object):
     '''
     Returns
     U{ldns.ldns_resolver<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__resolver.html>}
-    instance with next name server IP from L{__res_ips} list active.
+    instance with next name server IP from L{__res_ips} list active. Current
+    name server is expected to have failed, so it is put aside for some time.
     '''
+    self.health.failure(str(self.__res_ips[self.__res_active]))
+    
     #next position
     self.__res_active = (self.__res_active + 1) % len(self.__res_ips)    
     
@@ -245,6 +372,7 @@ class SafeResolver(object):
       pass
     
     self.__res.push_nameserver(self.__res_ips[self.__res_active]) #push new
+    self.__res.set_port(self.__res_ports[str(self.__res_ips[self.__res_active])])
     return self.__res 
   
   def count(self):
@@ -252,7 +380,133 @@ class SafeResolver(object):
     Returns a number of name servers in the L{__res_ips} list.
     '''
     return len(self.__res_ips)
+  
+  def axfr_servers(self):
+    '''
+    Returns a list of tuples C{(<IP address>, <port>)} of name servers, that
+    should be tried for zone transfer, in order of preference.
+    '''
+    servers = self.health.order([str(ip) for ip in self.__res_ips])
+    return [(ip, self.__res_ports[ip]) for ip in servers]
+
+  def close(self):
+    '''
+    Closes connections to name servers kept by L{AsyncResolver}.
+    '''
+    if self.__async is not None:
+      self.__async.close()
+    
+  def async_resolver(self):
+    '''
+    Returns L{AsyncResolver} instance, which sends queries to currently set
+    name servers. It can be used to have more queries in flight at once.
+    '''
+    return self.__async
+  
+  def __backend(self):
+    '''
+    Returns L{AsyncResolver} instance for L{query()} and L{query_many()}.
+    Raises L{ResolverError}, when name servers were not set yet (see
+    L{set_resolver()}).
+    '''
+    if self.__async is None:
+      raise ResolverError("No name servers set for resolver, can't send a query.")
+    return self.__async
+  
+  def use_answer_store(self, store, offline):
+    '''
+    Sets L{AnswerStore} to be used by L{query()} and L{query_many()}.
     
+    @param store: Answer store.
+    @type store: L{AnswerStore}
+    @param offline: If True, queries are answered from the store only.
+    Otherwise queries are sent to name servers and their answers are recorded
+    to the store.
+    '''
+    self.store = store
+    self.offline = offline
+  
+  def query(self, name, rr_type, rr_class = ldns.LDNS_RR_CLASS_IN, flags = ldns.LDNS_RD):
+    '''
+    Sends a query using L{AsyncResolver}. When no answer received in time from
+    the first name server, tries also other ones. Answer from L{cache} is used,
+    when there is any. In offline mode the answer is made by L{store}.
+    
+    May raise L{ResolverError} when name servers were not set yet.
+    
+    @param name: Queried domain name.
+    @param rr_type: Queried type.
+    @param rr_class: Queried class.
+    @param flags: Query flags, only C{LDNS_RD} is used.
+    @return: U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    instance or None, if no name server answered.
+    '''
+    if self.offline:
+      return self.store.answer(name, rr_type, rr_class)
+    
+    backend = self.__backend()
+    rd = flags & ldns.LDNS_RD != 0
+    key = ResponseCache.key(name, rr_type, rr_class, rd, backend.servers)
+    
+    pkt = self.cache.get(key)
+    if pkt is None:
+      pkt = backend.query(name, rr_type, rr_class, rd)
+      self.cache.store(key, pkt)
+      if self.store:
+        self.store.record(pkt)
+    return pkt
+  
+  def query_many(self, queries):
+    '''
+    Sends all given queries at once using L{AsyncResolver} and waits for their
+    answers. Queries with an answer in L{cache} are not sent. In offline mode
+    the answers are made by L{store}.
+    
+    May raise L{ResolverError} when name servers were not set yet.
+    
+    @param queries: List of tuples C{(<name>, <type>)}.
+    @return: Dictionary, I{key} is a tuple from L{queries}, value is
+    U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    instance or None, if no name server answered.
+    '''
+    answers = {}
+    missing = []
+    
+    if self.offline:
+      for q in queries:
+        answers[q] = self.store.answer(q[0], q[1])
+      return answers
+    
+    backend = self.__backend()
+    for q in queries:
+      if answers.has_key(q) or q in missing:
+        continue
+      pkt = self.cache.get(ResponseCache.key(q[0], q[1], ldns.LDNS_RR_CLASS_IN, True,
+                                             backend.servers))
+      if pkt is None:
+        missing.append(q)
+      else:
+        answers[q] = pkt
+    
+    if missing:
+      fetched = backend.query_many(missing, ldns.LDNS_RR_CLASS_IN)
+      for q in missing:
+        self.cache.store(ResponseCache.key(q[0], q[1], ldns.LDNS_RR_CLASS_IN, True,
+                                           backend.servers), fetched[q])
+        if self.store:
+          self.store.record(fetched[q])
+        answers[q] = fetched[q]
+    
+    return answers
+  
+  def log_stats(self):
+    '''
+    Writes out statistics of answers cache and answer store using L{logging}
+    module with info severity.
+    '''
+    self.cache.log_stats()
+    if self.store:
+      self.store.log_stats()
     
 class RRCollection(object):
   '''
@@ -313,6 +567,9 @@ class RRCollection(object):
     Types from L{ns_exclude_list} are excluded.
     '''
     
+    self.__types = 0
+    '''Bitset of types of regular RRs in L{__rrs} (see L{DNSWire.type_bitmap()}).'''
+    
   def __custom_list_print(self, l):
     '''
     Returns a string of a list items in custom format. Used by L{__str__}
@@ -363,6 +620,78 @@ class RRCollection(object):
     '''
     return self.__nsec_type
   
+  def get_nsec_next(self):
+    '''
+    Returns next owner name from NSEC record as a string or None, if there is
+    no NSEC record (NSEC3 records are not chained by owner names).
+    '''
+    if self.__nsec_type != self.NSEC or not self.__nsec:
+      return None
+    return str(self.__nsec.rdf(0))
+  
+  def get_nsec3_next(self):
+    '''
+    Returns a tuple C{(<next hashed owner name>, <opt-out flag>)} from NSEC3
+    record or None, if there is no NSEC3 record.
+    '''
+    if not self.__nsec or self.__nsec.get_type() != ldns.LDNS_RR_TYPE_NSEC3:
+      return None
+    return (str(self.__nsec.rdf(4)), int(str(self.__nsec.rdf(1))) & 1 == 1)
+  
+  def get_types(self):
+    '''
+    Returns bitset of types of regular records (RRSIGs excluded), see
+    L{DNSWire.type_bitmap()}.
+    '''
+    return self.__types
+  
+  def get_type_bitmap(self):
+    '''
+    Returns bitset of types from type bitmap field of NSEC or NSEC3 record
+    decoded from wire format (see L{DNSWire.type_bitmap()}) or None, if there
+    is no NSEC type record or its field is malformed. PyLDNS without
+    C{ldns_rdf.data_as_bytearray()} gives only text form of the field, types
+    are read from it then.
+    '''
+    if not self.__nsec:
+      return None
+    
+    if self.__nsec.get_type() == ldns.LDNS_RR_TYPE_NSEC3:
+      field = self.__nsec.rdf(5)
+    else:
+      field = self.__nsec.rdf(1)
+    if field is None: #empty Type Bitmap field (empty non-terminal)
+      return 0
+    
+    try:
+      if hasattr(field, 'data_as_bytearray'):
+        return DNSWire.type_bitmap(str(field.data_as_bytearray()))
+      
+      bits = 0
+      for name in str(ldns.ldns_nsec_get_bitmap(self.__nsec)).upper().split():
+        rr_type = ldns.ldns_get_rr_type_by_name(name)
+        if not rr_type:
+          raise ValueError("unknown type " + name)
+        bits |= DNSWire.type_bit(rr_type)
+      return bits
+    except ValueError, detail:
+      logging.error(self.owner() + " NSEC type record has malformed type bitmap (" + str(detail) + ").")
+      return None
+  
+  def get_nsec3_params(self):
+    '''
+    Returns a tuple C{(<hash algorithm>, <iterations>, <salt>)} from
+    NSEC3PARAM record, where salt is in binary form, or None, if there is no
+    NSEC3PARAM record.
+    '''
+    for rr in self.rrs():
+      if rr.get_type() == ldns.LDNS_RR_TYPE_NSEC3PARAMS:
+        salt = str(rr.rdf(3))
+        if salt == '-': #no salt
+          salt = ''
+        return (int(str(rr.rdf(0))), int(str(rr.rdf(2))), binascii.unhexlify(salt))
+    return None
+  
   def get_algs(self):
     '''
     Returns list integer identificators of algorithm numbers used by RRSIGs in
@@ -466,6 +795,7 @@ class RRCollection(object):
     else: #other record, regular RR which should be signed
       if not rr_type in self.ns_exclude_list: #exclude NS and other records present every time
         self.__has_ns_only = False
+      self.__types |= DNSWire.type_bit(rr_type)
         
       rr_type = rr.get_type_str().upper() #get a string representation
       
@@ -492,6 +822,7 @@ class RRCollection(object):
     Using this this method to verify time validity and signatures together
     should make check faster and find more errors, that using this method just
     for signature check and L{verify_rrsigs_times()} for time validity check.
+    See L{verify_rrsigs()} for running it together with other checks.
     
     @param trust: List of trusted keys.
     @type trust: U{ldns_rr_list<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr__list.html>}
@@ -502,53 +833,7 @@ class RRCollection(object):
     @param tv: Object to be used in time-verifying operations.
     @type tv: L{TimeVerify}
     '''
-    cnt = { 'count': 0, 'invalid': 0, 'tags': [], 'typecnt': 0} #counter
-    
-    for rrtype in self.__rrs.keys(): #iterate through types
-      rrlist = ldns.ldns_rr_list() #prepare RR for verification function
-      
-      for rr in self.__rrs[rrtype]: #iterate through records of that type        
-        #add it to the list
-        rrlist.push_rr(rr)
-        cnt['typecnt'] += 1
-        
-      try: #signature may not be present, give it a try
-        for rrsig in self.__rrsigs[rrtype]: #iterate through its signatures          
-          #check signers name
-          s_name = str(rrsig.rrsig_signame())
-          if s_name != domain:
-            logging.error('Signatures check - ' + self.owner() + ' ' + rrtype +\
-                          ' - RRSIGs Signers Name does not match domain (' + s_name +
-                          ' != ' + domain + ').')
-          
-          cnt['count'] += 1
-          
-          status = ldns.ldns_verify_rrsig_keylist_notime_status_only(rrlist, rrsig, trust)
-          if time_check and tv.is_valid(rrsig.rrsig_inception(), rrsig.rrsig_expiration()) != \
-          tv.RRSIG_VALID: #check time too
-            status = ldns.LDNS_STATUS_INVALID_TIME
-          
-          if status != ldns.LDNS_STATUS_OK:
-            cnt['invalid'] += 1 #signature does not verify this record, other however still could
-          else:
-            cnt['tags'].append(rrsig.rrsig_keytag())
-            
-      except KeyError:
-        pass #this will be catched in next if
-      
-      if cnt['count'] == 0: #no signatures for this RR
-        logging.info('Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + str(cnt['typecnt']) + ' RRs' + ' not secured.')
-      elif cnt['invalid'] == cnt['count']: #all signatures for this RR type are invalid
-        logging.error('Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + str(cnt['typecnt']) + ' RRs' + ', ' +\
-        str(cnt['count']) + ' RRSIGs, 0 valid.')
-      elif cnt['invalid'] == 0: #all signatures for this RR type are valid 
-        logging.info('Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + str(cnt['typecnt']) + ' RRs' + ', ' +\
-        str(cnt['count']) + ' RRSIGs, all valid.')
-      else: #some signatures for this RR type are valid 
-        logging.info('Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + str(cnt['typecnt']) + ' RRs' + ', ' +\
-        str(cnt['count']) + ' RRSIGs, ' + str(cnt['count'] - cnt['invalid']) + ' valid (keytags: ' + self.__custom_list_print(cnt['tags']) + ').')
-        
-      cnt = { 'count': 0, 'invalid': 0, 'tags': [], 'typecnt': 0} #counter
+    self.verify_rrsigs(tv, trust = trust, domain = domain, time_check = time_check)
         
   def verify_rrsigs_times(self, tv):
     '''
@@ -562,42 +847,7 @@ class RRCollection(object):
     @param tv: Object to be used in time-verifying operations.
     @type tv: L{TimeVerify}
     '''
-    total = { 'count': 0, 'invalid': 0, 'valid': 0, 'future': 0 }
-    
-    for i in self.__rrsigs.keys(): #iterate through types
-      type = { 'count': 0, 'invalid': 0, 'valid': 0, 'future': 0 }
-      
-      for j in self.__rrsigs[i]: #iterate through signatures
-        val = tv.is_valid(j.rrsig_inception(), j.rrsig_expiration())
-        total['count'] += 1
-        type['count'] += 1
-        
-        if val == tv.RRSIG_VALID:
-          total['valid'] += 1
-          type['valid'] += 1
-        elif val == tv.RRSIG_INVALID:
-          total['invalid'] += 1
-          type['invalid'] += 1
-        else:
-          total['future'] += 1
-          type['future'] += 1
-      
-      if type['valid'] == 0: #none of the signatures is valid for current type
-        logging.error('Signatures time check - ' + self.owner() + " " + i +\
-        ' - 0 valid, ' + str(type['count']) + " total, " + str(type['invalid']) +
-        ' old, ' + str(type['future']) + ' future.')
-      else: #some of them are time-valid
-        logging.info('Signatures time check - ' + self.owner() + " " + i + ' - ' + \
-        str(type['count']) + " total, " + str(type['valid']) + ' valid, ' +
-        str(type['invalid']) + ' old, ' + str(type['future']) + ' future.')
-    
-    #statistics
-    if total['count'] == 0: #no signatures checked
-      logging.debug('Signatures time check - ' + self.owner() + ' no signatures.')
-    elif total['count'] != type['count']: #needed only if multiple records per type
-      logging.info('Signatures time check - ' + self.owner() + ' ' + \
-      str(total['count']) + " total, " + str(total['valid']) + ' valid, ' +
-      str(total['invalid']) + ' old, ' + str(total['future']) + ' future.')
+    self.verify_rrsigs(tv, times = True)
     
   def verify_rrsigs_remaining(self, tv, tmin):
     '''
@@ -610,18 +860,7 @@ class RRCollection(object):
     @param tmin: Minimum remaining validity time, that is acceptable.
     @type tmin: int [seconds] 
     '''    
-    for i in self.__rrsigs.keys(): #iterate through types
-      tlmax = 0 #initial value
-      
-      for j in self.__rrsigs[i]: #iterate through signatures and max. validity time from set of signatures
-        tl = tv.time_left(j.rrsig_expiration())
-        if tl > tlmax:
-          tlmax = tl
-      
-      if tlmax < tmin:
-        logging.warning(self.owner() + " " + j.get_type_str() + \
-        " Remaining validity time of RRSIG is too low (" + str(tlmax) + " < " +
-        str(tmin) + ").")
+    self.verify_rrsigs(tv, tmin = tmin)
     
   def verify_rrsigs_ttl(self):
     '''
@@ -632,31 +871,7 @@ class RRCollection(object):
     problems found. Also writes error when some RRSIG record does not have
     any record to cover.
     '''    
-    for rr_type in self.__rrsigs.keys(): #iterate through types
-      for rrsig in self.__rrsigs[rr_type]: #iterate through records of that type
-        #verify total signature validity time
-        if int(str(rrsig.ttl())) > TimeVerify.normalize_time(rrsig.rrsig_expiration()) - \
-        TimeVerify.normalize_time(rrsig.rrsig_inception()):
-          logging.warning(self.owner() + " " + rr_type + " - TTL of the RRSIG record should be lower, than the total validity time.")
-          
-        #rr does not have to be present
-        try:
-          #verify RRSIG TTL
-          cnt_valid_ttl = 0 #count valid TTLs, at least one required
-          cnt_valid_orig_ttl = 0 #count valid Original TTLs, at least one required
-          
-          for rr in self.__rrs[rr_type]:
-            if rr.ttl() == rrsig.ttl():
-              cnt_valid_ttl += 1
-            if rr.ttl() == int(str(rrsig.rrsig_origttl())):
-              cnt_valid_orig_ttl += 1
-          
-          if cnt_valid_ttl == 0:
-            logging.warning(self.owner() + " " + rr_type + " - TTL of RRSIG does not match TTL of RR it covers.")
-          if cnt_valid_orig_ttl == 0:
-            logging.warning(self.owner() + " " + rr_type + " - Original TTL of RRSIG does not match TTL of RR it covers.")
-        except KeyError:
-          pass
+    self.verify_rrsigs(ttl = True)
         
   def verify_rrsigs_algorithms(self, alg_list):
     '''
@@ -669,16 +884,106 @@ class RRCollection(object):
     @param alg_list: List of int values representing signing algorithms.
     @note: Uses L{Alg} class for internal operations.
     '''
-    if len(self.__rrsigs.keys()) > 0: #if signed      
-      for rr_type in self.__rrsigs.keys(): #iterate through types
+    self.verify_rrsigs(alg_list = alg_list)
+    
+  def verify_rrsigs(self, tv = None, times = False, trust = None, domain = None, time_check = False,
+                    alg_list = None, tmin = None, ttl = False, forecast = None, held = None):
+    '''
+    Runs all enabled RRSIG checks in one pass. Each RRSIG is visited once and
+    its fields are read from
+    U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    object once, then they are fed to the checks:
+    
+      - times (see L{verify_rrsigs_times()}), when L{times} is True,
+      - signatures (see L{verify_signatures()}), when L{trust} is given,
+      - algorithms (see L{verify_rrsigs_algorithms()}), when L{alg_list} is
+        given,
+      - remaining validity time (see L{verify_rrsigs_remaining()}), when
+        L{tmin} is given,
+      - TTLs (see L{verify_rrsigs_ttl()}), when L{ttl} is True.
+    
+    The latest expiration time of RRSIGs of each type is added to L{forecast},
+    when it is given (see L{Forecast.ExpirationForecast.add()}).
+    
+    Results are written out using L{logging} module check after check in this
+    order, with the same messages as of the single checks.
+    
+    @param tv: Object to be used in time-verifying operations, needed for
+    times, time check of signatures and remaining validity time.
+    @type tv: L{TimeVerify}
+    @param held: List, to which messages of remaining validity time and TTL
+    checks are appended as tuples C{(<logging function>, <message>)} instead
+    of writing them out, or None.
+    '''
+    if tv is not None:
+      now = tv.now()
+    else:
+      now = time.time()
+    
+    out = { 'times': [], 'signatures': [], 'algorithms': [], 'remaining': [], 'ttl': [] }
+    '''Messages of each check, tuples C{(<logging function>, <message>)}.'''
+    total = { 'count': 0, 'invalid': 0, 'valid': 0, 'future': 0 }
+    signed = {} #signature check counters of covered types
+    
+    for rr_type in self.__rrsigs.keys(): #iterate through types
+      rrs = self.__rrs.get(rr_type)
+      type = { 'count': 0, 'invalid': 0, 'valid': 0, 'future': 0 }
+      tlmax = 0
+      texp = None
+      
+      if trust is not None and rrs is not None:
+        rrlist = ldns.ldns_rr_list() #prepare RR for verification function
+        for rr in rrs:
+          rrlist.push_rr(rr)
+        cnt = signed[rr_type] = { 'count': 0, 'invalid': 0, 'tags': [], 'names': [] }
+        
+      if alg_list is not None:
         l = deepcopy(alg_list) #make a deep copy of the list, original needed later
         checked = [] #list of already checked types
         dnskey_seen = False #some DNSKEY RRSIG present?
+      
+      for rrsig in self.__rrsigs[rr_type]: #iterate through signatures, fields read once
+        if times or time_check or tmin is not None or ttl or forecast is not None:
+          inception = TimeVerify.normalize_time(rrsig.rrsig_inception(), now)
+          expiration = TimeVerify.normalize_time(rrsig.rrsig_expiration(), now)
+          if now < inception:
+            val = TimeVerify.RRSIG_FUTURE
+          elif now <= expiration:
+            val = TimeVerify.RRSIG_VALID
+          else:
+            val = TimeVerify.RRSIG_INVALID
+        
+        if times:
+          type['count'] += 1
+          if val == TimeVerify.RRSIG_VALID:
+            type['valid'] += 1
+          elif val == TimeVerify.RRSIG_INVALID:
+            type['invalid'] += 1
+          else:
+            type['future'] += 1
+        
+        if trust is not None and rrs is not None:
+          #check signers name
+          s_name = str(rrsig.rrsig_signame())
+          if s_name != domain:
+            cnt['names'].append('Signatures check - ' + self.owner() + ' ' + rr_type +
+                                ' - RRSIGs Signers Name does not match domain (' + s_name +
+                                ' != ' + domain + ').')
+          
+          cnt['count'] += 1
+          
+          status = ldns.ldns_verify_rrsig_keylist_notime_status_only(rrlist, rrsig, trust)
+          if time_check and val != TimeVerify.RRSIG_VALID: #check time too
+            status = ldns.LDNS_STATUS_INVALID_TIME
+          
+          if status != ldns.LDNS_STATUS_OK:
+            cnt['invalid'] += 1 #signature does not verify this record, other however still could
+          else:
+            cnt['tags'].append(DNSWire.rdf_to_int(rrsig.rrsig_keytag()))
         
-        for rrsig in self.__rrsigs[rr_type]: #iterate through rrsigs
+        if alg_list is not None:
+          a = DNSWire.rdf_to_int(rrsig.rrsig_algorithm())
           try: #might be present algorithm but not a DNSKEY with it
-            a = int(str(rrsig.rrsig_algorithm()))
-            
             #DNSKEY can be signed with ZSK (256) and KSK (257), other records only with ZSK
             if rr_type != "DNSKEY" and not Alg(a,256) in checked:
               l.remove(Alg(a,256))
@@ -694,44 +999,126 @@ class RRCollection(object):
               elif Alg(a,256) not in checked and Alg(a,257) not in checked: #none of them
                 raise ValueError("")
           except ValueError: #not present, couldn't be removed (but should be)
-            b = ldns.ldns_buffer(0)
-            ldns.ldns_algorithm2buffer_str(b,a)
-            logging.warning(self.owner() + " - " + str(b) + " algorithm not expected for creating RRSIG.")
-            
+            out['algorithms'].append((logging.warning, self.owner() + " - " + self.__alg_name(a) +
+                                      " algorithm not expected for creating RRSIG."))
+        
+        if tmin is not None:
+          tlmax = max(tlmax, int(expiration - now))
+        
+        if forecast is not None and (texp is None or expiration > texp):
+          texp = expiration
+        
+        if ttl:
+          rrsig_ttl = int(rrsig.ttl())
+          #verify total signature validity time
+          if rrsig_ttl > expiration - inception:
+            out['ttl'].append((logging.warning, self.owner() + " " + rr_type +
+                               " - TTL of the RRSIG record should be lower, than the total validity time."))
+          
+          if rrs is not None: #rr does not have to be present
+            orig_ttl = DNSWire.rdf_to_int(rrsig.rrsig_origttl())
+            if not [rr for rr in rrs if rr.ttl() == rrsig_ttl]: #at least one required
+              out['ttl'].append((logging.warning, self.owner() + " " + rr_type +
+                                 " - TTL of RRSIG does not match TTL of RR it covers."))
+            if not [rr for rr in rrs if rr.ttl() == orig_ttl]:
+              out['ttl'].append((logging.warning, self.owner() + " " + rr_type +
+                                 " - Original TTL of RRSIG does not match TTL of RR it covers."))
+      
+      if times:
+        for key in type.keys():
+          total[key] += type[key]
+        
+        if type['valid'] == 0: #none of the signatures is valid for current type
+          out['times'].append((logging.error, 'Signatures time check - ' + self.owner() + " " + rr_type +\
+          ' - 0 valid, ' + str(type['count']) + " total, " + str(type['invalid']) +
+          ' old, ' + str(type['future']) + ' future.'))
+        else: #some of them are time-valid
+          out['times'].append((logging.info, 'Signatures time check - ' + self.owner() + " " + rr_type +\
+          ' - ' + str(type['count']) + " total, " + str(type['valid']) + ' valid, ' +
+          str(type['invalid']) + ' old, ' + str(type['future']) + ' future.'))
+      
+      if alg_list is not None:
         #go through the rest of algorithms (there should not be any, Except ZSK)
         for alg in l:
           if alg.flag != 257 or dnskey_seen:
-            b = ldns.ldns_buffer(0)
-            ldns.ldns_algorithm2buffer_str(b,alg.alg)
-            logging.warning(self.owner() + " - " + str(b) + " algorithm not used for creating RRSIG.")
+            out['algorithms'].append((logging.warning, self.owner() + " - " + self.__alg_name(alg.alg) +
+                                      " algorithm not used for creating RRSIG."))
+      
+      if tmin is not None and tlmax < tmin:
+        out['remaining'].append((logging.warning, self.owner() + " RRSIG Remaining validity time of RRSIG is too low (" +
+                                 str(tlmax) + " < " + str(tmin) + ")."))
+      
+      if texp is not None:
+        forecast.add(self.owner(), rr_type, texp)
+    
+    if times: #statistics
+      if total['count'] == 0: #no signatures checked
+        out['times'].append((logging.debug, 'Signatures time check - ' + self.owner() + ' no signatures.'))
+      elif len(self.__rrsigs) > 1: #needed only if multiple records per type
+        out['times'].append((logging.info, 'Signatures time check - ' + self.owner() + ' ' + \
+        str(total['count']) + " total, " + str(total['valid']) + ' valid, ' +
+        str(total['invalid']) + ' old, ' + str(total['future']) + ' future.'))
+    
+    if trust is not None:
+      for rrtype in self.__rrs.keys(): #iterate through types
+        typecnt = str(len(self.__rrs[rrtype]))
+        cnt = signed.get(rrtype, { 'count': 0, 'invalid': 0, 'tags': [], 'names': [] })
+        for message in cnt['names']: #Signers Name errors first, as they were found
+          out['signatures'].append((logging.error, message))
         
-  def verify_nsec_presence(self, ns_list):
+        if cnt['count'] == 0: #no signatures for this RR
+          out['signatures'].append((logging.info, 'Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + typecnt + ' RRs' + ' not secured.'))
+        elif cnt['invalid'] == cnt['count']: #all signatures for this RR type are invalid
+          out['signatures'].append((logging.error, 'Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + typecnt + ' RRs' + ', ' +\
+          str(cnt['count']) + ' RRSIGs, 0 valid.'))
+        elif cnt['invalid'] == 0: #all signatures for this RR type are valid 
+          out['signatures'].append((logging.info, 'Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + typecnt + ' RRs' + ', ' +\
+          str(cnt['count']) + ' RRSIGs, all valid.'))
+        else: #some signatures for this RR type are valid 
+          out['signatures'].append((logging.info, 'Signatures check - ' + self.owner() + ' ' + rrtype + ' - ' + typecnt + ' RRs' + ', ' +\
+          str(cnt['count']) + ' RRSIGs, ' + str(cnt['count'] - cnt['invalid']) + ' valid (keytags: ' + self.__custom_list_print(cnt['tags']) + ').'))
+    
+    for check in ('times', 'signatures', 'algorithms', 'remaining', 'ttl'):
+      if held is not None and check in ('remaining', 'ttl'): #written out by caller later
+        held.extend(out[check])
+        continue
+      for (log, message) in out[check]:
+        log(message)
+  
+  @staticmethod
+  def __alg_name(alg):
+    '''
+    Returns mnemonic of given algorithm number.
+    '''
+    b = ldns.ldns_buffer(0)
+    ldns.ldns_algorithm2buffer_str(b, alg)
+    return str(b)
+    
+  def verify_nsec_presence(self, glue):
     '''
-    Verifies that NSEC record is present. Requires list of already seen NS RR
-    domain names as a parameter, to distinguish glue records.
+    Verifies that NSEC record is present. Requires tracker of already seen NS
+    RR domain names as a parameter, to distinguish glue records.
     
     Prints error using L{logging} module, when there is no NSEC type record and
     there is some "non-glue" record.
     
-    @param ns_list: List of already seen NS RR domain names, in a String
-    representation.
+    @param glue: Tracker of NS RR domain names and potential glue records.
+    @type glue: L{GlueTracker}
     @note: If A / AAAA record does not have matching NS record pointing to it, it
     does not mean that it is not glue record, NS record may appear later, so
     we should also check it at the end with complete NS records list. For this
-    reason this method returns a list of "potential glue records".
-    @warning: Don't use this for checking NSEC3 type record presence, it does
-    not work reliably. See TODO for explanation.
-    @todo: Fix NSEC3 presence verification after next release of ldns library.
+    reason such records are remembered by L{GlueTracker} as "potential glue
+    records".
+    @warning: Don't use this for checking NSEC3 type record presence, owner
+    names are hashed in NSEC3 records. NSEC3 coverage is verified by
+    L{ZoneChecker.verify_nsec_chain()}.
     '''
-    #list of potential glue A / AAAA records, that need to be checked later
-    non_macthed = []
-    
     if self.__nsec:
       #nsec record present, nothing else to verify
-      return non_macthed
+      return
     elif self.has_ns_only():
       #only NS record, that does not require NSEC records as it is glue record
-      return non_macthed
+      return
     
     #So no NSEC record is not present. That is allowed for glue records only.
     #We should verify, that all present records are glue records then.
@@ -740,67 +1127,69 @@ class RRCollection(object):
       if (i.get_type() != ldns.LDNS_RR_TYPE_A and i.get_type() != ldns.LDNS_RR_TYPE_AAAA):
         #not A nor AAAA record, this can never be a glue record and thus needs NSEC
         logging.error(self.owner() + " NSEC type record not present.")
-        return non_macthed
-      
-      rr_owner = str(i.owner())
+        return
       
-      try:
-        #if could be removed, there was some NS record pointing to it
-        ns_list.remove(rr_owner)
-      except:
-        #no NS record was painting to it, however it could later, so this still
-        #might be A / AAAA glue record
-        non_macthed.append(rr_owner)
-        
-    return non_macthed      
+      #if no NS record was pointing to it, it could later, so this still might
+      #be A / AAAA glue record
+      glue.add_glue(str(i.owner()))
       
   def verify_nsec_bitmap(self):
     '''
     Verifies that NSEC record has in its Type Bitmap field present not only NSEC
     and RRSIG types, but also all the ones that are actually present at the same
-    wners name. Prints error using L{logging} module, when some expected type is
-    not present.
-    '''
-    if self.__nsec: #if some NSEC at all
-      #make a list of record types, that should appear in bitmap field. should
-      #not be empty (eg. RRSIG and NSEC only are not allowed, there would be
-      #nothing to secure)
-      types = self.__rrs.keys()
-      
-      if len(types) <= 0:
-        logging.error(self.owner() + " There should be more than 2 types in NSEC bitmap field.")
-      
-      #get bitmap from NSEC record and make a list from it
-      all_types = str(ldns.ldns_nsec_get_bitmap(self.__nsec)).strip().upper()
-      bm = all_types.split(" ") #make from it a list of types
-      
-      if self.__nsec.get_type() == ldns.LDNS_RR_TYPE_NSEC3:
-        try:
-          types.remove('NSEC3') #NSEC3 itself never present (unlike NSEC)
-        except:
-          pass
-        
-        if "DS" in types or "SOA" in types: #present only for secured delegations
-          types.append('RRSIG')
-      elif self.__nsec.get_type() == ldns.LDNS_RR_TYPE_NSEC:
-        types.append('RRSIG') #present for NSEC every time
-        
-      all_valid = True
-      
-      for t in types:
-        try:
-          bm.remove(t) #if present, can be removed
-        except ValueError:
-          logging.error(self.owner() + " " + t + " type not present in NSEC.")
-          all_valid = False
-      
-      #if there is something left from bitmap, it does not exist and that is an error
-      for t in bm:
-        logging.error(self.owner() + " " + t + " type present in NSEC but does not exist.")
-        all_valid = False
-        
-      if all_valid:
-        logging.info(self.owner() + " NSEC record type coverage OK (" + all_types + ").")
+    owner name (see L{verify_type_bitmap()}). Prints error using L{logging}
+    module, when some expected type is not present.
+    
+    Type Bitmap field of NSEC3 record describes the original owner name, not
+    the hashed one, so it is verified by L{ZoneChecker.verify_nsec_chain()}.
+    '''
+    if not self.__nsec or self.__nsec.get_type() != ldns.LDNS_RR_TYPE_NSEC:
+      return
+    
+    #there should be something to secure (NSEC itself is among the types)
+    if not self.__types:
+      logging.error(self.owner() + " There should be more than 2 types in NSEC bitmap field.")
+    
+    present = self.get_type_bitmap()
+    if present is not None: #RRSIG present for NSEC every time
+      self.verify_type_bitmap(self.owner(), "NSEC", self.__types | DNSWire.type_bit(ldns.LDNS_RR_TYPE_RRSIG),
+                              present)
+  
+  @staticmethod
+  def verify_type_bitmap(owner, title, expected, present):
+    '''
+    Compares types expected at an owner name with Type Bitmap field of NSEC or
+    NSEC3 record. Both are bitsets (see L{DNSWire.type_bitmap()}), so missing
+    and superfluous types are found by bit operations. Prints errors using
+    L{logging} module for each of them.
+    
+    @param owner: Owner name described by the record.
+    @param title: Type of the record used in messages.
+    @param expected: Bitset of expected types.
+    @param present: Bitset decoded from Type Bitmap field.
+    @return: True, when they match.
+    '''
+    for t in DNSWire.bitmap_types(expected & ~present):
+      logging.error(owner + " " + RRCollection.type_name(t) + " type not present in " + title + ".")
+    
+    #types left in bitmap do not exist
+    for t in DNSWire.bitmap_types(present & ~expected):
+      logging.error(owner + " " + RRCollection.type_name(t) + " type present in " + title +
+                    " but does not exist.")
+    
+    if expected != present:
+      return False
+    
+    logging.info(owner + " " + title + " record type coverage OK (" +
+                 " ".join([RRCollection.type_name(t) for t in DNSWire.bitmap_types(present)]) + ").")
+    return True
+  
+  @staticmethod
+  def type_name(rr_type):
+    '''
+    Returns upper case mnemonic of given type number.
+    '''
+    return str(ldns.ldns_rr_type2str(rr_type)).upper()
           
   def verify_nsec_min_ttl(self, min_ttl):
     '''
@@ -819,8 +1208,9 @@ class RRCollection(object):
         
 class ZoneProvider(object):
   '''
-  Generic zone provides class. Use L{ZoneProviderFile} or L{ZoneProviderAXFR}
-  for actual reading from sources and obtaining L{RRCollection} objects.
+  Generic zone provides class. Use L{ZoneProviderFile}, L{ZoneProviderAXFR},
+  L{ZoneProviderIXFR} or L{ZoneProviderSpool} for actual reading from sources
+  and obtaining L{RRCollection} objects.
   '''
   
   __sn_path = "/tmp/dnssec_last_serial_numbers"
@@ -857,6 +1247,17 @@ class ZoneProvider(object):
     '''SOA record remebered from reading.'''
     self.domain = None
     '''Current domain.'''
+    self.complete = True
+    '''
+    Are all owner names of the zone provided? Checks of the whole zone (like
+    NSEC chain) make sense only then.
+    '''
+    self.cuts = None
+    '''
+    L{ZoneCuts} of the zone built in a prepass, before the first
+    L{RRCollection} object is provided, or None, when zone cuts have to be
+    found while checking.
+    '''
     
     if warn:
       self.__warn_stat = Statistics("warning statistic")
@@ -908,18 +1309,31 @@ class ZoneProvider(object):
       else:
         return rr_ret        
         
-    rr_key = str(rr.owner()) #get owner name
+    return self.match_group(str(rr.owner()), [rr])
+  
+  def match_group(self, rr_key, rrs):
+    '''
+    Same as L{match_rrs()}, but joins a whole group of records with the same
+    owner name at once, so the buffer is searched once per group.
+    
+    @param rr_key: Owner name of the records as a string.
+    @param rrs: Non-empty list of
+    U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    objects.
+    '''
     rr_ret = None
+    rrcol = self.__buff.get(rr_key)
     
-    if not self.__buff.has_key(rr_key): #first of that name
+    if rrcol is None: #first of that name
       if len(self.__buff) >= self.__buff_size: #buffer full
         rr_ret = self.__pop_rr()
         
-      self.__buff[rr_key] = RRCollection(rr.owner()) #create new RRCollection
+      rrcol = self.__buff[rr_key] = RRCollection(rrs[0].owner()) #create new RRCollection
       self.__buff_ptr.append(rr_key) #append pointer
       self.__warning(rr_key) #make warning if necessary
       
-    self.__buff[rr_key].add_record(rr) #add record to 
+    for rr in rrs:
+      rrcol.add_record(rr) #add record to 
     
     return rr_ret
   
@@ -942,7 +1356,7 @@ class ZoneProvider(object):
     
     p.write(open(self.__sn_path, "w"))
   
-  def is_new(self, z_name, store_current = True):
+  def is_new(self, z_name, store_current = True, soa = None):
     '''    
     Checks serial number (SN) from SOA record and compares it with stored value.
     Returns True when SN number is higher, than the stored one or there is none
@@ -956,11 +1370,15 @@ class ZoneProvider(object):
     @type z_name: String
     @param store_current:  When set to True, current value will be stored to 
     temporary file L{__sn_path} using L{store_sn()} method.
+    @param soa: SOA record to be checked instead of the one remembered from
+    reading.
     '''
-    if self.soa is None:
+    if soa is None:
+      soa = self.soa
+    if soa is None:
       raise ValueError("SOA record not present. Can't check serial number.")
     
-    sn_new = int(str(self.soa.rdf(2)))
+    sn_new = int(str(soa.rdf(2)))
     
     p = ConfigParser.SafeConfigParser()
     if (len(p.read(self.__sn_path)) != 1): #if could not be read
@@ -982,6 +1400,13 @@ class ZoneProvider(object):
     if store_current: #store current value if needed
       self.store_sn(z_name, sn_new)
     return False
+  
+  def close(self):
+    '''
+    Releases resources used for loading. Should be called, when no more
+    records are needed.
+    '''
+    pass
         
 class ZoneProviderFile(ZoneProvider):
   '''
@@ -1075,9 +1500,57 @@ class ZoneProviderAXFR(ZoneProvider):
   RRs with the same owner name. Has possibility to warn, if there appear some
   discontinuous RRs and it is not possible to join them (one or more parts are
   no longer in memory).
+  
+  The transfer is read by L{AXFRReader} in a background thread, so records
+  are received while the previous ones are being checked. Records come in
+  batches by messages, already grouped by owner name (see
+  L{AXFRReader.next_batch()}). When the zone was already transferred by
+  L{AXFRFetcher}, it is read from the spool file.
+  
+  The transfer can be written to L{ZoneSpool}, so it can be checked again by
+  L{ZoneProviderSpool} without another transfer.
   '''
   
-  def load_start(self, domain, resolver):
+  def __init__(self, buffer_size = 1, warn = True):
+    ZoneProvider.__init__(self, buffer_size, warn)
+    self.__reader = None
+    '''L{AXFRReader} reading the transfer.'''
+    self.__fetcher = None
+    '''L{AXFRFetcher} transferring zones in background or None.'''
+    self.__writer = None
+    '''L{ZoneSpool.SpoolWriter} writing the transfer to a spool or None.'''
+    self.__metrics = None
+    '''L{TransportMetrics}, to which the transfer is recorded, or None.'''
+    self.__batch = []
+    '''Groups of records of the last batch not matched yet, in reversed order.'''
+  
+  def is_unchanged(self, domain, resolver):
+    '''
+    Asks name servers for SOA record of the domain, before the transfer is
+    started. Returns True, when its serial number is not higher, than the
+    stored one (see L{is_new()}), so the transfer can be skipped. Returns
+    False, when the SOA record can't be obtained. The stored serial number is
+    not changed.
+    
+    @param domain: Domain to be checked.
+    @type domain: String
+    @param resolver: Preconfigured resolver, which will be used for the zone
+    transfer.
+    @type resolver: L{SafeResolver}
+    '''
+    pkt = resolver.async_resolver().query(domain, ldns.LDNS_RR_TYPE_SOA, ldns.LDNS_RR_CLASS_IN, False)
+    if pkt is None or pkt.get_rcode() != ldns.LDNS_RCODE_NOERROR:
+      return False
+    
+    for rr in pkt.answer().rrs():
+      if rr.get_type() == ldns.LDNS_RR_TYPE_SOA:
+        try:
+          return not self.is_new(str(rr.owner()), False, rr)
+        except ConfigParser.ParsingError: #broken file, let the transfer decide
+          return False
+    return False
+  
+  def load_start(self, domain, resolver, fetcher = None, spool = None):
     '''
     Starts loading using zone transfer (AXFR) from provided domain using
     provided resolver.
@@ -1091,23 +1564,50 @@ class ZoneProviderAXFR(ZoneProvider):
     @param resolver: Preconfigured resolver to be used for performing zone
     transfer.
     @type resolver: L{SafeResolver}
+    @param fetcher: Fetcher transferring zones in background or None.
+    @type fetcher: L{AXFRFetcher}
+    @param spool: Spool, to which the transfer should be written, or None.
+    @type spool: L{ZoneSpool}
     '''
     #AXFR transfer
     self.domain = domain #set domain for resolving keys
+    self.__fetcher = fetcher
+    self.__metrics = resolver.metrics
     
-    self.__res = resolver.resolver() #get current name server
-      
-    for i in range(resolver.count()): #try all name servers if needed
-      status = self.__res.axfr_start(ldns.ldns_rdf.dname_new_frm_str(self.domain), ldns.LDNS_RR_CLASS_IN)
-      if status == ldns.LDNS_STATUS_OK: #if ok, don't try other
-        break
-      else: #try other name server
-        logging.debug("Can't start AXFR. Error: %s" % ldns.ldns_get_errorstr_by_id(status))
+    if spool is not None:
+      self.__writer = spool.writer(domain)
+    
+    if fetcher is not None:
+      self.__reader = fetcher.reader(domain, self.__writer)
+      if self.__reader is not None: #transferred in background
+        self.cuts = ZoneCuts.from_messages(domain, self.__reader.path)
+        return
+    
+    tsig = None
+    if resolver.tsig:
+      tsig = TSIG(*resolver.tsig)
+    
+    error = "No name server available."
+    for (server, port) in resolver.axfr_servers(): #try all name servers if needed
+      reader = AXFRReader(self.domain)
+      try:
+        reader.start(server, port, resolver.axfr_timeout, tsig, self.__writer)
+      except socket.error, detail: #try other name server
+        error = str(detail)
+        logging.debug("Can't start AXFR. Error: %s" % error)
         logging.debug("Trying next name server.")
-        self.__res = resolver.resolver_next()
+        resolver.health.failure(server)
+        resolver.metrics.inc('transfer failover')
+        continue
+      
+      self.__reader = reader #if ok, don't try other
+      break
     
-    if status != ldns.LDNS_STATUS_OK:
-      raise AXFRError("Can't start AXFR. Error: %s" % ldns.ldns_get_errorstr_by_id(status))
+    if self.__reader is None:
+      if self.__writer is not None:
+        self.__writer.abort()
+        self.__writer = None
+      raise AXFRError("Can't start AXFR. Error: %s" % error)
     
   def load_next(self):
     '''
@@ -1118,46 +1618,525 @@ class ZoneProviderAXFR(ZoneProvider):
     '''
     ret_rrcol = None
     
-    while ret_rrcol == None and not self.finished: #while not received enough rrs      
-      rr = self.__res.axfr_next() #fetch next
-      if not rr:
-        if not self.__res.axfr_complete(): # nothing more to read but transfer not completed
-          raise AXFRError("Transfer not fully completed.")
-        else: #end of transfer
+    while ret_rrcol == None and not self.finished: #while not received enough rrs
+      if not self.__batch:
+        batch = self.__reader.next_batch() #fetch next message
+        if batch is None: #end of transfer
           self.finished = True
-      else: #there is a record
-        if rr.get_type() == ldns.LDNS_RR_TYPE_SOA: #if SOA record remember it
-          if self.soa: #already seen, do not remember again
-            continue
-          else: #first time seen
-            self.soa = rr
-        
-        ret_rrcol = self.match_rrs(rr)
+        else:
+          batch.reverse()
+          self.__batch = batch
+          if not self.soa: #remember SOA record
+            self.soa = self.__reader.soa
+      else: #there is a group of records
+        (rr_key, rrs) = self.__batch.pop()
+        ret_rrcol = self.match_group(rr_key, rrs)
     
     if self.finished:
       ret_rrcol = self.match_rrs()
     
     return ret_rrcol
+  
+  def close(self):
+    '''
+    Stops reading of the transfer. When the whole transfer was read, writes
+    out how long the reading thread waited for checks and how long the checks
+    waited for data using L{logging} module with info severity.
+    '''
+    if self.__reader is None:
+      return
+    
+    self.__reader.close()
+    if self.__reader.complete():
+      logging.info("AXFR of %s from %s - %d records in %d messages, reader waited %.3f s "
+                   "for checks, checks waited %.3f s for data." % (self.domain,
+                   self.__reader.server, self.__reader.records, self.__reader.messages,
+                   self.__reader.producer_stall, self.__reader.consumer_stall))
+      if self.__metrics is not None:
+        self.__metrics.transfer(self.domain, self.__reader.server, self.__reader.records,
+                                self.__reader.messages, self.__reader.bytes,
+                                self.__reader.ttfr, self.__reader.duration)
+    
+    if self.__reader.writer is not None: #spool written completely or not at all
+      if self.__reader.complete() and self.soa is not None:
+        self.__reader.writer.commit(int(str(self.soa.rdf(2))))
+      else:
+        self.__reader.writer.abort()
+    self.__reader = None
+    self.__writer = None
+    
+    if self.__fetcher is not None:
+      self.__fetcher.release(self.domain)
 
-class ZoneChecker(object):
+class ZoneProviderSpool(ZoneProvider):
   '''
-  A class wrapping entire zone and providing high level checking functions.
+  Class for providing L{RRCollection} objects from a zone transfer written to
+  L{ZoneSpool} by L{ZoneProviderAXFR} earlier. The records are provided in
+  the same order as by the transfer.
   '''
   
-  __alg_deprecated = [1]
-  '''List of deprecated algorithm numbers for signing.'''
-    
-  def __init__(self, time, safe_res):
+  def load_start(self, domain, spool, serial = None):
     '''
-    Constructor of the object. Needs a L{TimeVerify} object and an instance of a
-    L{SafeResolver} object, to be able to perform additional DNS queries.
-    Raises L{TypeError} if other classes provided.
+    Starts replaying of the transfer. Use L{load_next()} to obtain
+    L{RRCollection} objects.
     
-    @param time: A preconfigured L{TimeVerify} object.
-    @param safe_res: A preconfigured L{SafeResolver} object.
+    May raise L{FileError} exception, when the zone is not in the spool.
+    
+    @param domain: Domain to be replayed.
+    @type domain: String
+    @param spool: Spool with the zone.
+    @type spool: L{ZoneSpool}
+    @param serial: Serial number of the version to be replayed, the newest
+    one when None.
     '''
-    if not isinstance(safe_res, SafeResolver):
-      raise TypeError("SafeResolver class object needed as parameter.")
+    self.domain = domain #set domain for resolving keys
+    self.__reader = None
+    '''L{AXFRReader} reading the spool file.'''
+    self.__batch = []
+    '''Groups of records of the last batch not matched yet, in reversed order.'''
+    self.__reader = spool.reader(domain, serial)
+    self.cuts = spool.cuts(domain, serial)
+    
+  def load_next(self):
+    '''
+    Loads next L{RRCollection} object from the spool. Use L{load_start()}
+    method before calling this one.
+    
+    May raise L{FileError} exception in case of broken spool file.
+    '''
+    ret_rrcol = None
+    
+    while ret_rrcol == None and not self.finished: #while not read enough rrs
+      if not self.__batch:
+        try:
+          batch = self.__reader.next_batch() #fetch next message
+        except AXFRError, detail:
+          raise FileError("Spool of " + str(self.domain) + " is broken (" + str(detail) + ").")
+        
+        if batch is None: #end of spool
+          self.finished = True
+        else:
+          batch.reverse()
+          self.__batch = batch
+          if not self.soa: #remember SOA record
+            self.soa = self.__reader.soa
+      else: #there is a group of records
+        (rr_key, rrs) = self.__batch.pop()
+        ret_rrcol = self.match_group(rr_key, rrs)
+    
+    if self.finished:
+      ret_rrcol = self.match_rrs()
+    
+    return ret_rrcol
+  
+  def close(self):
+    '''
+    Stops reading of the spool file.
+    '''
+    if self.__reader is not None:
+      self.__reader.close()
+      self.__reader = None
+
+class ZoneProviderIXFR(ZoneProvider):
+  '''
+  Class for providing L{RRCollection} objects using incremental zone transfer
+  (IXFR).
+  
+  The zone is kept in a local snapshot file in L{snapshot_dir}. When there is
+  a snapshot, only changes since its serial number are transferred and
+  applied to it, and only owner names touched by the changes are provided,
+  together with their neighbours in canonical order (so NSEC records around
+  them are checked too), owners of NS records pointing to them (so glue is
+  recognized) and owners with RRSIGs, that are not time-valid. When there is
+  no snapshot, or the server refuses IXFR or has no history for the serial
+  number, full zone transfer (AXFR) is used and the whole zone is provided.
+  
+  The zone apex is always provided first.
+  '''
+  
+  snapshot_dir = "/tmp/dnssec_zone_snapshots"
+  '''Directory for zone snapshot files.'''
+  
+  def load_start(self, domain, resolver, tv = None):
+    '''
+    Transfers the zone, updates the snapshot and prepares owner names to be
+    provided. Use L{load_next()} to obtain L{RRCollection} objects.
+    
+    May raise L{AXFRError} exception in case of error.
+    
+    @param domain: Domain from which should be IXFR performed.
+    @type domain: String
+    @param resolver: Preconfigured resolver to be used for performing zone
+    transfer.
+    @type resolver: L{SafeResolver}
+    @param tv: Object used to find RRSIGs, that are not time-valid, which
+    should be checked even if their owner was not touched. Not used if None.
+    @type tv: L{TimeVerify}
+    '''
+    self.domain = domain #set domain for resolving keys
+    self.__apex = DNSWire.canonical_name(domain)
+    self.__zone = {}
+    '''
+    Zone data, I{key} is owner name, value is a dictionary with records in
+    text form, where I{key} is a tuple C{(<type>, <rdata>)}.
+    '''
+    self.__owners = []
+    '''Owner names to be provided, in reversed canonical order.'''
+    
+    tsig = None
+    if resolver.tsig:
+      tsig = TSIG(*resolver.tsig)
+    
+    touched = None #all owners
+    if self.__load_snapshot():
+      touched = self.__ixfr(resolver, tsig)
+      
+    if touched is None: #no snapshot or IXFR not possible
+      self.__axfr(resolver, tsig)
+      
+    self.__save_snapshot()
+    
+    self.cuts = ZoneCuts(domain)
+    for owner in self.__zone.keys():
+      if [key for key in self.__zone[owner].keys() if key[0] == 'NS']:
+        self.cuts.add(owner)
+    
+    owners = self.__zone.keys()
+    owners.sort(key = DNSWire.canonical_key)
+    
+    if touched is not None:
+      selected = self.__select(owners, touched, tv)
+      owners = [o for o in owners if o in selected]
+      self.complete = False
+      logging.info("IXFR of %s - %d owner names changed, %d of %d owner names will be checked."
+                   % (self.domain, len(touched), len(owners), len(self.__zone)))
+    
+    if self.__apex in owners: #apex with SOA first
+      owners.remove(self.__apex)
+      owners.insert(0, self.__apex)
+    owners.reverse() #popped from the end
+    self.__owners = owners
+    
+  def __snapshot_path(self):
+    '''
+    Returns path to the snapshot file of the zone.
+    '''
+    return os.path.join(self.snapshot_dir, self.__apex + "zone")
+  
+  @staticmethod
+  def __rr_key(rr):
+    '''
+    Returns a tuple C{(<owner>, <key>, <text>)} for storing given record in
+    L{__zone}. Key does not depend on TTL, so the record can be found, when
+    it is deleted.
+    '''
+    text = str(rr).strip()
+    fields = text.split(None, 4) #owner, TTL, class, type, rdata
+    rdata = ''
+    if len(fields) > 4:
+      rdata = fields[4]
+    return (DNSWire.canonical_name(fields[0]), (fields[3].upper(), rdata), text)
+  
+  def __add(self, rr):
+    '''
+    Adds a record to the zone. Returns its owner name.
+    '''
+    (owner, key, text) = self.__rr_key(rr)
+    self.__zone.setdefault(owner, {})[key] = text
+    return owner
+    
+  def __delete(self, rr):
+    '''
+    Deletes a record from the zone. Returns its owner name.
+    '''
+    (owner, key, text) = self.__rr_key(rr)
+    rrs = self.__zone.get(owner, {})
+    rrs.pop(key, None)
+    if not rrs:
+      self.__zone.pop(owner, None)
+    return owner
+  
+  def __set_soa(self, soa):
+    '''
+    Replaces SOA record of the zone.
+    '''
+    apex = self.__zone.setdefault(self.__apex, {})
+    for key in apex.keys():
+      if key[0] == 'SOA':
+        del apex[key]
+    self.__add(soa)
+    self.soa = soa
+  
+  def __load_snapshot(self):
+    '''
+    Loads the snapshot file. Returns False, if there is no usable snapshot.
+    '''
+    try:
+      f = open(self.__snapshot_path(), "r")
+    except IOError:
+      return False
+    
+    try:
+      try:
+        for line in f:
+          if line.strip():
+            rr = ldns.ldns_rr.new_frm_str(line.strip())
+            if rr.get_type() == ldns.LDNS_RR_TYPE_SOA:
+              self.soa = rr
+            self.__add(rr)
+      finally:
+        f.close()
+    except Exception, detail:
+      logging.warning("Zone snapshot " + self.__snapshot_path() + " is broken (" + str(detail) +
+                      "), full zone transfer will be used.")
+      self.__zone = {}
+      self.soa = None
+      
+    return self.soa is not None
+  
+  def __save_snapshot(self):
+    '''
+    Writes the zone to the snapshot file. On error a warning is written out
+    using L{logging} module.
+    '''
+    path = self.__snapshot_path()
+    try:
+      if not os.path.isdir(self.snapshot_dir):
+        os.makedirs(self.snapshot_dir)
+      f = open(path + ".tmp", "w")
+      try:
+        for rrs in self.__zone.values():
+          for text in rrs.values():
+            f.write(text + "\n")
+      finally:
+        f.close()
+      os.rename(path + ".tmp", path) #readers never see half written file
+    except (IOError, OSError), detail:
+      logging.warning("Zone snapshot " + path + " can't be written (" + str(detail) + ").")
+      
+  def __axfr(self, resolver, tsig):
+    '''
+    Replaces the zone by full zone transfer.
+    '''
+    error = "No name server available."
+    for (server, port) in resolver.axfr_servers(): #try all name servers if needed
+      reader = AXFRReader(self.domain)
+      try:
+        reader.start(server, port, resolver.axfr_timeout, tsig)
+      except socket.error, detail: #try other name server
+        error = str(detail)
+        logging.debug("Can't start AXFR. Error: %s" % error)
+        logging.debug("Trying next name server.")
+        resolver.health.failure(server)
+        continue
+      
+      try:
+        self.__zone = {}
+        self.soa = None
+        batch = reader.next_batch()
+        while batch:
+          for (rr_key, rrs) in batch:
+            for rr in rrs:
+              if rr.get_type() == ldns.LDNS_RR_TYPE_SOA:
+                self.__set_soa(rr)
+              else:
+                self.__add(rr)
+          batch = reader.next_batch()
+      finally:
+        reader.close()
+      return
+    
+    raise AXFRError("Can't start AXFR. Error: %s" % error)
+  
+  def __ixfr(self, resolver, tsig):
+    '''
+    Applies changes since the snapshot to the zone. Returns a set of touched
+    owner names or None, if full zone transfer has to be used.
+    '''
+    for (server, port) in resolver.axfr_servers(): #try all name servers if needed
+      reader = IXFRReader(self.domain, self.soa)
+      try:
+        rrs = reader.fetch(server, port, resolver.axfr_timeout, tsig)
+      except socket.error, detail: #try other name server
+        logging.debug("Can't perform IXFR from " + server + ". Error: " + str(detail))
+        resolver.health.failure(server)
+        continue
+      except AXFRError, detail: #refused, use AXFR
+        logging.info(str(detail) + " - full zone transfer will be used.")
+        return None
+      
+      return self.__apply(rrs)
+    
+    logging.info("IXFR of " + self.domain + " failed, full zone transfer will be used.")
+    return None
+  
+  def __apply(self, rrs):
+    '''
+    Applies records received by IXFR to the zone. Returns a set of touched
+    owner names or None, if full zone transfer has to be used.
+    '''
+    serial = int(str(rrs[0].rdf(2)))
+    
+    if len(rrs) == 1: #no changes or no history
+      if serial == int(str(self.soa.rdf(2))):
+        return set()
+      return None
+    
+    if rrs[1].get_type() != ldns.LDNS_RR_TYPE_SOA: #whole zone sent, use it
+      self.__zone = {}
+      self.__set_soa(rrs[0])
+      for rr in rrs[1:-1]:
+        self.__add(rr)
+      return set(self.__zone.keys())
+    
+    touched = set()
+    deleting = False
+    for rr in rrs[1:-1]:
+      if rr.get_type() == ldns.LDNS_RR_TYPE_SOA: #old SOA starts deleted records, new one added
+        deleting = not deleting
+        continue
+      if deleting:
+        touched.add(self.__delete(rr))
+      else:
+        touched.add(self.__add(rr))
+        
+    self.__set_soa(rrs[0])
+    return touched
+  
+  def __select(self, owners, touched, tv):
+    '''
+    Returns a set of owner names, that should be checked.
+    
+    @param owners: All owner names of the zone in canonical order.
+    @param touched: Owner names touched by changes (even deleted ones).
+    @param tv: Object for checking RRSIGs times or None. Times are read from
+    text of the records, so the whole snapshot is not parsed by ldns again.
+    '''
+    keys = [DNSWire.canonical_key(o) for o in owners]
+    selected = set([self.__apex])
+    
+    for owner in touched:
+      i = bisect.bisect_left(keys, DNSWire.canonical_key(owner))
+      if i < len(owners) and owners[i] == owner: #owner itself and both neighbours
+        selected.update(owners[max(i - 1, 0):i + 2])
+      else: #deleted owner, its former neighbours
+        selected.update(owners[max(i - 1, 0):i + 1])
+    
+    for owner in owners: #owners of delegations to selected glue and bad RRSIGs
+      for (rr_type, rdata) in self.__zone[owner].keys():
+        if rr_type == 'NS' and DNSWire.canonical_name(rdata) in selected:
+          selected.add(owner)
+        elif rr_type == 'RRSIG' and tv is not None:
+          #type covered, algorithm, labels, original TTL, expiration, inception, ...
+          fields = rdata.split()
+          try:
+            valid = tv.is_valid(TimeVerify.epoch(fields[5]), TimeVerify.epoch(fields[4]))
+          except (IndexError, ValueError): #broken record, let the check report it
+            valid = None
+          if valid != tv.RRSIG_VALID:
+            selected.add(owner)
+            
+    return selected
+  
+  def load_next(self):
+    '''
+    Returns next L{RRCollection} object. Use L{load_start()} method before
+    calling this one.
+    '''
+    ret_rrcol = None
+    
+    while ret_rrcol == None and not self.finished:
+      if not self.__owners:
+        self.finished = True
+        break
+      
+      owner = self.__owners.pop()
+      for text in self.__zone[owner].values():
+        rrcol = self.match_rrs(ldns.ldns_rr.new_frm_str(text))
+        if rrcol: #only the first record of an owner may return previous one
+          ret_rrcol = rrcol
+        
+    if self.finished:
+      ret_rrcol = self.match_rrs()
+      
+    return ret_rrcol
+
+class GlueTracker(object):
+  '''
+  Matches domain names from NS records with owner names of A / AAAA records
+  without NSEC record (potential glue records), which may come in any order.
+  Both are kept as multisets (a name counts as many times, as it was seen),
+  so each match takes constant time.
+  '''
+  
+  def __init__(self):
+    self.__ns = Counter()
+    '''Domain names from NS records not matched yet.'''
+    self.__glue = OrderedDict()
+    '''Potential glue records not matched yet, I{key} is owner name, value count of records.'''
+  
+  def add_ns(self, dname):
+    '''
+    Matches domain name from NS record with one potential glue record or
+    remembers it, when there is none.
+    '''
+    count = self.__glue.get(dname)
+    if count is None:
+      self.__ns[dname] += 1
+    elif count > 1:
+      self.__glue[dname] = count - 1
+    else:
+      del self.__glue[dname]
+  
+  def add_glue(self, owner):
+    '''
+    Matches owner name of A / AAAA record without NSEC record with one domain
+    name from NS record or remembers it as potential glue record, when there
+    is none. Returns True, when matched.
+    '''
+    count = self.__ns[owner]
+    if count > 1:
+      self.__ns[owner] = count - 1
+      return True
+    elif count == 1:
+      del self.__ns[owner]
+      return True
+    
+    self.__glue[owner] = self.__glue.get(owner, 0) + 1
+    return False
+  
+  def remaining(self):
+    '''
+    Returns a list of potential glue records, that were not matched by any NS
+    record, in order they were seen (once for each record).
+    '''
+    ret = []
+    for (owner, count) in self.__glue.items():
+      ret.extend([owner] * count)
+    return ret
+    
+class ZoneChecker(object):
+  '''
+  A class wrapping entire zone and providing high level checking functions.
+  '''
+  
+  __alg_deprecated = [1]
+  '''List of deprecated algorithm numbers for signing.'''
+    
+  def __init__(self, time, safe_res, trust_cache = None):
+    '''
+    Constructor of the object. Needs a L{TimeVerify} object and an instance of a
+    L{SafeResolver} object, to be able to perform additional DNS queries.
+    Raises L{TypeError} if other classes provided.
+    
+    @param time: A preconfigured L{TimeVerify} object.
+    @param safe_res: A preconfigured L{SafeResolver} object.
+    @param trust_cache: Cache of validated keys, that should be shared with
+    other L{ZoneChecker} objects. If not set, private one is created.
+    @type trust_cache: L{TrustCache}
+    '''
+    if not isinstance(safe_res, SafeResolver):
+      raise TypeError("SafeResolver class object needed as parameter.")
     
     if not isinstance(time, TimeVerify):
       raise TypeError("TimeVerify class object needed as parameter.")
@@ -1179,6 +2158,21 @@ class ZoneChecker(object):
     self.__res = safe_res
     '''L{SafeResolver} object obratined during initialization.'''
     
+    if trust_cache is None:
+      trust_cache = TrustCache()
+    
+    self.__cache = trust_cache
+    '''L{TrustCache} object with already validated DNSKEY and DS records.'''
+    
+    self.__anchor_id = None
+    '''Identificator of trust anchors in L{__a} used as a part of L{__cache} keys.'''
+    
+    self.__answers = {}
+    '''
+    Prefetched answers to DNSKEY and DS queries, I{key} is a tuple C{(<domain>,
+    <type>)}. See L{__prefetch_chain()}.
+    '''
+    
     self.__nsec_stat = Statistics("Usage of NSEC")
     '''NSEC usage L{Statistics} object.'''
     
@@ -1188,11 +2182,44 @@ class ZoneChecker(object):
     self.__soa_checked = False #check only once
     '''State variable saying, whether was SOA record already checked.'''
     
-    self.__ns_list = []
-    '''List of already seen NS records domain names.'''
+    self.__soa_read = False
+    '''State variable saying, whether were TTL limits already read from SOA record.'''
     
-    self.__glue_list = []
-    '''List of potential glue records.'''    
+    self.__held = None
+    '''Tuple C{(<L{RRCollection}>, <list of messages>)} of TTL checks done by L{verify_rrsigs()}, until written out by L{verify_ttls()}.'''
+    
+    self.__glue = GlueTracker()
+    '''L{GlueTracker} of already seen NS records domain names and potential glue records.'''
+    
+    self.__nsec_chain = NSECChain()
+    '''L{NSECChain} collecting NSEC records for L{verify_nsec_chain()}.'''
+    
+    self.__nsec3_chain = NSEC3Chain()
+    '''L{NSEC3Chain} collecting NSEC3 records for L{verify_nsec_chain()}.'''
+    
+    self.__nsec3_names = {}
+    '''
+    Owner names of a zone secured by NSEC3, which should have NSEC3 record.
+    I{key} is owner name, value bitset of its types (see L{DNSWire.type_bitmap()}).
+    '''
+    
+    self.__nsec3_bitmaps = {}
+    '''Type bitmaps of NSEC3 records, I{key} is hash from hashed owner name, value bitset.'''
+    
+    self.__nsec3_params = None
+    '''Tuple from L{RRCollection.get_nsec3_params()} of the zone apex.'''
+    
+    self.__nsec3_optout = False
+    '''Has some NSEC3 record opt-out flag set?'''
+    
+    self.__hasher = NSEC3Hasher()
+    '''L{NSEC3Hasher} computing hashed owner names.'''
+    
+    self.__cuts = None
+    '''L{ZoneCuts} of the zone, see L{zone_cut()}.'''
+    
+    self.__cuts_prepass = False
+    '''Was L{__cuts} built in a prepass? Otherwise zone cuts are added, while they are seen.'''
     
     self.__alg_list = []
     '''List of DNSKEY algorithms in current domain.'''
@@ -1229,10 +2256,150 @@ class ZoneChecker(object):
         else:
           self.__a.push_rr(rr)
       
+  def __rrset_expires(self, rrset, rrsig = None):
+    '''
+    Returns a time (in seconds since the epoch), until which can be validated
+    record set used. It is the lowest TTL of the records counted from now or
+    I{Signature Expiration} of the RRSIG, that validated them, whichever comes
+    first.
+    '''
+    expires = time.time() + min([int(rr.ttl()) for rr in rrset.rrs()])
+    
+    if rrsig:
+      expires = min(expires, TimeVerify.normalize_time(rrsig.rrsig_expiration()))
+      
+    return expires
+  
+  def __prefetch_chain(self, resolver, domain):
+    '''
+    Sends DNSKEY and DS queries for given domain and all its ancestors at once
+    using L{SafeResolver.query_many()}, so building of the chain of trust does
+    not have to wait for the answers one by one. Ancestors above a level with
+    trust anchor or already validated DNSKEYs in L{__cache} are skipped. The
+    answers are stored in L{__answers} and used by L{__fetch()}.
+    
+    @param resolver: Preconfigured resolver.
+    @type resolver: L{SafeResolver}
+    @param domain: Domain for which should be the chain of trust built.
+    '''
+    anchored = [TrustCache.normalize_name(rr.owner()) for rr in self.__a.rrs()]
+    labels = DNSWire.read_name(DNSWire.name_to_wire(domain), 0)[0]
+    queries = []
+    
+    for i in range(len(labels) + 1): #from domain itself up to the root
+      name = DNSWire.name_to_str(labels[i:])
+      
+      if self.__cache.has(self.__anchor_id, name, TrustCache.DNSKEY):
+        break #chain of trust will end here
+      
+      queries.append((name, ldns.LDNS_RR_TYPE_DNSKEY))
+      if name in anchored:
+        break #chain of trust will end here, DS of this level is not used
+      
+      if name != '.' and not self.__cache.has(self.__anchor_id, name, TrustCache.DS):
+        queries.append((name, ldns.LDNS_RR_TYPE_DS))
+      
+    if queries:
+      logging.debug("Sending " + str(len(queries)) + " queries for the chain of trust at once.")
+      self.__answers = resolver.query_many(queries)
+      
+  def __fetch(self, resolver, domain, rr_type):
+    '''
+    Returns an answer to given query. Uses answer prefetched by
+    L{__prefetch_chain()}, if there is any, otherwise sends the query using
+    given resolver.
+    '''
+    key = (TrustCache.normalize_name(domain), rr_type)
+    
+    if self.__answers.get(key):
+      return self.__answers.pop(key)
+    
+    return resolver.query(domain, rr_type)
+    
+  def __validate_domain_dnskey(self, resolver, domain, keys):
+    '''
+    Fetches DNSKEY records of given domain and validates them using given trusted
+    keys or DS records. Works the same way as C{ldns_validate_domain_dnskey()},
+    but provides also expiration time of the result.
+    
+    @param resolver: Preconfigured resolver.
+    @type resolver: L{SafeResolver}
+    @param domain: Domain for which should be DNSKEYs fetched.
+    @param keys: List of trusted keys or DS records.
+    @type keys: U{ldns_rr_list<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr__list.html>}
+    @return: Tuple C{(<trusted keys>, <expiration time>)}, trusted keys are
+    None when nothing could be validated.
+    '''
+    pkt = self.__fetch(resolver, domain, ldns.LDNS_RR_TYPE_DNSKEY)
+    if not pkt:
+      return (None, None)
+    
+    domain_keys = pkt.rr_list_by_type(ldns.LDNS_RR_TYPE_DNSKEY, ldns.LDNS_SECTION_ANSWER)
+    domain_sigs = pkt.rr_list_by_type(ldns.LDNS_RR_TYPE_RRSIG, ldns.LDNS_SECTION_ANSWER)
+    if not domain_keys:
+      return (None, None)
+    
+    trusted_keys = None
+    
+    for key in domain_keys.rrs():
+      for tkey in keys.rrs():
+        if not tkey.compare_ds(key): #this key is not trusted
+          continue
+        
+        if domain_sigs: #key is trusted, it can validate the whole set
+          keytag = ldns.ldns_calc_keytag(key)
+          for rrsig in domain_sigs.rrs():
+            if int(str(rrsig.rrsig_keytag())) == keytag and \
+            ldns.ldns_verify_rrsig(domain_keys, rrsig, key) == ldns.LDNS_STATUS_OK:
+              return (domain_keys, self.__rrset_expires(domain_keys, rrsig))
+            
+        #set could not be validated, trust at least this key
+        if not trusted_keys:
+          trusted_keys = ldns.ldns_rr_list()
+        trusted_keys.push_rr(key.clone())
+        
+    if not trusted_keys:
+      return (None, None)
+    
+    return (trusted_keys, self.__rrset_expires(trusted_keys))
+  
+  def __validate_domain_ds(self, resolver, domain, keys):
+    '''
+    Fetches DS records of given domain and validates them using given trusted
+    keys of the parent domain. Works the same way as
+    C{ldns_validate_domain_ds()}, but provides also expiration time of the
+    result.
+    
+    @param resolver: Preconfigured resolver.
+    @type resolver: L{SafeResolver}
+    @param domain: Domain for which should be DS records fetched.
+    @param keys: List of trusted keys of the parent domain.
+    @type keys: U{ldns_rr_list<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr__list.html>}
+    @return: Tuple C{(<DS records>, <expiration time>)}, DS records are None
+    when nothing could be validated.
+    '''
+    pkt = self.__fetch(resolver, domain, ldns.LDNS_RR_TYPE_DS)
+    if not pkt:
+      return (None, None)
+    
+    domain_ds = pkt.rr_list_by_type(ldns.LDNS_RR_TYPE_DS, ldns.LDNS_SECTION_ANSWER)
+    domain_sigs = pkt.rr_list_by_type(ldns.LDNS_RR_TYPE_RRSIG, ldns.LDNS_SECTION_ANSWER)
+    if not domain_ds or not domain_sigs:
+      return (None, None)
+    
+    for rrsig in domain_sigs.rrs():
+      for key in keys.rrs():
+        if int(str(rrsig.rrsig_keytag())) == ldns.ldns_calc_keytag(key) and \
+        ldns.ldns_verify_rrsig(domain_ds, rrsig, key) == ldns.LDNS_STATUS_OK:
+          return (domain_ds, self.__rrset_expires(domain_ds, rrsig))
+        
+    return (None, None)
+      
   def __get_valid_keys(self, resolver, domain, keys):
     '''
     Obtains valid DNSSEC keys for given domain, using given resolver and taking
-    in consideration existing trusted keys.
+    in consideration existing trusted keys. Already validated DNSKEY and DS
+    records are taken from L{__cache}, newly validated are stored there.
     
     @param resolver: Preconfigured resolver.
     @type resolver: L{SafeResolver}
@@ -1247,14 +2414,12 @@ class ZoneChecker(object):
     status = None 
  
     if resolver and domain and keys:
-      res = resolver.resolver() #get current name server
+      trusted_keys = self.__cache.get(self.__anchor_id, domain, TrustCache.DNSKEY)
       
-      for i in range(resolver.count()): #try all name servers if needed
-        trusted_keys = ldns.ldns_validate_domain_dnskey(res, domain, keys)
-        if trusted_keys: #if something found, don't try other
-          break
-        else: #try other name server
-          res = resolver.resolver_next()
+      if not trusted_keys: #not validated yet
+        (trusted_keys, expires) = self.__validate_domain_dnskey(resolver, domain, keys)
+        if trusted_keys:
+          self.__cache.store(self.__anchor_id, domain, TrustCache.DNSKEY, trusted_keys, expires)
         
       if trusted_keys:
         status = ldns.LDNS_STATUS_OK
@@ -1270,12 +2435,12 @@ class ZoneChecker(object):
 
           if parent_keys:
             #Check DS records
-            for i in range(resolver.count()): #try all name servers if needed
-              ds_keys = ldns.ldns_validate_domain_ds(res, domain, parent_keys)
-              if ds_keys: #if something found, don't try other
-                break
-              else: #try other name server
-                res = resolver.resolver_next()
+            ds_keys = self.__cache.get(self.__anchor_id, domain, TrustCache.DS)
+            
+            if not ds_keys: #not validated yet
+              (ds_keys, expires) = self.__validate_domain_ds(resolver, domain, parent_keys)
+              if ds_keys:
+                self.__cache.store(self.__anchor_id, domain, TrustCache.DS, ds_keys, expires)
             
             if ds_keys:
               (status, trusted_keys) = self.__get_valid_keys(resolver, domain, ds_keys)
@@ -1320,17 +2485,11 @@ class ZoneChecker(object):
     Gets all DS records from parent zone for given domain. Uses L{__res} for
     performing DNS queries.
     '''
-    res = self.__res.resolver() #get current name server
-    
-    for i in range(self.__res.count()): #try all name servers if needed
-      pkt = res.query(domain, ldns.LDNS_RR_TYPE_DS, ldns.LDNS_RR_CLASS_IN, ldns.LDNS_RD)
-      if pkt: #if something found, don't try other
-        ds_rrs = pkt.rr_list_by_type(ldns.LDNS_RR_TYPE_DS, ldns.LDNS_SECTION_ANSWER)
-        if ds_rrs is not None:
-          return ds_rrs
-        break
-      else: #try other name server
-        res = self.__res.resolver_next()
+    pkt = self.__res.query(domain, ldns.LDNS_RR_TYPE_DS)
+    if pkt:
+      ds_rrs = pkt.rr_list_by_type(ldns.LDNS_RR_TYPE_DS, ldns.LDNS_SECTION_ANSWER)
+      if ds_rrs is not None:
+        return ds_rrs
     
     return [] #nothing found
   
@@ -1347,7 +2506,10 @@ class ZoneChecker(object):
       self.domain = str(domain)
       
       logging.debug("Building chain of trust.")
+      self.__anchor_id = TrustCache.anchor_id(self.__a)
+      self.__prefetch_chain(self.__res, self.domain)
       (status, self.__trusted) = self.__get_valid_keys(self.__res, self.domain, self.__a)
+      self.__answers = {} #not needed anymore
       
       #check whether there are any keys for current domain among trust anchors
       if not self.__trusted: #there is no list yet, create it
@@ -1376,6 +2538,41 @@ class ZoneChecker(object):
           if alg not in self.__alg_list:
             self.__alg_list.append(alg)
             
+  def set_zone_cuts(self, cuts):
+    '''
+    Sets zone cuts of the zone built in a prepass (see L{ZoneProvider.cuts}).
+    
+    @type cuts: L{ZoneCuts}
+    '''
+    self.__cuts = cuts
+    self.__cuts_prepass = cuts is not None
+  
+  def zone_cut(self, rrs, apex):
+    '''
+    Classifies owner name of given object as authoritative, zone cut,
+    occluded by a zone cut (glue) or outside of the zone, see
+    L{ZoneCuts.classify()}. Occluded data and data outside of the zone are not
+    authoritative, so they should not be checked.
+    
+    When there are no zone cuts from a prepass (see L{set_zone_cuts()}), they
+    are added, while they are seen. That is enough for zones in canonical
+    order (like signed zone files and most zone transfers), where each zone
+    cut comes before data below it. Data coming before their zone cut are
+    checked as authoritative.
+    
+    @param rrs: Object to be classified.
+    @type rrs: L{RRCollection}
+    @param apex: Zone apex (SOA owner name).
+    @type apex: String
+    '''
+    if self.__cuts is None:
+      self.__cuts = ZoneCuts(apex)
+    
+    if not self.__cuts_prepass and rrs.has_ns():
+      self.__cuts.add(rrs.owner())
+    
+    return self.__cuts.classify(rrs.owner())
+  
   def verify_signatures(self, rrs, soa, time_check = False, tv = None):
     '''
     Checks whether at least one signature for each record from given
@@ -1396,14 +2593,7 @@ class ZoneChecker(object):
     @return: True, if there was verification possible (eg. there are some valid
     keys) or False otherwise.
     '''
-    self.get_valid_keys(soa.owner())
-    
-    if self.__trusted:
-      rrs.verify_signatures(self.__trusted, self.domain, time_check, tv)
-      return True
-    else:
-      logging.critical('Signature check - ' + rrs.owner() + ' - no trusted keys, can\'t verify.')
-      return False
+    return self.verify_rrsigs(rrs, soa, signatures = True, time_check = time_check, tv = tv)
     
   def verify_signatures_algorithm(self, rrs, soa):
     '''
@@ -1418,17 +2608,9 @@ class ZoneChecker(object):
     
     @return: True if there was at least one DNSKEY obtained.
     '''
-    self.get_valid_keys(soa.owner())
-    
-    if len(self.__alg_list) > 0:
-      rrs.verify_rrsigs_algorithms(self.__alg_list)
-      return True
-    else:
-      logging.critical('Signature algorithm check - ' + rrs.owner() + ' - no trusted keys for domain ' +\
-                       self.domain + ', can\'t verify algorithms usage.')
-      return False
+    return self.verify_rrsigs(rrs, soa, algorithms = True)
   
-  def verify_ttls(self, rr, soa):
+  def verify_ttls(self, rr, soa, columns = None):
     '''
     Checks whether various TTL values are OK. SOA record is checked only once.
     
@@ -1436,11 +2618,117 @@ class ZoneChecker(object):
     @type rr: L{RRCollection}
     @param soa: SOA record.
     @type soa: U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    @param columns: Columnar store, which checks RRSIG records of whole
+    blocks, or None, when they are checked here.
+    @type columns: L{RRSIGColumns}
     '''
-    if not self.__soa_checked:
+    self.__check_soa_ttls(soa)
+    rr.verify_nsec_min_ttl(self.__soa_field_min)
+    if columns is not None: #RRSIGs added to columns by caller
+      columns.tmin = self.__maxsoa
+      return
+    
+    held = self.__held
+    self.__held = None
+    if held is not None and held[0] is rr: #already checked in one pass with other checks
+      for (log, message) in held[1]:
+        log(message)
+    else:
+      rr.verify_rrsigs(self.__t, tmin = self.__maxsoa, ttl = True)
+    
+  def verify_rrsigs(self, rrs, soa, times = False, signatures = False, time_check = False,
+                    algorithms = False, ttls = False, columns = None, tv = None, forecast = None):
+    '''
+    Runs all wanted checks of RRSIG records of given L{RRCollection} object in
+    one pass over them (see L{RRCollection.verify_rrsigs()}), so each RRSIG is
+    read only once. Messages are the same as of L{verify_signatures()},
+    L{verify_signatures_algorithm()}, L{verify_ttls()} and
+    L{RRCollection.verify_rrsigs_times()}.
+    
+    Results of TTL checks are kept until L{verify_ttls()} is called for the
+    same object, which writes them out together with checks of SOA and NSEC
+    TTLs, so they keep their place after other checks of the owner name.
+    
+    @param rrs: Object to be checked.
+    @type rrs: L{RRCollection}
+    @param soa: SOA record.
+    @type soa: U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    @param times: Check signatures times.
+    @param signatures: Check signatures with trusted keys.
+    @param time_check: Check also signatures times in signature check.
+    @param algorithms: Check usage of signing algorithms.
+    @param ttls: Check TTL values of RRSIG records, L{verify_ttls()} has to
+    be called afterwards.
+    @param columns: Columnar store, which checks RRSIG records of whole
+    blocks, or None, when they are checked here. TTLs are not checked here
+    then.
+    @type columns: L{RRSIGColumns}
+    @param tv: Object needed for time checking, the object given to
+    constructor when None.
+    @type tv: L{TimeVerify}
+    @param forecast: Forecast of RRSIG expirations to be filled, or None.
+    @type forecast: L{Forecast.ExpirationForecast}
+    
+    @return: True, if signature or algorithm check was possible (eg. there are
+    some valid keys), False otherwise. True, when none of them was wanted.
+    '''
+    if tv is None:
+      tv = self.__t
+    trust = None
+    domain = None
+    alg_list = None
+    ret = True
+    
+    if signatures or algorithms:
+      self.get_valid_keys(soa.owner())
+    
+    if signatures:
+      if self.__trusted:
+        trust = self.__trusted
+        domain = self.domain
+      else:
+        logging.critical('Signature check - ' + rrs.owner() + ' - no trusted keys, can\'t verify.')
+        ret = False
+    
+    if algorithms:
+      if len(self.__alg_list) > 0:
+        alg_list = self.__alg_list
+        ret = True
+      else:
+        logging.critical('Signature algorithm check - ' + rrs.owner() + ' - no trusted keys for domain ' +\
+                         self.domain + ', can\'t verify algorithms usage.')
+        ret = False
+    
+    tmin = None
+    held = None
+    self.__held = None
+    if ttls and columns is None:
+      self.__read_soa_ttls(soa)
+      tmin = self.__maxsoa
+      held = []
+      self.__held = (rrs, held)
+    else:
+      ttls = False
+    
+    rrs.verify_rrsigs(tv, times, trust, domain, time_check, alg_list, tmin, ttls, forecast, held)
+    return ret
+  
+  def __read_soa_ttls(self, soa):
+    '''
+    Reads TTL limits from SOA record, only once.
+    '''
+    if not self.__soa_read:
       self.__minsoa = self.__min_soa(soa)
       self.__maxsoa = self.__max_soa(soa)
       self.__soa_field_min = self.__soa_field_min(soa) 
+      self.__soa_read = True
+  
+  def __check_soa_ttls(self, soa):
+    '''
+    Reads TTL limits from SOA record and checks them, only once.
+    '''
+    if not self.__soa_checked:
+      self.__read_soa_ttls(soa)
     
       if self.__minsoa < 600: #minimum TTL from SOA should not be lower, than 10 minutes
         logging.warning("Minimum TTL from SOA should not be lower than 5-10 minutes"+\
@@ -1448,10 +2736,6 @@ class ZoneChecker(object):
         + str(self.__minsoa) + ".")
         
       self.__soa_checked = True
-    
-    rr.verify_nsec_min_ttl(self.__soa_field_min)
-    rr.verify_rrsigs_remaining(self.__t, self.__maxsoa)
-    rr.verify_rrsigs_ttl()
       
   def verify_nsecs(self, rrs, disable_presence_check = False):
     '''
@@ -1464,42 +2748,144 @@ class ZoneChecker(object):
     At the end of checking the entire zone, should be called method
     L{write_error_remaining_glue()}, that writes on the output information about
     all records, that were marked as potential glue records, but did not have
-    any matching NS record during entire zone check. 
+    any matching NS record during entire zone check, and L{verify_nsec_chain()}.
     
     @param rrs: Object to be checked.
     @type rrs: L{RRCollection}
-    @param disable_presence_check: Disables NSEC record presence check.
-    This is useful for zones secured by NSEC3, because ldns library does not
-    provide necessary functions to perform such a check yet.
+    @param disable_presence_check: Disables NSEC record presence check. This
+    is needed for zones secured by NSEC3, where NSEC3 records and owner names
+    are collected instead, so the NSEC3 chain and coverage can be verified by
+    L{verify_nsec_chain()}.
     @type disable_presence_check: Boolean
-    
-    @warning: Don't use this for checking NSEC3 type record presence, it does
-    not work reliably. See TODO for explanation.
-    @todo: Fix NSEC3 presence verification after next release of ldns library.
     '''
     rrs.verify_nsec_bitmap()
     
-    if not disable_presence_check:
+    next_owner = rrs.get_nsec_next()
+    if next_owner is not None: #remember for chain check
+      self.__nsec_chain.add(rrs.owner(), next_owner)
+    
+    if disable_presence_check: #zone secured by NSEC3
+      self.__nsec3_collect(rrs)
+    else:
       if rrs.has_ns(): #make list of NS records domain names to which they point
         for dname in rrs.get_ns_dnames():
-          try: #check remove glue records
-            self.__glue_list.remove(dname)
-          except:
-            self.__ns_list.append(dname) #remember it
+          self.__glue.add_ns(dname) #match glue records or remember it
         
-      glue = rrs.verify_nsec_presence(self.__ns_list) #check presence
-      
-      #remember potential glue records and check them later
-      self.__glue_list.extend(glue)
+      #check presence, potential glue records are remembered and checked later
+      rrs.verify_nsec_presence(self.__glue)
     
   def write_error_remaining_glue(self):
     '''
     Writes error on output about non-glue records that don't have matching NSEC
     records. These are generated by L{verify_nsecs()} method.
     '''
-    for dname in self.__glue_list:
+    for dname in self.__glue.remaining():
       logging.error(dname + " NSEC type record not present.")
     
+  def __nsec3_collect(self, rrs):
+    '''
+    Remembers NSEC3 record, NSEC3PARAM record or owner name of given object for
+    L{verify_nsec_chain()}.
+    '''
+    params = rrs.get_nsec3_params()
+    if params is not None and self.__nsec3_params is None:
+      self.__nsec3_params = params
+    
+    nsec3 = rrs.get_nsec3_next()
+    if nsec3 is not None: #hashed owner name
+      self.__nsec3_chain.add(rrs.owner(), nsec3[0])
+      self.__nsec3_bitmaps[self.__nsec3_chain.key(rrs.owner())] = rrs.get_type_bitmap()
+      if nsec3[1]:
+        self.__nsec3_optout = True
+    elif rrs.get_types(): #not just RRSIGs left from hashed owner name
+      name = DNSWire.canonical_name(rrs.owner())
+      self.__nsec3_names[name] = self.__nsec3_names.get(name, 0) | rrs.get_types()
+    
+  def __nsec3_expected(self, apex):
+    '''
+    Returns a dictionary of owner names, which should have NSEC3 record. I{Key}
+    is owner name, value a tuple C{(<required>, <types>)}. With opt-out NSEC3
+    record is not required for insecure delegations and for empty
+    non-terminals, which exist only because of them (see
+    U{RFC 5155, section 7.1<http://tools.ietf.org/html/rfc5155#section-7.1>}).
+    Empty non-terminal is required, when some name below it is required.
+    Types are a bitset of types expected in Type Bitmap field of the record,
+    only NS and DS types are authoritative at delegations and there is no
+    RRSIG type for insecure ones. Names below delegations (glue) are left out.
+    '''
+    ns = DNSWire.type_bit(ldns.LDNS_RR_TYPE_NS)
+    ds = DNSWire.type_bit(ldns.LDNS_RR_TYPE_DS)
+    rrsig = DNSWire.type_bit(ldns.LDNS_RR_TYPE_RRSIG)
+    apex_len = len(DNSWire.read_name(DNSWire.name_to_wire(apex), 0)[0])
+    cuts = ZoneCuts(apex)
+    for (name, types) in self.__nsec3_names.items():
+      if types & ns:
+        cuts.add(name)
+    ret = {}
+    
+    for (name, types) in self.__nsec3_names.items():
+      status = cuts.classify(name)
+      if status in (ZoneCuts.OCCLUDED, ZoneCuts.OUTSIDE): #glue or out of zone
+        continue
+      
+      if status == ZoneCuts.DELEGATION:
+        types &= ns | ds
+        if types & ds:
+          types |= rrsig
+        ret[name] = (not (self.__nsec3_optout and not types & ds), types)
+      else:
+        ret[name] = (True, types | rrsig)
+      
+      required = ret[name][0] #authoritative data or secure delegation below
+      labels = DNSWire.read_name(DNSWire.name_to_wire(name), 0)[0]
+      parents = [DNSWire.name_to_str(labels[i:]) for i in range(1, len(labels) - apex_len)]
+      for p in parents:
+        if not self.__nsec3_names.has_key(p): #empty non-terminal, no types
+          ret[p] = (ret.get(p, (False, 0))[0] or required, 0)
+    
+    return ret
+    
+  def verify_nsec_chain(self, apex):
+    '''
+    Verifies, that NSEC records seen by L{verify_nsecs()} form one closed chain
+    in canonical order (see L{NSECChain.verify()}). Should be called once at
+    the end of checking the entire zone.
+    
+    For zones secured by NSEC3 verifies, that NSEC3 records form one closed
+    chain in order of hashes, that each owner name has NSEC3 record with its
+    hash and that Type Bitmap field of the record matches types of the owner
+    name (see L{RRCollection.verify_type_bitmap()}). Hashes are computed using
+    salt and iterations from NSEC3PARAM record by L{NSEC3Hasher}.
+    
+    @param apex: Zone apex (SOA owner name).
+    @type apex: String
+    '''
+    self.__nsec_chain.verify(apex)
+    
+    if not self.__nsec3_chain.count and self.__nsec3_params is None: #no NSEC3
+      return
+    
+    if self.__nsec3_params is None:
+      logging.error(apex + " NSEC3PARAM record not present, NSEC3 coverage can't be verified.")
+      self.__nsec3_chain.verify(apex)
+      return
+    
+    (alg, iterations, salt) = self.__nsec3_params
+    if alg != 1:
+      logging.error(apex + " NSEC3 hash algorithm " + str(alg) + " is not known, NSEC3 coverage " +
+                    "can't be verified.")
+      self.__nsec3_chain.verify(apex)
+      return
+    
+    expected = self.__nsec3_expected(apex)
+    hashes = self.__hasher.hash(expected.keys(), salt, iterations)
+    self.__nsec3_chain.verify(apex, sorted([(hashes[name], name, expected[name][0]) for name in expected]))
+    
+    for name in sorted(expected.keys(), key = DNSWire.canonical_key):
+      bitmap = self.__nsec3_bitmaps.get(hashes[name])
+      if bitmap is not None: #missing records are reported by chain check
+        RRCollection.verify_type_bitmap(name, "NSEC3", expected[name][1], bitmap)
+    
   def verify_ds_records(self, rrs):
     '''
     Checks if all signing algorithms from DS records for current zone are used
@@ -0,0 +1,139 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains index of zone cuts (delegation points) of a zone, so authoritative
+data can be told from data occluded by a delegation (glue).
+
+  - B{File}: I{ZoneCuts.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import struct
+import logging
+
+import DNSWire
+
+NS_TYPE = 2
+'''Type number of NS record.'''
+
+class ZoneCuts(object):
+  '''
+  Trie of labels of zone cuts (owner names of NS records below the zone
+  apex, see U{RFC 2181, section 6<http://tools.ietf.org/html/rfc2181#section-6>}).
+  Each node is a dictionary of child nodes by lower case label, key None
+  marks a zone cut. A name is classified by walking its labels from the apex,
+  so it takes time proportional to its label depth, not to the count of
+  zone cuts.
+  '''
+
+  AUTHORITATIVE = 0
+  '''Name classification - authoritative data of the zone.'''
+  DELEGATION = 1
+  '''Name classification - zone cut itself (NS, DS and NSEC records are authoritative).'''
+  OCCLUDED = 2
+  '''Name classification - below a zone cut (glue).'''
+  OUTSIDE = 3
+  '''Name classification - outside of the zone.'''
+
+  def __init__(self, apex):
+    '''
+    @param apex: Zone apex (SOA owner name).
+    '''
+    self.apex = DNSWire.canonical_name(apex)
+    '''Zone apex in lower case presentation format.'''
+    self.count = 0
+    '''Count of zone cuts.'''
+    self.__apex_labels = self.__split(self.apex)
+    self.__root = {}
+
+  @staticmethod
+  def __split(name):
+    '''
+    Returns lower case labels of a name from the rightmost one.
+    '''
+    labels = [l.lower() for l in DNSWire.read_name(DNSWire.name_to_wire(name), 0)[0]]
+    labels.reverse()
+    return labels
+
+  def __labels(self, name):
+    '''
+    Returns labels of a name below the zone apex (from the apex) or None, if
+    the name is outside of the zone.
+    '''
+    labels = self.__split(name)
+    if labels[:len(self.__apex_labels)] != self.__apex_labels:
+      return None
+    return labels[len(self.__apex_labels):]
+
+  def add(self, name):
+    '''
+    Adds a zone cut. The zone apex and names outside of the zone are ignored.
+    '''
+    labels = self.__labels(name)
+    if not labels:
+      return
+
+    node = self.__root
+    for label in labels:
+      node = node.setdefault(label, {})
+    if not node.has_key(None):
+      node[None] = True
+      self.count += 1
+
+  def classify(self, name):
+    '''
+    Returns L{AUTHORITATIVE}, L{DELEGATION}, L{OCCLUDED} or L{OUTSIDE} for
+    given name.
+    '''
+    labels = self.__labels(name)
+    if labels is None:
+      return self.OUTSIDE
+
+    node = self.__root
+    for i in range(len(labels)):
+      node = node.get(labels[i])
+      if node is None: #no zone cut on the way
+        return self.AUTHORITATIVE
+      if node.has_key(None):
+        if i == len(labels) - 1:
+          return self.DELEGATION
+        return self.OCCLUDED
+    return self.AUTHORITATIVE
+
+  def is_glue(self, name):
+    '''
+    Returns True, when given name is below a zone cut.
+    '''
+    return self.classify(name) == self.OCCLUDED
+
+  @staticmethod
+  def from_messages(apex, path):
+    '''
+    Builds the trie in a prepass over a file with zone transfer (messages
+    preceded by their lengths, as written by L{AXFRClient.AXFRFetcher} or
+    L{ZoneSpool.ZoneSpool}). Only owner names and types are read, records are
+    not parsed. Returns None, when the file can't be read.
+
+    @param apex: Zone apex.
+    @param path: Path to the file.
+    '''
+    cuts = ZoneCuts(apex)
+    try:
+      f = open(path, "rb")
+      try:
+        while True:
+          head = f.read(2)
+          if len(head) < 2:
+            break
+          data = f.read(struct.unpack("!H", head)[0])
+          for (owner, rr_type) in DNSWire.answer_records(data):
+            if rr_type == NS_TYPE:
+              cuts.add(DNSWire.name_to_str(owner))
+      finally:
+        f.close()
+    except (IOError, ValueError), detail:
+      logging.debug("Zone cuts of " + str(apex) + " can't be read from " + path + " (" + str(detail) + ").")
+      return None
+
+    return cuts
@@ -0,0 +1,278 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains a local spool of transferred zones, so a zone can be checked again
+(for example with different checks) without another zone transfer.
+
+  - B{File}: I{ZoneSpool.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import os
+import struct
+import logging
+
+import DNSWire
+from AXFRClient import AXFRReader
+from ZoneCuts import ZoneCuts
+from Exceptions import FileError
+
+class SpoolWriter(object):
+  '''
+  Writes one zone transfer to spool files. Use L{ZoneSpool.writer()} to
+  obtain an instance. Files are written under temporary names, until
+  L{commit()} is called.
+  '''
+
+  def __init__(self, spool, domain):
+    '''
+    @param spool: Spool, to which is the transfer written.
+    @type spool: L{ZoneSpool}
+    @param domain: Transferred domain.
+    '''
+    self.domain = domain
+    self.__spool = spool
+    self.__tmp = spool.path(domain, "tmp")
+    self.__data = open(self.__tmp + ".spool", "wb")
+    self.__offset = 0
+    '''Position of the next message in data file.'''
+    self.__index = {}
+    '''Offsets of messages with records of an owner, I{key} is owner name in wire format.'''
+    self.__owners = []
+    '''Owner names in order, in which they first appeared.'''
+    self.records = 0
+    '''Count of written records.'''
+
+  def write(self, data):
+    '''
+    Writes a message of the transfer and adds its owner names to the index.
+    Raises C{ValueError}, when the message is malformed.
+
+    @param data: Message in wire format.
+    '''
+    records = DNSWire.answer_records(data)
+    for (owner, rr_type) in records:
+      key = DNSWire.name_to_wire(DNSWire.name_to_str(owner))
+      offsets = self.__index.get(key)
+      if offsets is None:
+        offsets = self.__index[key] = []
+        self.__owners.append(key)
+      if not offsets or offsets[-1] != self.__offset:
+        offsets.append(self.__offset)
+
+    self.__data.write(struct.pack("!H", len(data)) + data)
+    self.__offset += len(data) + 2
+    self.records += len(records)
+
+  def commit(self, serial):
+    '''
+    Writes the index and renames both files to their names for given serial
+    number. Older versions of the zone are removed, only L{ZoneSpool.keep}
+    newest are kept.
+
+    @param serial: Serial number from SOA record of the transferred zone.
+    '''
+    self.__data.close()
+
+    index = open(self.__tmp + ".idx", "wb")
+    try:
+      index.write(ZoneSpool.MAGIC + struct.pack("!III", int(serial), self.records, len(self.__owners)))
+      for key in self.__owners:
+        offsets = self.__index[key]
+        index.write(key + struct.pack("!H", len(offsets)))
+        index.write(struct.pack("!%dI" % len(offsets), *offsets))
+    finally:
+      index.close()
+
+    path = self.__spool.path(self.domain, serial)
+    os.rename(self.__tmp + ".spool", path + ".spool")
+    os.rename(self.__tmp + ".idx", path + ".idx") #index last, it marks a complete version
+    self.__spool.prune(self.domain)
+
+  def abort(self):
+    '''
+    Removes files of an incomplete transfer.
+    '''
+    self.__data.close()
+    for ext in (".spool", ".idx"):
+      if os.path.exists(self.__tmp + ext):
+        os.remove(self.__tmp + ext)
+
+class ZoneSpool(object):
+  '''
+  Directory with transferred zones. Each version of a zone is kept in two
+  files named by the zone and its serial number:
+
+    - I{<zone>.<serial>.spool} - messages of the transfer in wire format, each
+      preceded by its length (as they were received over TCP),
+    - I{<zone>.<serial>.idx} - index of owner names. It starts with
+      L{MAGIC}, serial number, count of records and count of owner names
+      (32 bit each), then for each owner name follows the name in wire format,
+      count of messages with its records (16 bit) and their offsets in data
+      file (32 bit each).
+
+  The index allows reading records of one owner name without reading the
+  whole transfer (see L{lookup()}).
+  '''
+
+  MAGIC = "DSPI"
+  '''Identifier at the start of index files.'''
+
+  directory = "/tmp/dnssec_zone_spool"
+  '''Default spool directory.'''
+
+  keep = 2
+  '''Count of versions of one zone kept in the spool.'''
+
+  def __init__(self, directory = None):
+    '''
+    @param directory: Spool directory, default is L{directory}. It is created,
+    when it does not exist.
+    '''
+    if directory is not None:
+      self.directory = directory
+
+    if not os.path.isdir(self.directory):
+      try:
+        os.makedirs(self.directory)
+      except OSError, detail:
+        raise FileError("Spool directory " + self.directory + " can't be created (" +
+                        str(detail) + ").")
+
+  def path(self, domain, serial):
+    '''
+    Returns path to files (without extension) of given version of a zone.
+    '''
+    return os.path.join(self.directory, DNSWire.canonical_name(domain) + str(serial))
+
+  def serials(self, domain):
+    '''
+    Returns sorted list of serial numbers of complete versions of given zone.
+    '''
+    prefix = DNSWire.canonical_name(domain)
+    ret = []
+    for fname in os.listdir(self.directory):
+      if fname.startswith(prefix) and fname.endswith(".idx"):
+        serial = fname[len(prefix):-len(".idx")]
+        if serial.isdigit():
+          ret.append(int(serial))
+    ret.sort()
+    return ret
+
+  def prune(self, domain):
+    '''
+    Removes older versions of given zone, so only L{keep} versions remain.
+    '''
+    for serial in self.serials(domain)[:-self.keep]:
+      path = self.path(domain, serial)
+      for ext in (".idx", ".spool"): #index first, so the version is not seen as complete
+        if os.path.exists(path + ext):
+          os.remove(path + ext)
+
+  def writer(self, domain):
+    '''
+    Returns L{SpoolWriter} for a new transfer of given zone. On error a warning
+    is written out using L{logging} module and None is returned.
+    '''
+    try:
+      return SpoolWriter(self, domain)
+    except IOError, detail:
+      logging.warning("Spool of " + str(domain) + " can't be written (" + str(detail) + ").")
+      return None
+
+  def __latest(self, domain, serial):
+    '''
+    Returns given serial number or the highest one available. Raises
+    L{FileError}, when the zone is not in the spool.
+    '''
+    if serial is None:
+      serials = self.serials(domain)
+      if not serials:
+        raise FileError("Zone " + str(domain) + " is not in spool " + self.directory + ".")
+      serial = serials[-1]
+    return serial
+
+  def reader(self, domain, serial = None):
+    '''
+    Returns started L{AXFRReader} replaying given version of a zone. Raises
+    L{FileError}, when the version is not in the spool.
+
+    @param serial: Serial number of the version, the newest one when None.
+    '''
+    path = self.path(domain, self.__latest(domain, serial)) + ".spool"
+    reader = AXFRReader(domain)
+    try:
+      reader.start_spool(path)
+    except IOError, detail:
+      raise FileError("Spool file " + path + " can't be opened (" + str(detail) + ").")
+    return reader
+
+  def cuts(self, domain, serial = None):
+    '''
+    Returns L{ZoneCuts} of given version of a zone read from the data file or
+    None, when it can't be read. Raises L{FileError}, when the zone is not in
+    the spool.
+    '''
+    return ZoneCuts.from_messages(domain, self.path(domain, self.__latest(domain, serial)) + ".spool")
+
+  def index(self, domain, serial = None):
+    '''
+    Reads index of given version of a zone. Raises L{FileError}, when the
+    index can't be read.
+
+    @return: Tuple C{(<serial>, <count of records>, <dictionary>)}, where
+    I{key} of the dictionary is owner name (see
+    L{DNSWire.canonical_name()}) and value a list of offsets of messages in
+    data file.
+    '''
+    path = self.path(domain, self.__latest(domain, serial)) + ".idx"
+    try:
+      data = open(path, "rb").read()
+    except IOError, detail:
+      raise FileError("Spool index " + path + " can't be opened (" + str(detail) + ").")
+
+    try:
+      if data[:4] != self.MAGIC:
+        raise ValueError("Unknown format.")
+      (serial, records, count) = struct.unpack("!III", data[4:16])
+      offset = 16
+      owners = {}
+      for i in range(count):
+        (labels, offset) = DNSWire.read_name(data, offset)
+        n = struct.unpack("!H", data[offset:offset + 2])[0]
+        owners[DNSWire.name_to_str(labels)] = list(struct.unpack("!%dI" % n, data[offset + 2:offset + 2 + 4 * n]))
+        offset += 2 + 4 * n
+    except (ValueError, struct.error), detail:
+      raise FileError("Spool index " + path + " is broken (" + str(detail) + ").")
+
+    return (serial, records, owners)
+
+  def lookup(self, domain, owner, serial = None):
+    '''
+    Returns a list of records of given owner name from given version of a
+    zone, reading only messages, which contain them.
+
+    @return: List of
+    U{ldns_rr<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr.html>}
+    objects.
+    '''
+    (serial, records, owners) = self.index(domain, serial)
+    owner = DNSWire.canonical_name(owner)
+    ret = []
+
+    data = open(self.path(domain, serial) + ".spool", "rb")
+    try:
+      for offset in owners.get(owner, []):
+        data.seek(offset)
+        length = struct.unpack("!H", data.read(2))[0]
+        pkt = DNSWire.wire2pkt(data.read(length))
+        if pkt is None:
+          raise FileError("Spool file of " + str(domain) + " is broken.")
+        for rr in pkt.answer().rrs():
+          if DNSWire.canonical_name(str(rr.owner())) == owner:
+            ret.append(rr.clone())
+    finally:
+      data.close()
+
+    return ret
@@ -0,0 +1,647 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains a resolver, which can have many queries in flight at the same time.
+It is used by L{ZoneChecker.SafeResolver} for all queries except zone
+transfers.
+
+  - B{File}: I{AsyncResolver.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import time
+import errno
+import socket
+import select
+import struct
+import random
+import logging
+
+import DNSWire
+from Metrics import TransportMetrics
+
+RCODE_SERVFAIL = 2
+'''Response code - server failure.'''
+RCODE_REFUSED = 5
+'''Response code - query refused.'''
+
+class ServerHealth(object):
+  '''
+  Tracks smoothed round trip time (RTT) and failures of name servers, so the
+  fastest healthy server can be asked first. A server, that failed, is put
+  aside for a backoff time, which doubles with every next failure in a row.
+  
+  The object is meant to live during the whole run of the application, so
+  knowledge about servers is not lost when the next zone is checked.
+  '''
+  
+  alpha = 0.125
+  '''Weight of a new RTT sample in smoothed RTT (as in RFC 6298).'''
+  backoff_min = 1.0
+  '''Backoff time (in seconds) after the first failure.'''
+  backoff_max = 300.0
+  '''The highest possible backoff time (in seconds).'''
+  
+  def __init__(self):
+    self.__srtt = {}
+    '''Smoothed RTT (in seconds) of servers, I{key} is IP address.'''
+    self.__failures = {}
+    '''Count of failures in a row of servers, I{key} is IP address.'''
+    self.__backoff = {}
+    '''Time until which should be servers put aside, I{key} is IP address.'''
+    
+  def __sample(self, server, rtt):
+    '''
+    Adds a RTT sample to smoothed RTT of given server.
+    '''
+    if self.__srtt.has_key(server):
+      self.__srtt[server] += self.alpha * (rtt - self.__srtt[server])
+    else: #first sample
+      self.__srtt[server] = rtt
+    
+  def success(self, server, rtt):
+    '''
+    Records an answer from given server received after given time (in
+    seconds). Clears its failures.
+    '''
+    self.__sample(server, rtt)
+    self.__failures.pop(server, None)
+    self.__backoff.pop(server, None)
+    
+  def slow(self, server, elapsed):
+    '''
+    Records that given server did not answer in given time (in seconds), but
+    it was not given up yet. Only its smoothed RTT is raised.
+    '''
+    if elapsed > self.__srtt.get(server, 0):
+      self.__sample(server, elapsed)
+    
+  def failure(self, server):
+    '''
+    Records a failure of given server (timeout, error or refused query) and
+    puts it aside for a backoff time.
+    '''
+    n = self.__failures.get(server, 0) + 1
+    self.__failures[server] = n
+    self.__backoff[server] = time.time() + min(self.backoff_max,
+                                               self.backoff_min * 2 ** (n - 1))
+    
+  def srtt(self, server):
+    '''
+    Returns smoothed RTT (in seconds) of given server or None, if not known.
+    '''
+    return self.__srtt.get(server)
+    
+  def order(self, servers):
+    '''
+    Returns given list of servers ordered by preference. Healthy servers go
+    first, the fastest ones before slower, servers not used yet before all of
+    them, so they get a chance. Servers put aside follow, those with sooner
+    end of backoff first. Servers with equal score keep their order.
+    
+    @param servers: List of IP addresses.
+    '''
+    now = time.time()
+    healthy = []
+    aside = []
+    
+    for i in range(len(servers)):
+      server = servers[i]
+      backoff = self.__backoff.get(server, 0)
+      if backoff > now:
+        aside.append((backoff, i, server))
+      else:
+        healthy.append((self.__srtt.get(server, 0), i, server))
+        
+    healthy.sort()
+    aside.sort()
+    return [x[2] for x in healthy + aside]
+
+class Connection(object):
+  '''
+  Persistent TCP connection to a name server used by L{AsyncResolver}. More
+  queries can be sent over it without waiting for answers (see
+  U{RFC 7766, section 6.2.1.1<http://tools.ietf.org/html/rfc7766#section-6.2.1.1>}).
+  '''
+
+  def __init__(self, server, sock):
+    self.server = server
+    '''IP address of the name server.'''
+    self.sock = sock
+    '''Connected socket.'''
+    self.pending = {}
+    '''Queries waiting for an answer, I{key} is message ID, value L{Query}.'''
+    self.buffer = ''
+    '''Received data not forming a whole message yet.'''
+    self.last_used = time.time()
+    '''Time of the last sent query or received answer.'''
+
+  def messages(self):
+    '''
+    Returns a list of whole messages (without length prefix) in L{buffer} and
+    removes them from it.
+    '''
+    ret = []
+    while len(self.buffer) >= 2:
+      length = struct.unpack("!H", self.buffer[:2])[0]
+      if len(self.buffer) < length + 2:
+        break
+      ret.append(self.buffer[2:length + 2])
+      self.buffer = self.buffer[length + 2:]
+    return ret
+
+class Query(object):
+  '''
+  State of one query handled by L{AsyncResolver}. The query is finished, when
+  its attribute L{done} is True, the answer is then in attribute L{answer}.
+  '''
+
+  def __init__(self, name, rr_type, rr_class, rd, timeout, servers):
+    '''
+    @param name: Queried domain name.
+    @param rr_type: Queried type number.
+    @param rr_class: Queried class number.
+    @param rd: Should be I{RD} flag set?
+    @param timeout: How long (in seconds) to wait for the answer.
+    @param servers: List of servers to be asked, in order of preference.
+    '''
+    self.name = str(name)
+    '''Queried domain name.'''
+    self.rr_type = int(rr_type)
+    '''Queried type number.'''
+    self.rr_class = int(rr_class)
+    '''Queried class number.'''
+    self.rd = rd
+    '''Should be I{RD} flag set?'''
+    self.question = (DNSWire.canonical_name(name), self.rr_type, self.rr_class)
+    '''Question, that has to be present in the answer (see L{DNSWire.question()}).'''
+    self.start = time.time()
+    '''Time when the query was submitted.'''
+    self.deadline = self.start + timeout
+    '''Time when the query times out.'''
+    self.servers = servers
+    '''List of servers to be asked, in order of preference.'''
+    self.sent = []
+    '''List of tuples C{(<server>, <message ID>, <time sent>)}.'''
+    self.tcp = []
+    '''List of tuples C{(<L{Connection}>, <message ID>, <time sent>)}.'''
+    self.next_server = 0
+    '''Index of the server, that should get the query next.'''
+    self.next_hedge = None
+    '''Time when the query should be sent to the next server, if not answered.'''
+    self.answer = None
+    '''U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>} with the answer or None.'''
+    self.server = None
+    '''Server, that sent the answer.'''
+    self.done = False
+    '''Is the query finished?'''
+
+class AsyncResolver(object):
+  '''
+  Sends queries over UDP and waits for their answers using a C{select()} loop,
+  so any number of queries can be in flight at the same time. Truncated
+  answers are fetched again over TCP.
+
+  TCP connections are kept open after the answer and used by next queries to
+  the same server, more queries can be in flight on one connection. A
+  connection is closed, when it was not used for L{tcp_idle} seconds. Count of
+  connections is limited by L{tcp_per_server} and L{tcp_total}.
+
+  Every query has its own timeout. When the first server does not answer
+  within L{hedge} seconds (or answers with SERVFAIL or REFUSED), the same query
+  is sent also to the next server and the first answer wins. Servers are
+  asked in order given by L{ServerHealth} object, which learns from every
+  query.
+
+  Queries are submitted by L{submit()} and processed by L{run()}, or by
+  convenience methods L{query()} and L{query_many()}.
+  '''
+
+  tcp_idle = 10.0
+  '''Time (in seconds) after which is an unused TCP connection closed.'''
+  tcp_per_server = 2
+  '''The highest number of TCP connections to one server.'''
+  tcp_total = 16
+  '''The highest number of TCP connections to all servers.'''
+  tcp_pipeline = 32
+  '''Number of queries in flight on one connection, after which a new one is opened.'''
+
+  def __init__(self, servers, port = 53, timeout = 3.0, hedge = 0.5, health = None, ports = None,
+               metrics = None):
+    '''
+    @param servers: List of name servers IP addresses.
+    @type servers: [String, ...]
+    @param port: Port of the name servers, if not set in L{ports}.
+    @param timeout: Default query timeout (in seconds).
+    @param hedge: Time (in seconds) after which is an unanswered query sent
+    also to the next server.
+    @param health: Object tracking name servers health, that may be shared
+    with other resolvers. If not set, private one is created.
+    @type health: L{ServerHealth}
+    @param ports: Dictionary of ports of some name servers, I{key} is IP
+    address.
+    @param metrics: Object collecting transport metrics, that may be shared
+    with other resolvers. If not set, private one is created.
+    @type metrics: L{Metrics.TransportMetrics}
+    '''
+    self.servers = list(servers)
+    '''List of name servers IP addresses.'''
+    self.port = port
+    '''Port of the name servers, if not set in L{ports}.'''
+    self.ports = dict(ports or {})
+    '''Ports of name servers, I{key} is IP address.'''
+    self.timeout = timeout
+    '''Default query timeout (in seconds).'''
+    self.hedge = hedge
+    '''Time (in seconds) after which is an unanswered query sent to the next server.'''
+    
+    if health is None:
+      health = ServerHealth()
+    
+    self.health = health
+    '''L{ServerHealth} object deciding, which server should be asked first.'''
+    
+    if metrics is None:
+      metrics = TransportMetrics()
+    
+    self.metrics = metrics
+    '''L{Metrics.TransportMetrics} object counting sent queries and RTTs.'''
+
+    self.__sock = None
+    '''UDP socket shared by all queries.'''
+    self.__inflight = {}
+    '''Sent queries, I{key} is a tuple C{(<server>, <message ID>)}.'''
+    self.__queries = []
+    '''List of unfinished L{Query} objects.'''
+    self.__conns = []
+    '''List of open TCP L{Connection} objects.'''
+    self.__tcp_waiting = []
+    '''List of tuples C{(<server>, <L{Query}>)} waiting for a free TCP connection.'''
+
+  def __socket(self):
+    '''
+    Returns UDP socket used for sending queries, creates it if needed.
+    '''
+    if self.__sock is None:
+      self.__sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+      self.__sock.setblocking(0)
+    return self.__sock
+
+  def close(self):
+    '''
+    Closes all sockets. Unfinished queries are finished without an answer.
+    '''
+    for q in list(self.__queries):
+      self.__finish(q, None)
+
+    if self.__sock is not None:
+      self.__sock.close()
+      self.__sock = None
+
+    for conn in list(self.__conns):
+      self.__close_conn(conn)
+
+  def __close_conn(self, conn):
+    '''
+    Closes given TCP connection. Queries waiting for an answer on it are sent
+    again over a new one.
+    '''
+    conn.sock.close()
+    self.__conns.remove(conn)
+
+    for q in conn.pending.values():
+      q.tcp = [t for t in q.tcp if t[0] is not conn]
+      if not q.done:
+        self.__tcp_waiting.append((conn.server, q))
+
+  def __close_idle(self, now):
+    '''
+    Closes TCP connections, which were not used for L{tcp_idle} seconds.
+    '''
+    for conn in list(self.__conns):
+      if not conn.pending and now - conn.last_used >= self.tcp_idle:
+        self.__close_conn(conn)
+
+  def __connection(self, server, deadline):
+    '''
+    Returns a TCP connection to given server, which should be used for next
+    query. Opens a new one, when all are busy and limits allow it. Returns
+    None, when no connection can be used now. Raises C{socket.error}, when
+    the connection can't be opened.
+    '''
+    conns = [c for c in self.__conns if c.server == server]
+    conns.sort(key = lambda c: len(c.pending))
+
+    if conns and len(conns[0].pending) < self.tcp_pipeline:
+      return conns[0]
+
+    if len(conns) < self.tcp_per_server and len(self.__conns) >= self.tcp_total:
+      idle = [c for c in self.__conns if not c.pending]
+      if idle: #make room for a new connection
+        idle.sort(key = lambda c: c.last_used)
+        self.__close_conn(idle[0])
+
+    if len(conns) >= self.tcp_per_server or len(self.__conns) >= self.tcp_total:
+      if conns: #all busy, use the least busy one
+        return conns[0]
+      return None
+
+    sock = socket.create_connection((server, self.ports.get(server, self.port)),
+                                    max(0.1, deadline - time.time()))
+    conn = Connection(server, sock)
+    self.__conns.append(conn)
+    return conn
+
+  def __new_id(self, server, conn = None):
+    '''
+    Returns a random message ID, that is not used by any query in flight to
+    given server (and on given TCP connection).
+    '''
+    qid = random.randint(0, 0xFFFF)
+    while self.__inflight.has_key((server, qid)) or (conn and conn.pending.has_key(qid)):
+      qid = random.randint(0, 0xFFFF)
+    return qid
+
+  def __send(self, q):
+    '''
+    Sends given query to the next server, which has not got it yet. Returns
+    False, if there is no such server or sending failed for all of them.
+    '''
+    while q.next_server < len(q.servers):
+      server = q.servers[q.next_server]
+      q.next_server += 1
+      qid = self.__new_id(server)
+
+      try:
+        self.__socket().sendto(DNSWire.build_query(qid, q.name, q.rr_type, q.rr_class, q.rd),
+                               (server, self.ports.get(server, self.port)))
+      except socket.error, detail:
+        logging.debug("Can't send query to " + server + ": " + str(detail))
+        self.health.failure(server)
+        continue
+
+      self.__inflight[(server, qid)] = q
+      self.metrics.inc('sent')
+      if q.sent or q.tcp:
+        self.metrics.inc('retry')
+      q.sent.append((server, qid, time.time()))
+      q.next_hedge = time.time() + self.hedge
+      return True
+
+    q.next_hedge = None
+    return False
+
+  def __send_tcp(self, q, server):
+    '''
+    Sends given query to given server over TCP. When no connection can be
+    used now, the query waits in L{__tcp_waiting}. When the server can't be
+    connected, the query is sent to the next server over UDP. When sending
+    fails, the connection is closed and the query is sent again over a new
+    one (see L{__close_conn()}).
+    '''
+    try:
+      conn = self.__connection(server, q.deadline)
+    except socket.error, detail:
+      logging.debug("Can't connect to " + server + " over TCP: " + str(detail))
+      self.health.failure(server)
+      self.__send(q)
+      return
+      
+    if conn is None:
+      self.__tcp_waiting.append((server, q))
+      return
+
+    qid = self.__new_id(server, conn)
+    msg = DNSWire.build_query(qid, q.name, q.rr_type, q.rr_class, q.rd)
+
+    conn.pending[qid] = q #registered first, so it is sent again, if the connection fails
+    try:
+      conn.sock.sendall(struct.pack("!H", len(msg)) + msg)
+    except socket.error, detail:
+      logging.debug("Error while querying " + server + " over TCP: " + str(detail))
+      self.health.failure(server)
+      self.__close_conn(conn)
+      return
+
+    conn.last_used = time.time()
+    self.metrics.inc('sent')
+    q.tcp.append((conn, qid, conn.last_used))
+    q.next_hedge = None #answer is on the way
+
+  def __finish(self, q, pkt, server = None, conn = None):
+    '''
+    Finishes given query with given answer and updates health of the servers
+    it was sent to.
+    
+    @param conn: TCP L{Connection}, on which the answer was received, None if
+    received over UDP.
+    '''
+    q.answer = pkt
+    q.server = server
+    q.done = True
+    now = time.time()
+    
+    if pkt is None:
+      self.metrics.inc('timeout')
+    else:
+      self.metrics.inc('answered')
+      if q.servers and server != q.servers[0]:
+        self.metrics.inc('failover')
+
+    for (s, qid, sent) in q.sent:
+      if not self.__inflight.pop((s, qid), None): #already answered (refused)
+        continue
+      if s == server and conn is None:
+        self.health.success(s, now - sent)
+        self.metrics.rtt(s, now - sent)
+      elif pkt is None and now >= q.deadline: #gave up waiting
+        self.health.failure(s)
+      else: #other server was faster
+        self.health.slow(s, now - sent)
+
+    for (c, qid, sent) in q.tcp:
+      c.pending.pop(qid, None)
+      if c is conn:
+        self.health.success(c.server, now - sent)
+        self.metrics.rtt(c.server, now - sent)
+
+    self.__tcp_waiting = [w for w in self.__tcp_waiting if w[1] is not q]
+
+    if q in self.__queries:
+      self.__queries.remove(q)
+
+  def submit(self, name, rr_type, rr_class = 1, rd = True, timeout = None, tcp = False):
+    '''
+    Sends a query to the first server and returns immediately. The answer is
+    received by L{run()}.
+
+    @param name: Queried domain name.
+    @param rr_type: Queried type number.
+    @param rr_class: Queried class number.
+    @param rd: Should be I{RD} flag set?
+    @param timeout: Query timeout (in seconds), default is L{timeout}.
+    @param tcp: Should be the query sent over TCP right away?
+    @return: L{Query} object.
+    '''
+    if timeout is None:
+      timeout = self.timeout
+
+    q = Query(name, rr_type, rr_class, rd, timeout, self.health.order(self.servers))
+    self.__queries.append(q)
+
+    if tcp:
+      if q.servers:
+        self.__send_tcp(q, q.servers[0])
+      else:
+        self.__finish(q, None)
+    elif not self.__send(q): #no server available
+      self.__finish(q, None)
+
+    return q
+
+  def run(self, wait_for = None):
+    '''
+    Processes answers, timeouts and hedged requests until all submitted
+    queries (or only given ones) are finished.
+
+    @param wait_for: List of L{Query} objects to wait for, all if not set.
+    '''
+    self.__close_idle(time.time())
+
+    while self.__queries:
+      if wait_for is not None and not [q for q in wait_for if not q.done]:
+        break
+
+      now = time.time()
+      wake = None
+
+      waiting = self.__tcp_waiting
+      self.__tcp_waiting = []
+      for (server, q) in waiting: #maybe some connection is free now
+        if not q.done:
+          self.__send_tcp(q, server)
+
+      for q in list(self.__queries):
+        if now >= q.deadline: #no answer in time
+          self.__finish(q, None)
+          continue
+
+        if q.next_hedge is not None and now >= q.next_hedge: #try also next server
+          self.__send(q)
+
+        for t in (q.deadline, q.next_hedge):
+          if t is not None and (wake is None or t < wake):
+            wake = t
+
+      if not self.__queries:
+        break
+
+      socks = [self.__socket()] + [c.sock for c in self.__conns]
+      if self.__tcp_waiting: #check for free connections soon
+        wake = min(wake, now + 0.05)
+
+      for sock in select.select(socks, [], [], max(0, wake - now))[0]:
+        if sock is self.__sock:
+          self.__receive()
+        else:
+          self.__receive_tcp([c for c in self.__conns if c.sock is sock][0])
+
+  def __receive(self):
+    '''
+    Reads all waiting answers from the socket and finishes matching queries.
+    '''
+    while True:
+      try:
+        (data, addr) = self.__socket().recvfrom(0xFFFF)
+      except socket.error, detail:
+        if detail.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+          logging.debug("Error while receiving answer: " + str(detail))
+        return
+
+      if len(data) < DNSWire.HEADER_LEN:
+        continue
+
+      q = self.__inflight.get((addr[0], DNSWire.message_id(data)))
+      if q is None or q.done or DNSWire.question(data) != q.question:
+        continue #not an answer to our query
+
+      rcode = DNSWire.message_flags(data) & 0x000F
+      if rcode in (RCODE_SERVFAIL, RCODE_REFUSED) and q.next_server < len(q.servers):
+        del self.__inflight[(addr[0], DNSWire.message_id(data))]
+        self.health.failure(addr[0])
+        self.__send(q)
+        continue #other server may do better
+
+      if DNSWire.is_truncated(data): #ask again over TCP, stop other UDP tries
+        del self.__inflight[(addr[0], DNSWire.message_id(data))]
+        q.next_server = len(q.servers)
+        self.metrics.inc('tcp')
+        self.__send_tcp(q, addr[0])
+        continue
+
+      pkt = DNSWire.wire2pkt(data)
+      if pkt is not None:
+        self.__finish(q, pkt, addr[0])
+
+  def __receive_tcp(self, conn):
+    '''
+    Reads data from given TCP connection and finishes queries with whole
+    answers received.
+    '''
+    try:
+      data = conn.sock.recv(0xFFFF)
+    except socket.error, detail:
+      logging.debug("Error while receiving answer from " + conn.server + " over TCP: " + str(detail))
+      data = ''
+
+    if not data: #closed by server
+      self.__close_conn(conn)
+      return
+
+    conn.buffer += data
+    conn.last_used = time.time()
+
+    for msg in conn.messages():
+      if len(msg) < DNSWire.HEADER_LEN:
+        continue
+      q = conn.pending.get(DNSWire.message_id(msg))
+      if q is None or q.done or DNSWire.question(msg) != q.question:
+        continue
+
+      pkt = DNSWire.wire2pkt(msg)
+      if pkt is not None:
+        self.__finish(q, pkt, conn.server, conn)
+
+  def query(self, name, rr_type, rr_class = 1, rd = True, timeout = None, tcp = False):
+    '''
+    Sends a query and waits for its answer. Other queries in flight are
+    processed meanwhile. See L{submit()} for parameters.
+
+    @return: U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    instance or None, if no server answered in time.
+    '''
+    q = self.submit(name, rr_type, rr_class, rd, timeout, tcp)
+    self.run([q])
+    return q.answer
+
+  def query_many(self, queries, rr_class = 1, rd = True, timeout = None):
+    '''
+    Sends all given queries at once and waits for their answers.
+
+    @param queries: List of tuples C{(<name>, <type>)}.
+    @return: Dictionary, I{key} is a tuple from L{queries}, value is
+    U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+    instance or None, if no server answered in time.
+    '''
+    submitted = {}
+    for key in queries:
+      if not submitted.has_key(key):
+        submitted[key] = self.submit(key[0], key[1], rr_class, rd, timeout)
+
+    self.run(submitted.values())
+
+    answers = {}
+    for key in submitted.keys():
+      answers[key] = submitted[key].answer
+    return answers
@@ -0,0 +1,409 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains functions for working with DNS messages in wire format (see
+U{RFC 1035, section 4<http://tools.ietf.org/html/rfc1035#section-4>}), which
+are needed for sending queries without
+U{ldns.ldns_resolver<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__resolver.html>}.
+
+  - B{File}: I{DNSWire.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import base64
+import string
+import binascii
+import struct
+import hashlib
+import ldns
+
+HEADER_LEN = 12
+'''Length of DNS message header.'''
+
+FLAG_QR = 0x8000
+'''Header flag - message is a response.'''
+FLAG_TC = 0x0200
+'''Header flag - message was truncated.'''
+FLAG_RD = 0x0100
+'''Header flag - recursion desired.'''
+
+EDNS_PAYLOAD = 4096
+'''UDP payload size announced in EDNS0 OPT record.'''
+
+TSIG_TYPE = 250
+'''Type number of TSIG record.'''
+
+B32HEX = string.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789ABCDEFGHIJKLMNOPQRSTUV')
+'''Translation from base32 to base32hex alphabet.'''
+
+BIT_REVERSE = string.maketrans(''.join([chr(i) for i in range(256)]),
+                               ''.join([chr(int('{:08b}'.format(i)[::-1], 2)) for i in range(256)]))
+'''Translation of each byte to the byte with reversed order of bits.'''
+
+def name_to_wire(name):
+  '''
+  Converts a domain name from presentation format to wire format (without
+  compression). Escaped characters (C{\\X} and C{\\DDD}) are supported.
+
+  @param name: Domain name, relative names are taken as absolute.
+  @type name: String
+  '''
+  name = str(name)
+  labels = []
+  label = ''
+  i = 0
+
+  while i < len(name):
+    c = name[i]
+    if c == '\\': #escaped character
+      if name[i + 1:i + 4].isdigit() and len(name[i + 1:i + 4]) == 3:
+        label += chr(int(name[i + 1:i + 4]))
+        i += 4
+      else:
+        label += name[i + 1:i + 2]
+        i += 2
+      continue
+    elif c == '.':
+      if label:
+        labels.append(label)
+      label = ''
+    else:
+      label += c
+    i += 1
+
+  if label:
+    labels.append(label)
+
+  return ''.join([chr(len(l)) + l for l in labels]) + '\x00'
+
+def read_name(data, offset):
+  '''
+  Reads a domain name from DNS message, following compression pointers.
+
+  Raises L{ValueError} when the name is malformed.
+
+  @param data: Whole DNS message.
+  @param offset: Position of the name in the message.
+  @return: Tuple C{(<list of labels>, <position after the name>)}.
+  '''
+  labels = []
+  end = None
+  jumps = 0
+
+  while True:
+    if offset >= len(data):
+      raise ValueError("Domain name exceeds message length.")
+
+    length = ord(data[offset])
+    if length & 0xC0 == 0xC0: #compression pointer
+      if offset + 1 >= len(data) or jumps > 127:
+        raise ValueError("Invalid compression pointer.")
+      if end is None:
+        end = offset + 2
+      offset = ((length & 0x3F) << 8) | ord(data[offset + 1])
+      jumps += 1
+    elif length == 0: #root label, end of name
+      if end is None:
+        end = offset + 1
+      return (labels, end)
+    else:
+      labels.append(data[offset + 1:offset + 1 + length])
+      offset += length + 1
+
+def name_to_str(labels):
+  '''
+  Converts a list of labels to lower case presentation format of a domain name
+  (ending with a dot). Special characters are escaped.
+  '''
+  if not labels:
+    return '.'
+
+  ret = ''
+  for label in labels:
+    for c in label.lower():
+      if c in '.\\()";$@':
+        ret += '\\' + c
+      elif ord(c) <= 32 or ord(c) >= 127:
+        ret += '\\%03d' % ord(c)
+      else:
+        ret += c
+    ret += '.'
+
+  return ret
+
+def canonical_name(name):
+  '''
+  Returns domain name in lower case presentation format ending with a dot, so
+  it can be compared with names returned by L{question()}.
+  '''
+  return name_to_str(read_name(name_to_wire(name), 0)[0])
+
+def canonical_key(name):
+  '''
+  Returns a key, by which domain names can be sorted in canonical order (see
+  U{RFC 4034, section 6.1<http://tools.ietf.org/html/rfc4034#section-6.1>}).
+  '''
+  labels = read_name(name_to_wire(name), 0)[0]
+  labels.reverse()
+  return tuple([l.lower() for l in labels])
+
+def sort_key(name):
+  '''
+  Returns a string, by which domain names can be sorted in canonical order,
+  like L{canonical_key()}, but compact enough to be written to a file. Labels
+  are in lower case from the rightmost one, zero bytes are escaped as
+  C{\\x00\\xff} and each label ends with C{\\x00\\x00}. See
+  L{sort_key_to_name()}.
+  '''
+  labels = read_name(name_to_wire(name), 0)[0]
+  labels.reverse()
+  return ''.join([l.lower().replace('\x00', '\x00\xff') + '\x00\x00' for l in labels])
+
+def sort_key_to_name(key):
+  '''
+  Converts a key returned by L{sort_key()} back to lower case presentation
+  format of the domain name.
+  '''
+  labels = [l.replace('\x00\xff', '\x00') for l in key.split('\x00\x00')[:-1]]
+  labels.reverse()
+  return name_to_str(labels)
+
+def nsec3_hash(name, salt, iterations):
+  '''
+  Returns hashed owner name of NSEC3 record (see
+  U{RFC 5155, section 5<http://tools.ietf.org/html/rfc5155#section-5>}) in
+  lower case base32hex without padding, like it is written in owner names and
+  next hashed owner name fields. Only SHA-1 (algorithm 1) is defined.
+
+  @param name: Domain name to be hashed.
+  @param salt: Salt in binary form (empty string for no salt).
+  @param iterations: Number of additional iterations.
+  '''
+  data = hashlib.sha1(name_to_wire(canonical_name(name)) + salt).digest()
+  for i in range(int(iterations)):
+    data = hashlib.sha1(data + salt).digest()
+  return base64.b32encode(data).translate(B32HEX).lower()
+
+def type_bitmap(data):
+  '''
+  Decodes type bitmap field of NSEC or NSEC3 record (see
+  U{RFC 4034, section 4.1.2<http://tools.ietf.org/html/rfc4034#section-4.1.2>})
+  from wire format to an integer bitset, where bit I{n} is set for type number
+  I{n}. Sets of types can be compared using bit operations then, see
+  L{bitmap_types()}.
+
+  Raises L{ValueError} when the field is malformed.
+  '''
+  bits = 0
+  offset = 0
+  while offset < len(data):
+    if offset + 2 > len(data):
+      raise ValueError("Type bitmap window block is truncated.")
+    (window, length) = struct.unpack("!BB", data[offset:offset + 2])
+    block = data[offset + 2:offset + 2 + length]
+    if length < 1 or length > 32 or len(block) < length:
+      raise ValueError("Type bitmap window block has invalid length.")
+    #the first bit of a block is the lowest type, so it is read as little
+    #endian number with reversed bits
+    bits |= int(binascii.hexlify(block.translate(BIT_REVERSE)[::-1]), 16) << (window * 256)
+    offset += 2 + length
+  return bits
+
+def type_bit(rr_type):
+  '''
+  Returns a bitset (see L{type_bitmap()}) with given type number only.
+  '''
+  return 1 << rr_type
+
+def bitmap_types(bits):
+  '''
+  Returns a list of type numbers set in given bitset (see L{type_bitmap()})
+  in ascending order.
+  '''
+  types = []
+  while bits:
+    low = bits & -bits
+    types.append(low.bit_length() - 1)
+    bits ^= low
+  return types
+
+def rdf_to_int(rdf):
+  '''
+  Returns integer field of
+  U{ldns_rdf<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rdf.html>}
+  object (like algorithm, key tag or TTL) read from its rdata in wire format,
+  so it does not have to be printed and parsed. Other objects are converted
+  from their string form, so types (see L{rdf_to_type()}) and times (see
+  L{ZoneChecker.TimeVerify.epoch()}) need their own functions.
+  '''
+  if hasattr(rdf, 'data_as_bytearray'):
+    return int(binascii.hexlify(str(rdf.data_as_bytearray())) or '0', 16)
+  return int(str(rdf))
+
+def rdf_to_type(rdf):
+  '''
+  Returns type number of type field of
+  U{ldns_rdf<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rdf.html>}
+  object (like C{Type Covered} of RRSIG record), other objects are converted
+  from type mnemonic.
+  '''
+  if hasattr(rdf, 'data_as_bytearray'):
+    return rdf_to_int(rdf)
+  return ldns.ldns_get_rr_type_by_name(str(rdf))
+
+def build_query(qid, qname, qtype, qclass = 1, rd = True, dnssec = True):
+  '''
+  Builds a query message in wire format. When L{dnssec} is set, EDNS0 OPT
+  record with I{DO} bit is added, so DNSSEC records are returned too.
+
+  @param qid: Message ID.
+  @param qname: Queried domain name.
+  @param qtype: Queried type number.
+  @param qclass: Queried class number.
+  @param rd: Should be I{RD} flag set?
+  @param dnssec: Should be DNSSEC records requested?
+  '''
+  flags = 0
+  if rd:
+    flags |= FLAG_RD
+
+  arcount = 0
+  if dnssec:
+    arcount = 1
+
+  msg = struct.pack("!HHHHHH", qid, flags, 1, 0, 0, arcount)
+  msg += name_to_wire(qname) + struct.pack("!HH", int(qtype), int(qclass))
+
+  if dnssec: #root owner, type OPT, payload size, DO bit, no data
+    msg += '\x00' + struct.pack("!HHIH", 41, EDNS_PAYLOAD, 0x8000, 0)
+
+  return msg
+
+def message_id(data):
+  '''
+  Returns ID of given DNS message.
+  '''
+  return struct.unpack("!H", data[:2])[0]
+
+def message_flags(data):
+  '''
+  Returns flags (second 16 bits of header) of given DNS message.
+  '''
+  return struct.unpack("!H", data[2:4])[0]
+
+def is_truncated(data):
+  '''
+  Returns True, if given DNS message has I{TC} flag set.
+  '''
+  return message_flags(data) & FLAG_TC != 0
+
+def question(data):
+  '''
+  Returns the first question of given DNS message as a tuple C{(<name>,
+  <type>, <class>)}, where name is in lower case presentation format. Returns
+  None, if there is no question or the message is malformed.
+  '''
+  try:
+    if len(data) < HEADER_LEN or struct.unpack("!H", data[4:6])[0] < 1:
+      return None
+    (labels, offset) = read_name(data, HEADER_LEN)
+    (qtype, qclass) = struct.unpack("!HH", data[offset:offset + 4])
+  except (ValueError, struct.error):
+    return None
+
+  return (name_to_str(labels), qtype, qclass)
+
+def split_tsig(data):
+  '''
+  Splits TSIG record (see U{RFC 2845<http://tools.ietf.org/html/rfc2845>})
+  from the end of given DNS message.
+
+  Raises L{ValueError} when the message is malformed.
+
+  @return: Tuple C{(<message>, <tsig>)}. Message is given message without
+  the TSIG record, with decreased I{ARCOUNT} and with the original ID, as it
+  was signed. TSIG is a tuple C{(<key name>, <algorithm name>, <time signed>,
+  <fudge>, <MAC>, <error>, <other data>)}, where names are in lower case
+  presentation format, or None, when the message has no TSIG record.
+  '''
+  try:
+    counts = struct.unpack("!HHHH", data[4:12])
+    if counts[3] == 0:
+      return (data, None)
+
+    offset = HEADER_LEN
+    for i in range(counts[0]): #skip questions
+      offset = read_name(data, offset)[1] + 4
+    for i in range(counts[1] + counts[2] + counts[3]): #TSIG has to be the last record
+      start = offset
+      offset = read_name(data, offset)[1]
+      (rr_type, rdlength) = struct.unpack("!H6xH", data[offset:offset + 10])
+      offset += 10 + rdlength
+    if offset > len(data):
+      raise ValueError("Message is shorter than its header says.")
+    if rr_type != TSIG_TYPE:
+      return (data, None)
+
+    end = offset
+    (name, offset) = read_name(data, start)
+    (algorithm, offset) = read_name(data, offset + 10)
+    (time_hi, time_lo, fudge, mac_size) = struct.unpack("!HIHH", data[offset:offset + 10])
+    mac = data[offset + 10:offset + 10 + mac_size]
+    offset += 10 + mac_size
+    (original_id, error, other_len) = struct.unpack("!HHH", data[offset:offset + 6])
+    other = data[offset + 6:offset + 6 + other_len]
+    if offset + 6 + other_len != end:
+      raise ValueError("TSIG record length does not match its fields.")
+  except struct.error:
+    raise ValueError("Message is shorter than its header says.")
+
+  msg = struct.pack("!H", original_id) + data[2:10] + struct.pack("!H", counts[3] - 1) + data[12:start]
+  return (msg, (name_to_str(name), name_to_str(algorithm), (time_hi << 32) | time_lo, fudge, mac,
+                error, other))
+
+def answer_records(data):
+  '''
+  Returns a list of tuples C{(<owner>, <type>)} of records in answer section
+  of given DNS message, so the records can be counted and indexed without
+  parsing the whole message. Owner is a list of labels.
+
+  Raises L{ValueError} when the message is malformed.
+  '''
+  try:
+    (qdcount, ancount) = struct.unpack("!HH", data[4:8])
+    offset = HEADER_LEN
+    for i in range(qdcount): #skip questions
+      offset = read_name(data, offset)[1] + 4
+
+    records = []
+    for i in range(ancount):
+      (owner, offset) = read_name(data, offset)
+      (rr_type, rdlength) = struct.unpack("!H6xH", data[offset:offset + 10])
+      offset += 10 + rdlength
+      records.append((owner, rr_type))
+  except struct.error:
+    raise ValueError("Message is shorter than its header says.")
+
+  if offset > len(data):
+    raise ValueError("Message is shorter than its header says.")
+  return records
+
+def answer_types(data):
+  '''
+  Returns a list of types of records in answer section of given DNS message.
+
+  Raises L{ValueError} when the message is malformed.
+  '''
+  return [rr_type for (owner, rr_type) in answer_records(data)]
+
+def wire2pkt(data):
+  '''
+  Converts DNS message in wire format to
+  U{ldns_pkt<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__pkt.html>}
+  object. Returns None, if the message can't be parsed.
+  '''
+  (status, pkt) = ldns.ldns_wire2pkt(data)
+  if status != ldns.LDNS_STATUS_OK:
+    return None
+  return pkt
@@ -0,0 +1,400 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+File:        LocalDNSServer.py
+Date:        19.10.2026
+Author:      agent, agent@local
+Description: Contains a small authoritative DNS server serving zone master
+             files on a local address, so resolver and AXFR tests can run
+             without any network. Latency and packet loss can be injected.
+
+             Can be run also from command line:
+             python LocalDNSServer.py [--port=<port>] [--latency=<seconds>]
+                                      [--loss=<probability>] <zone file> ...
+'''
+
+import sys
+import time
+import random
+import socket
+import select
+import struct
+import threading
+import ldns
+
+import DNSWire
+
+class LocalDNSServer(object):
+  '''
+  Authoritative DNS server answering queries over UDP and TCP from loaded zone
+  master files. Zone transfers (AXFR) are supported over TCP, TSIG is not.
+  Incremental zone transfers (IXFR) are answered with changes from versions
+  of a zone loaded earlier, when enabled.
+
+  Answers contain all records of queried type with RRSIGs covering them. DS
+  queries for a zone apex are answered from the parent zone, if it is loaded
+  too. Queries for names outside of loaded zones are refused.
+
+  The server runs in background threads started by start() and stopped by
+  stop().
+  '''
+
+  axfr_records = 100
+  '''The highest number of records in one zone transfer message.'''
+
+  def __init__(self, zones = (), address = "127.0.0.1", port = 5353, latency = 0.0, loss = 0.0,
+               udp_size = None, ixfr = False):
+    '''
+    @param zones: List of zone master files to be served.
+    @param address: Address to listen on.
+    @param port: Port to listen on (both UDP and TCP).
+    @param latency: Delay (in seconds) before sending each answer.
+    @param loss: Probability (0 to 1) of not answering a query over UDP.
+    @param udp_size: The largest answer (in bytes) sent over UDP, larger ones
+    are truncated. When None, size announced in the query is used.
+    @param ixfr: Answer IXFR queries? Otherwise they get an empty answer,
+    like from a server without IXFR support.
+    '''
+    self.address = address
+    self.port = port
+    self.latency = latency
+    self.loss = loss
+    self.udp_size = udp_size
+    self.ixfr = ixfr
+
+    self.queries = 0
+    '''Count of received queries.'''
+    self.dropped = 0
+    '''Count of queries dropped because of injected packet loss.'''
+    self.transfers = 0
+    '''Count of answered zone transfers.'''
+    self.connections = 0
+    '''Count of accepted TCP connections.'''
+    self.incremental = 0
+    '''Count of answered incremental zone transfers.'''
+
+    self.__zones = {}
+    '''Loaded zones, I{key} is zone apex, value is a L{Zone} object.'''
+    self.__history = {}
+    '''Previous versions of zones, I{key} is zone apex, value is a dictionary with L{Zone} objects by serial number.'''
+    self.__running = False
+    self.__threads = []
+    self.__udp = None
+    self.__tcp = None
+
+    for fname in zones:
+      self.load(fname)
+
+  class Zone(object):
+    '''
+    Records of one zone.
+    '''
+    def __init__(self):
+      self.soa = None
+      self.rrs = []
+      '''All records in order of the zone master file.'''
+      self.index = {}
+      '''Records, I{key} is a tuple C{(<owner>, <type string>)}, RRSIGs by type covered.'''
+      self.owners = set()
+
+  @staticmethod
+  def __key(owner, rr_type):
+    return (DNSWire.canonical_name(owner), rr_type.upper())
+
+  def load(self, fname):
+    '''
+    Loads a zone master file. The zone apex is the owner of SOA record. When
+    the zone is already loaded, the previous version is kept for IXFR.
+    '''
+    fp = open(fname, "r")
+    ttl = 3600
+    origin = None
+    prev = None
+    zone = self.Zone()
+
+    try:
+      while True:
+        pos = fp.tell()
+        status, rr, line_inc, new_ttl, new_origin, prev = \
+          ldns.ldns_rr_new_frm_fp_l_(fp, ttl, origin, prev)
+
+        if status == ldns.LDNS_STATUS_SYNTAX_TTL:
+          ttl = new_ttl
+        elif status == ldns.LDNS_STATUS_SYNTAX_ORIGIN:
+          origin = new_origin
+        elif status == ldns.LDNS_STATUS_SYNTAX_EMPTY:
+          if pos == fp.tell(): #EOF
+            break
+        elif status != ldns.LDNS_STATUS_OK:
+          raise ValueError("Can't parse zone file " + fname + " (errno = " + str(status) + ").")
+        else:
+          if rr.get_type() == ldns.LDNS_RR_TYPE_SOA:
+            zone.soa = rr
+          if rr.get_type() == ldns.LDNS_RR_TYPE_RRSIG:
+            key = self.__key(rr.owner(), str(rr.rrsig_typecovered()))
+          else:
+            key = self.__key(rr.owner(), rr.get_type_str())
+          zone.rrs.append(rr)
+          zone.index.setdefault(key, []).append(rr)
+          zone.owners.add(key[0])
+    finally:
+      fp.close()
+
+    if zone.soa is None:
+      raise ValueError("No SOA record in zone file " + fname + ".")
+
+    apex = DNSWire.canonical_name(zone.soa.owner())
+    if self.__zones.has_key(apex):
+      old = self.__zones[apex]
+      self.__history.setdefault(apex, {})[int(str(old.soa.rdf(2)))] = old
+    self.__zones[apex] = zone
+
+  def __find_zone(self, name, rr_type):
+    '''
+    Returns a tuple C{(<apex>, <zone>)} with the closest enclosing zone of
+    given name, or C{(None, None)}.
+    '''
+    labels = DNSWire.read_name(DNSWire.name_to_wire(name), 0)[0]
+    start = 0
+    if rr_type == ldns.LDNS_RR_TYPE_DS and labels: #DS is at parent side
+      start = 1
+
+    for i in range(start, len(labels) + 1):
+      apex = DNSWire.name_to_str(labels[i:])
+      if self.__zones.has_key(apex):
+        return (apex, self.__zones[apex])
+
+    if start: #parent not loaded, try the zone itself
+      return self.__find_zone(name, ldns.LDNS_RR_TYPE_A)
+    return (None, None)
+
+  @staticmethod
+  def __packet(qid, name, rr_type, rcode, answer = (), authority = ()):
+    '''
+    Builds an answer in wire format.
+    '''
+    pkt = ldns.ldns_pkt.new_query_frm_str(name, rr_type, ldns.LDNS_RR_CLASS_IN, 0)
+    pkt.set_id(qid)
+    pkt.set_qr(True)
+    pkt.set_aa(True)
+    pkt.set_rcode(rcode)
+
+    for rr in answer:
+      pkt.push_rr(ldns.LDNS_SECTION_ANSWER, rr.clone())
+    for rr in authority:
+      pkt.push_rr(ldns.LDNS_SECTION_AUTHORITY, rr.clone())
+
+    (status, data) = ldns.ldns_pkt2wire(pkt)
+    return data
+
+  def answer(self, query, tcp = False):
+    '''
+    Returns a list of answers in wire format to given query in wire format.
+    The list is empty, when the query should be ignored.
+    '''
+    question = DNSWire.question(query)
+    if question is None or DNSWire.message_flags(query) & DNSWire.FLAG_QR:
+      return []
+
+    qid = DNSWire.message_id(query)
+    (name, rr_type, rr_class) = question
+    (apex, zone) = self.__find_zone(name, rr_type)
+
+    if zone is None:
+      return [self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_REFUSED)]
+
+    if rr_type == ldns.LDNS_RR_TYPE_AXFR:
+      if not tcp or name != apex:
+        return [self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NOTIMPL)]
+      return self.__axfr(qid, name, zone)
+
+    if rr_type == ldns.LDNS_RR_TYPE_IXFR and self.ixfr:
+      if not tcp or name != apex:
+        return [self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NOTIMPL)]
+      return self.__ixfr(qid, name, apex, zone, self.__serial(query))
+
+    rrs = zone.index.get((name, ldns.ldns_rr_type2str(rr_type).upper()), [])
+    soa = zone.index.get((apex, 'SOA'), [zone.soa]) #SOA and its RRSIGs
+
+    if rrs:
+      data = self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NOERROR, rrs)
+    elif name in zone.owners: #no data
+      data = self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NOERROR, (), soa)
+    else:
+      data = self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NXDOMAIN, (), soa)
+
+    payload = 512
+    if struct.unpack("!H", query[10:12])[0] > 0: #EDNS0
+      payload = DNSWire.EDNS_PAYLOAD
+    if self.udp_size is not None:
+      payload = min(payload, self.udp_size)
+
+    if not tcp and len(data) > payload: #truncate
+      data = self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NOERROR)
+      data = data[:2] + struct.pack("!H", DNSWire.message_flags(data) | DNSWire.FLAG_TC) + data[4:]
+
+    return [data]
+
+  def __axfr(self, qid, name, zone):
+    '''
+    Returns zone transfer messages of given zone.
+    '''
+    self.transfers += 1
+    rrs = [zone.soa] + [rr for rr in zone.rrs if rr is not zone.soa] + [zone.soa]
+    return self.__messages(qid, name, ldns.LDNS_RR_TYPE_AXFR, rrs)
+
+  def __ixfr(self, qid, name, apex, zone, serial):
+    '''
+    Returns incremental zone transfer messages of given zone to a client with
+    given serial number. The whole zone is sent, when the version of the
+    client is not known.
+    '''
+    self.incremental += 1
+    old = self.__history.get(apex, {}).get(serial)
+
+    if serial == int(str(zone.soa.rdf(2))): #client is up to date
+      rrs = [zone.soa]
+    elif old is None:
+      rrs = [zone.soa] + [rr for rr in zone.rrs if rr is not zone.soa] + [zone.soa]
+    else: #deleted records after old SOA, added ones after the new SOA
+      old_rrs = [rr for rr in old.rrs if rr is not old.soa]
+      new_rrs = [rr for rr in zone.rrs if rr is not zone.soa]
+      old_texts = set([str(rr) for rr in old_rrs])
+      new_texts = set([str(rr) for rr in new_rrs])
+      rrs = [zone.soa, old.soa] + [rr for rr in old_rrs if str(rr) not in new_texts] + \
+            [zone.soa] + [rr for rr in new_rrs if str(rr) not in old_texts] + [zone.soa]
+    return self.__messages(qid, name, ldns.LDNS_RR_TYPE_IXFR, rrs)
+
+  def __messages(self, qid, name, rr_type, rrs):
+    '''
+    Returns zone transfer messages with given records, at most
+    L{axfr_records} in each.
+    '''
+    ret = []
+    for i in range(0, len(rrs), self.axfr_records):
+      ret.append(self.__packet(qid, name, rr_type, ldns.LDNS_RCODE_NOERROR,
+                               rrs[i:i + self.axfr_records]))
+    return ret
+
+  @staticmethod
+  def __serial(query):
+    '''
+    Returns serial number from SOA record in authority section of given IXFR
+    query in wire format, None if there is none.
+    '''
+    pkt = DNSWire.wire2pkt(query)
+    if pkt is None:
+      return None
+    for rr in pkt.authority().rrs():
+      if rr.get_type() == ldns.LDNS_RR_TYPE_SOA:
+        return int(str(rr.rdf(2)))
+    return None
+
+  def start(self):
+    '''
+    Opens sockets and starts serving in background threads.
+    '''
+    self.__udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    self.__udp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.__udp.bind((self.address, self.port))
+
+    self.__tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.__tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.__tcp.bind((self.address, self.port))
+    self.__tcp.listen(16)
+
+    self.__running = True
+    for target in (self.__serve_udp, self.__serve_tcp):
+      t = threading.Thread(target = target)
+      t.daemon = True
+      t.start()
+      self.__threads.append(t)
+
+  def stop(self):
+    '''
+    Stops serving and closes sockets.
+    '''
+    self.__running = False
+    for t in self.__threads:
+      t.join()
+    self.__threads = []
+    self.__udp.close()
+    self.__tcp.close()
+
+  def __serve_udp(self):
+    while self.__running:
+      if not select.select([self.__udp], [], [], 0.1)[0]:
+        continue
+      try:
+        (query, addr) = self.__udp.recvfrom(0xFFFF)
+      except socket.error:
+        continue
+
+      self.queries += 1
+      if random.random() < self.loss:
+        self.dropped += 1
+        continue
+
+      for data in self.answer(query):
+        if self.latency:
+          threading.Timer(self.latency, self.__udp.sendto, (data, addr)).start()
+        else:
+          self.__udp.sendto(data, addr)
+
+  def __serve_tcp(self):
+    while self.__running:
+      if not select.select([self.__tcp], [], [], 0.1)[0]:
+        continue
+      (conn, addr) = self.__tcp.accept()
+      self.connections += 1
+      t = threading.Thread(target = self.__serve_conn, args = (conn,))
+      t.daemon = True
+      t.start()
+
+  def __serve_conn(self, conn):
+    '''
+    Answers queries over one TCP connection until it is closed by the client.
+    '''
+    conn.settimeout(10)
+    try:
+      while self.__running:
+        length = conn.recv(2)
+        if len(length) < 2:
+          break
+        length = struct.unpack("!H", length)[0]
+        query = ''
+        while len(query) < length:
+          chunk = conn.recv(length - len(query))
+          if not chunk:
+            return
+          query += chunk
+
+        self.queries += 1
+        if self.latency:
+          time.sleep(self.latency)
+        for data in self.answer(query, True):
+          conn.sendall(struct.pack("!H", len(data)) + data)
+    except socket.error:
+      pass
+    finally:
+      conn.close()
+
+if __name__ == "__main__":
+  options = {"--port": "5353", "--latency": "0", "--loss": "0"}
+  files = []
+  for arg in sys.argv[1:]:
+    if arg.split("=")[0] in options:
+      options[arg.split("=")[0]] = arg.split("=", 1)[1]
+    else:
+      files.append(arg)
+
+  server = LocalDNSServer(files, port = int(options["--port"]),
+                          latency = float(options["--latency"]),
+                          loss = float(options["--loss"]))
+  server.start()
+  print "Serving " + str(len(files)) + " zone(s) on 127.0.0.1#" + options["--port"] + ", Ctrl+C to stop."
+  try:
+    while True:
+      time.sleep(1)
+  except KeyboardInterrupt:
+    server.stop()
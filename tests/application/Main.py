@@ -18,7 +18,15 @@ import logging
 
 try:
   from ParamParser import ParamParser
-  from ZoneChecker import ZoneChecker, ZoneProviderFile, ZoneProviderAXFR, SafeResolver, RRCollection
+  from ZoneChecker import ZoneChecker, ZoneProviderFile, ZoneProviderAXFR, ZoneProviderIXFR,\
+    ZoneProviderSpool, SafeResolver, RRCollection
+  from TrustCache import TrustCache
+  from AnswerStore import AnswerStore
+  from AXFRClient import AXFRFetcher, TSIG
+  from ZoneSpool import ZoneSpool
+  from ZoneCuts import ZoneCuts
+  from RRSIGColumns import RRSIGColumns
+  from Forecast import ExpirationForecast
   from Exceptions import AXFRError, FileError, LoadingDone, ParamError,\
     ResolverError
 except ImportError, detail:
@@ -60,7 +68,9 @@ def print_help():
                    records. Possible is static value in format %Y-%m-%d %H:%M:%S
                    (see [1] for more info), value "run" which will use the time,
                    when was program executed or "now", which will use everytime
-                   current time. Default is "run".
+                   current time. Default is "run". Static value is local time
+                   (see TZ environment variable), while times in RRSIG records
+                   are in UTC.
                    
   --sformat=<str>  Format of output string with errors. See [2] for details.
                    Default is "%(asctime)s %(levelname)s: %(message)s"
@@ -68,8 +78,11 @@ def print_help():
   --dformat=<str>  Format of time in output. See [1] for more details.
                    Default is "%Y-%m-%d %H:%M:%S"
                    
-  --type=<type>    Type of input, can be "file" for zone master file or "axfr"
-                   for full zone transfer. File is default.
+  --type=<type>    Type of input, can be "file" for zone master file, "axfr"
+                   for full zone transfer, "ixfr" for incremental zone
+                   transfer, which checks only changed names since the last
+                   run (falls back to axfr when needed) or "spool" for the
+                   newest zone transfer written by --spool. File is default.
                    
   --input=<file>   A semicolon separated list of zone files or zone fetched by
                    axfr to be checked. If a file does not exist or can't be
@@ -80,7 +93,51 @@ def print_help():
                    
   --resolver=<ip>  A semicolon separated list of IP addresses that will be used
                    by resolver to make additional queries. Default list if based
-                   on values from /etc/resolv.conf.
+                   on values from /etc/resolv.conf. An address can be followed
+                   by #<port> to use other port than 53.
+                   
+  --cache=<file>   Path to a file, where validated DNSKEY and DS records are
+                   stored, so they can be used by next runs instead of building
+                   the chain of trust again. Records are used until their TTL
+                   or RRSIG expires. Not used by default.
+                   
+  --offline=<file> Path to an answer store file with DNSKEY and DS records (and
+                   their RRSIGs), that are used instead of querying name
+                   servers. No queries are sent. Zone transfers still need
+                   network access.
+                   
+  --record=<file>  Path to a file, where DNSKEY and DS records received from
+                   name servers are written at the end of the run. The file can
+                   be used later with --offline.
+                   
+  --spool=<dir>    Path to a directory, where zone transfers (axfr) are written,
+                   so they can be checked again using type "spool" without
+                   another transfer. Two newest versions of each zone are kept.
+                   
+  --metrics=<file> Path to a file, where transport metrics (query counters, RTT
+                   histograms of name servers, zone transfer timings) are
+                   written in JSON format at the end of the run. The summary
+                   is written out with info severity too.
+                   
+  --forecast=<f>   Path to a file, where RRSIG expiration forecast of checked
+                   zones (the first expiration, the RRsets expiring first and
+                   a histogram of time left) is written in JSON format at the
+                   end of the run, so the next check can be scheduled. Zones
+                   not checked in the run are kept from the previous file. The
+                   forecast is written out with info severity too.
+                   
+  --columns=<int>  Count of RRSIG records collected into columnar arrays, before
+                   their time (RRSIG_T) and TTL checks run on the whole block
+                   at once. NumPy is used, when installed. Not used by default
+                   (records are checked one owner name at a time).
+                   
+  --parallel=<int> The highest number of zone transfers (axfr) running at once.
+                   When higher than 1, all zones are transferred in background
+                   to temporary spool files, while the first ones are being
+                   checked. Default value 1 (one after another).
+                   
+  --perserver=<n>  The highest number of zone transfers running at once from
+                   one name server, used with --parallel. Default value 2.
                    
   --key=<key str>  TSIG key to be during AXFR authentication. It has to be space
                    separated set of name, algorithm and key data.
@@ -94,7 +151,9 @@ def print_help():
                    
   --sn             When this parameter specified, one zone will not be checked
                    more than once, unless its serial number in SOA record
-                   increases. This is disabled by default.
+                   increases. Zone transfer (axfr) is skipped, when SOA query
+                   shows the serial number has not increased, also with
+                   --parallel. This is disabled by default.
                    
   --check=<list>   List of checks to be performed on zone data (for valid values
                    see bellow).
@@ -111,7 +170,7 @@ def print_help():
   RRSIG_T - check RRSIG time, when used with RRSIG, will not be used
   RRSIG_A - check if all DNSKEY algorithms are used to create RRSIG records
   RRSIG_S - make statistics about RRSIG signing algorithms usage
-  NSEC    - check NSEC records
+  NSEC    - check NSEC records (including the whole NSEC chain)
   NSEC_S  - make statistics about NSEC usage
   TTL     - check TTL values
   DS      - check all necessary DS records at parent exist
@@ -120,6 +179,41 @@ def print_help():
   [2] http://docs.python.org/library/logging.html#formatter-objects
   '''
   
+def start_fetcher(params, safe_res, def_ip):
+  '''
+  Starts transfers of all axfr sources in background, when more transfers may
+  run at once. Sources with serial number check, whose serial number in SOA
+  query is not higher, are not transferred. Returns L{AXFRFetcher} object or
+  None.
+  '''
+  if params.get_parallel() < 2:
+    return None
+  
+  fetcher = AXFRFetcher(params.get_parallel(), params.get_per_server(), SafeResolver.axfr_timeout)
+  for z in params.zones:
+    if z.type != "axfr":
+      continue
+    
+    try:
+      if z.resolver: #custom addresses
+        safe_res.set_resolver(z.resolver, z.keyname, z.keyalg, z.keydata)
+      else: #default addresses
+        safe_res.set_resolver(def_ip, z.keyname, z.keyalg, z.keydata)
+      
+      tsig = None
+      if safe_res.tsig:
+        tsig = TSIG(*safe_res.tsig)
+      
+      if z.sn_check and ZoneProviderAXFR(z.buffer_size, z.buffer_warn).is_unchanged(z.source, safe_res):
+        continue #skipped, when the source is checked
+    except (ResolverError, AXFRError): #reported, when the source is checked
+      continue
+    
+    fetcher.add(z.source, safe_res.axfr_servers(), tsig)
+  
+  fetcher.start()
+  return fetcher
+
 def main(argc, argv):
   '''
   Entry point of the whole program.
@@ -153,8 +247,40 @@ def main(argc, argv):
     def_ip.append("127.0.0.1")
     
   safe_res = SafeResolver(res)
+  trust_cache = TrustCache(params.get_cache()) #validated keys shared by all zones
+  
+  if params.get_offline(): #answer queries from a file only
+    store = AnswerStore()
+    try:
+      store.load(params.get_offline())
+    except FileError, detail:
+      logging.critical(str(detail))
+      sys.exit(1)
+    safe_res.use_answer_store(store, True)
+  elif params.get_record(): #remember answers of name servers
+    safe_res.use_answer_store(AnswerStore(), False)
+    
+  spool = None
+  if params.get_spool(): #write zone transfers to a spool
+    try:
+      spool = ZoneSpool(params.get_spool())
+    except FileError, detail:
+      logging.critical(str(detail))
+      sys.exit(1)
+    
+  provider = None
+  checked = False #was any source checked, not skipped by serial number?
+  forecast = None
+  if params.get_forecast(): #collect RRSIG expirations of checked zones
+    forecast = ExpirationForecast()
+  fetcher = start_fetcher(params, safe_res, def_ip)
     
   for z in params.zones:
+    if provider is not None: #stop loading of the previous source
+      provider.close()
+      provider = None
+    columns = None #columnar store of RRSIGs, see below
+      
     try:
       ######################### PREPARE ########################################      
       if z.resolver: #custom addresses
@@ -163,7 +289,7 @@ def main(argc, argv):
         safe_res.set_resolver(def_ip, z.keyname, z.keyalg, z.keydata)
         
       logging.debug("Resolver address source changed.")  
-      zc = ZoneChecker(params.get_time(), safe_res) #create zone checker
+      zc = ZoneChecker(params.get_time(), safe_res, trust_cache) #create zone checker
 
       if z.type == "file": #type is file
         logging.debug("Loading data from zone master file.")
@@ -172,7 +298,20 @@ def main(argc, argv):
       elif z.type == "axfr": #type is zone transfer
         logging.debug("Loading data over axfr.")
         provider = ZoneProviderAXFR(z.buffer_size, z.buffer_warn)
-        provider.load_start(z.source, safe_res)        
+        if z.sn_check and provider.is_unchanged(z.source, safe_res):
+          logging.debug("Serial number of the zone in SOA query is not higher, than the previous. Skipping this source without transfer.")
+          continue
+        provider.load_start(z.source, safe_res, fetcher, spool)        
+      elif z.type == "ixfr": #type is incremental zone transfer
+        logging.debug("Loading data over ixfr.")
+        provider = ZoneProviderIXFR(z.buffer_size, z.buffer_warn)
+        provider.load_start(z.source, safe_res, params.get_time())
+      elif z.type == "spool": #type is zone transfer written to spool
+        logging.debug("Loading data from spool.")
+        if spool is None:
+          spool = ZoneSpool()
+        provider = ZoneProviderSpool(z.buffer_size, z.buffer_warn)
+        provider.load_start(z.source, spool)
       else:
         logging.critical("Unknown source type \"" + str(z.type) + "\", skipping this source.")
         continue
@@ -195,6 +334,17 @@ def main(argc, argv):
         logging.debug("Current serial number of the zone is not higher, than the previous. Skipping this source.")
         continue        
       
+      checked = True
+      zc.set_zone_cuts(provider.cuts) #None, when zone cuts are found while checking
+      if forecast is not None:
+        forecast.start(str(provider.soa.owner()), params.get_time().now())
+      
+      #RRSIG time and TTL checks of whole blocks, signature check reads records anyway
+      times_only = z.check_wanted('RRSIG_T') and not z.check_wanted('RRSIG')
+      if params.get_columns() and (times_only or z.check_wanted('TTL')):
+        columns = RRSIGColumns(params.get_time(), params.get_columns(), times_only,
+                               z.check_wanted('TTL'))
+      
       has_trusted_keys = True
       nsec3_presence_check_disabled = False
       
@@ -203,33 +353,43 @@ def main(argc, argv):
       #load other RRCollections and performs checks on each of them. loading
       #finished by exception LoadingDone
       while True:
+        #data below a zone cut (glue) and outside of the zone are not
+        #authoritative, nothing to check
+        cut = zc.zone_cut(rrs, str(provider.soa.owner()))
+        if cut == ZoneCuts.OCCLUDED:
+          logging.debug(rrs.owner() + " is below a zone cut (glue), skipping checks.")
+          rrs = provider.load_next()
+          continue
+        elif cut == ZoneCuts.OUTSIDE:
+          logging.warning(rrs.owner() + " is outside of the zone " + str(provider.soa.owner()) +
+                          ", skipping checks.")
+          rrs = provider.load_next()
+          continue
+        
         #special checks might be needed for records with the same owner name
         #as is the zone itself (like DNSKEYs)
         if rrs.owner() == str(provider.soa.owner()):
           if rrs.get_nsec_type() == RRCollection.NSEC3:
-            #there is no way to check NSEC3 presence correctly at this time
+            #NSEC presence makes no sense, NSEC3 coverage is checked at the end
             nsec3_presence_check_disabled = True
-            #print warning when this check disabled
             if z.check_wanted('NSEC'):
-              logging.warning("Zone appears to be secured with NSEC3. NSEC type records presence check will be disabled.")
+              logging.info("Zone appears to be secured with NSEC3. NSEC3 chain and coverage will be checked instead of NSEC presence.")
           if z.check_wanted('DS'):
             zc.verify_ds_records(rrs)
             if z.check_wanted_only('DS'):
               raise LoadingDone("Loading not finished, but no other records needed.")
         
-        #check signatures inception and expiration dates, but only when this is
-        #the only signature check
-        if z.check_wanted('RRSIG_T') and not z.check_wanted('RRSIG'):
-          rrs.verify_rrsigs_times(params.get_time())
-        
-        if has_trusted_keys:
-          if z.check_wanted('RRSIG'): #check signatures and also their times, when wanted
-            has_trusted_keys = zc.verify_signatures(rrs, provider.soa, z.check_wanted('RRSIG_T'),
-                                                    params.get_time())
-          if z.check_wanted('RRSIG_A'): #check signatures algorithms usage
-            has_trusted_keys = zc.verify_signatures_algorithm(rrs, provider.soa)
-          if not has_trusted_keys: #just disabled
-            logging.critical("No trusted keys available. Disabling signature verification.")
+        #check RRSIGs in one pass - signatures inception and expiration dates,
+        #but only when this is the only signature check, signatures and also
+        #their times, when wanted, signatures algorithms usage and TTL values
+        signatures = has_trusted_keys and z.check_wanted('RRSIG')
+        algorithms = has_trusted_keys and z.check_wanted('RRSIG_A')
+        ok = zc.verify_rrsigs(rrs, provider.soa, times_only and columns is None, signatures,
+                              z.check_wanted('RRSIG_T'), algorithms, z.check_wanted('TTL'),
+                              columns, params.get_time(), forecast)
+        if (signatures or algorithms) and not ok: #just disabled
+          has_trusted_keys = False
+          logging.critical("No trusted keys available. Disabling signature verification.")
             
         #log NSEC usage statistics
         if z.check_wanted('NSEC_S'):
@@ -239,14 +399,17 @@ def main(argc, argv):
         if z.check_wanted('RRSIG_S'):
           zc.alg_log(rrs)
          
-        #Verifying various TTL values
+        #Verifying various TTL values, RRSIGs were checked above
         if z.check_wanted('TTL'):  
-          zc.verify_ttls(rrs, provider.soa)
+          zc.verify_ttls(rrs, provider.soa, columns)
         
         #Verifying NSEC type records
         if z.check_wanted('NSEC'):
           zc.verify_nsecs(rrs, nsec3_presence_check_disabled)
         
+        if columns is not None:
+          columns.add(rrs)
+        
         rrs = provider.load_next()
     except AXFRError, detail:
       logging.critical(str(detail))
@@ -255,9 +418,19 @@ def main(argc, argv):
     except ResolverError, detail:
       logging.critical(str(detail))
     except LoadingDone, detail:
+      if provider.soa is None: #empty source
+        logging.critical("No SOA record available. Skipping this source.")
+      if columns is not None: #the last block
+        columns.flush()
+      if forecast is not None: #only changed owner names were checked, when not complete
+        forecast.finish(provider.complete)
+      
       #Verifying NSEC type records
       if z.check_wanted('NSEC'):
         zc.write_error_remaining_glue()
+        #only changed owner names were checked, when not complete, no SOA in empty source
+        if provider.complete and provider.soa is not None:
+          zc.verify_nsec_chain(str(provider.soa.owner()))
       
       logging.debug(str(detail))
       
@@ -266,6 +439,27 @@ def main(argc, argv):
         zc.nsec_log_print()
       if z.check_wanted('RRSIG_S'):
         zc.alg_log_print()
+    finally:
+      if columns is not None: #RRSIGs loaded before an error are checked too
+        columns.flush()
+        
+  if provider is not None:
+    provider.close()
+  if fetcher is not None:
+    fetcher.close()
+  
+  safe_res.close()
+  trust_cache.log_stats()
+  safe_res.log_stats()
+  if checked: #skipped sources sent only SOA queries, nothing to talk about
+    safe_res.metrics.log_summary()
+  if params.get_metrics():
+    safe_res.metrics.save(params.get_metrics())
+  if forecast is not None:
+    forecast.save(params.get_forecast())
+  
+  if params.get_record():
+    safe_res.store.save(params.get_record())
 
 if __name__ == '__main__':
   main(len(sys.argv), sys.argv)
\ No newline at end of file
@@ -0,0 +1,310 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains verification of the whole NSEC or NSEC3 chain of a zone, which can't
+be done by looking at one owner name at a time.
+
+  - B{File}: I{NSECChain.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import heapq
+import struct
+import logging
+import tempfile
+import multiprocessing
+
+import DNSWire
+
+class NSECChain(object):
+  '''
+  Collects pairs of owner name and next owner name of NSEC records, while the
+  zone is being checked, and verifies at the end, that they form one closed
+  chain in canonical order (see
+  U{RFC 4034, section 4.1.1<http://tools.ietf.org/html/rfc4034#section-4.1.1>}).
+
+  Pairs are kept as compact sort keys (see L{DNSWire.sort_key()}). When there
+  are L{chunk_size} of them in memory, they are sorted and written to a
+  temporary file. At the end all files are merged, so the memory needed does
+  not depend on the size of the zone.
+  '''
+
+  chunk_size = 100000
+  '''The highest number of pairs kept in memory.'''
+
+  title = "NSEC"
+  '''Type of chained records used in messages.'''
+
+  def __init__(self, directory = None):
+    '''
+    @param directory: Directory for temporary files, default temporary
+    directory when None.
+    '''
+    self.directory = directory
+    self.apex = None
+    '''Zone apex, set by L{verify()}.'''
+    self.count = 0
+    '''Count of collected pairs.'''
+    self.__pairs = []
+    '''Pairs not written to a file yet.'''
+    self.__chunks = []
+    '''Temporary files with sorted pairs.'''
+
+  def add(self, owner, next):
+    '''
+    Adds a pair from one NSEC record.
+
+    @param owner: Owner name of the NSEC record.
+    @param next: Next owner name from the NSEC record.
+    '''
+    self.__pairs.append((self.key(owner), self.key(next)))
+    self.count += 1
+    if len(self.__pairs) >= self.chunk_size:
+      self.__spill()
+
+  def key(self, name):
+    '''
+    Returns key of a name, by which the chain is ordered.
+    '''
+    return DNSWire.sort_key(name)
+
+  def name(self, key):
+    '''
+    Returns name for given key (see L{key()}) to be written out.
+    '''
+    return DNSWire.sort_key_to_name(key)
+
+  def __spill(self):
+    '''
+    Writes sorted pairs from memory to a temporary file. The file is removed,
+    when it is closed.
+    '''
+    self.__pairs.sort()
+    f = tempfile.TemporaryFile(dir = self.directory)
+    for (owner, next) in self.__pairs:
+      f.write(struct.pack("!HH", len(owner), len(next)) + owner + next)
+    f.seek(0)
+    self.__chunks.append(f)
+    self.__pairs = []
+
+  @staticmethod
+  def __read(f):
+    '''
+    Returns iterator of pairs from a temporary file.
+    '''
+    while True:
+      head = f.read(4)
+      if not head:
+        break
+      (owner_len, next_len) = struct.unpack("!HH", head)
+      data = f.read(owner_len + next_len)
+      yield (data[:owner_len], data[owner_len:])
+
+  def pairs(self):
+    '''
+    Returns iterator of all collected pairs of sort keys in canonical order of
+    owner names.
+    '''
+    self.__pairs.sort()
+    return heapq.merge(iter(self.__pairs), *[self.__read(f) for f in self.__chunks])
+
+  def verify(self, apex, expected = None):
+    '''
+    Verifies the chain and writes out errors using L{logging} module. Each
+    next owner name has to be the following owner name with a record of the
+    chain, the last one has to point to the first one, which is the zone apex
+    (see L{start()}). Otherwise the chain has:
+
+      - a broken link, when the next owner name has no record of the chain,
+      - a gap, when owner names with records of the chain are skipped,
+      - a loop, when the next owner name goes back, so the chain is closed
+        before all owner names are reached.
+
+    Coverage of owner names is verified in the same pass, when they are
+    given. Temporary files are closed afterwards, so it can be called only
+    once.
+
+    @param apex: Zone apex (SOA owner name).
+    @param expected: Sorted list of tuples C{(<key>, <owner name>,
+    <required>)} of owner names, that should have a record of the chain. An
+    error is written out for required ones without it, a warning for records
+    of the chain matching none of them. Not verified, when None.
+    @return: Count of errors.
+    '''
+    self.apex = DNSWire.canonical_name(apex)
+    start = self.start()
+    errors = 0
+    prev = None
+    
+    if expected is not None:
+      expected = iter(expected)
+      cur = next(expected, None)
+
+    try:
+      for (owner, next_key) in self.pairs():
+        if prev is None:
+          if start is None: #any one can be the first
+            start = owner
+          elif owner != start:
+            logging.error(self.apex + " " + self.title + " chain does not start at zone apex " +
+                          "(the first owner name is " + self.name(owner) + ").")
+            errors += 1
+        elif owner == prev[0]:
+          logging.warning(self.name(owner) + " " + self.title + " chain - multiple " + self.title +
+                          " records for single owner name.")
+          continue
+        elif not self.__link(prev, owner):
+          errors += 1
+        prev = (owner, next_key)
+
+        if expected is None:
+          continue
+        while cur is not None and cur[0] < owner: #owner names skipped by the chain
+          if cur[2]:
+            logging.error(cur[1] + " " + self.title + " type record not present.")
+            errors += 1
+          cur = next(expected, None)
+        if cur is None or cur[0] != owner:
+          logging.warning(self.name(owner) + " " + self.title + " record does not match any owner name.")
+        while cur is not None and cur[0] == owner:
+          cur = next(expected, None)
+    finally:
+      for f in self.__chunks:
+        f.close()
+      self.__chunks = []
+      self.__pairs = []
+
+    if prev is None: #no records of the chain at all, reported by presence check
+      return 0
+
+    while expected is not None and cur is not None: #owner names after the last one
+      if cur[2]:
+        logging.error(cur[1] + " " + self.title + " type record not present.")
+        errors += 1
+      cur = next(expected, None)
+
+    if prev[1] != start: #the last one has to close the chain
+      logging.error(self.name(prev[0]) + " " + self.title + " chain not closed - next owner name " +
+                    self.name(prev[1]) + " is not " + self.name(start) + ".")
+      errors += 1
+
+    if not errors:
+      logging.info(self.apex + " " + self.title + " chain OK (" + str(self.count) + " records).")
+    return errors
+
+  def start(self):
+    '''
+    Returns key of the first owner name of the chain, which is the zone apex
+    (see L{verify()}).
+    '''
+    return self.key(self.apex)
+
+  def __link(self, prev, owner):
+    '''
+    Verifies, that pair L{prev} points to the following owner name. Returns
+    False and writes out an error using L{logging} module, if not.
+    '''
+    (prev_owner, next_key) = prev
+    if next_key == owner:
+      return True
+
+    name = self.name(prev_owner) + " " + self.title
+    if next_key <= prev_owner:
+      logging.error(name + " chain loop - next owner name " + self.name(next_key) + " goes back, so " +
+                    self.name(owner) + " and following owner names are not reached.")
+    elif next_key < owner:
+      logging.error(name + " chain broken - next owner name " + self.name(next_key) + " has no " +
+                    self.title + " record.")
+    else:
+      logging.error(name + " chain gap - next owner name " + self.name(next_key) + " skips " +
+                    self.name(owner) + " with " + self.title + " record.")
+    return False
+
+class NSEC3Chain(NSECChain):
+  '''
+  Collects pairs of hashed owner name and next hashed owner name of NSEC3
+  records and verifies, that they form one closed chain in order of hashes
+  (see U{RFC 5155, section 7.1<http://tools.ietf.org/html/rfc5155#section-7.1>}).
+  Base32hex keeps the order of hashes, so the hashes are used as keys.
+  '''
+
+  title = "NSEC3"
+
+  def key(self, name):
+    '''
+    Returns the hash from hashed owner name (its first label) or from next
+    hashed owner name field.
+    '''
+    return str(name).split('.', 1)[0].lower()
+
+  def name(self, key):
+    '''
+    Returns hashed owner name for given hash.
+    '''
+    return key + "." + self.apex
+
+  def start(self):
+    '''
+    Returns None, the chain can start with any hash.
+    '''
+    return None
+
+def hash_names(args):
+  '''
+  Returns list of hashed owner names (see L{DNSWire.nsec3_hash()}) of given
+  names. Used by worker processes of L{NSEC3Hasher}.
+
+  @param args: Tuple C{(<list of names>, <salt>, <iterations>)}.
+  '''
+  (names, salt, iterations) = args
+  return [DNSWire.nsec3_hash(name, salt, iterations) for name in names]
+
+class NSEC3Hasher(object):
+  '''
+  Computes hashed owner names of NSEC3 records. Hashes are computed by a pool
+  of worker processes, when there are enough names, and remembered, so each
+  name is hashed only once for given salt and iterations.
+  '''
+
+  batch_size = 1000
+  '''Count of names sent to a worker process at once.'''
+
+  parallel_min = 5000
+  '''The lowest count of names, for which worker processes are started.'''
+
+  def __init__(self, processes = None):
+    '''
+    @param processes: Count of worker processes, count of CPUs when None.
+    '''
+    self.processes = processes
+    self.__cache = {}
+    '''Computed hashes, I{key} is a tuple C{(<salt>, <iterations>)}, value dictionary of hashes by names.'''
+
+  def hash(self, names, salt, iterations):
+    '''
+    Returns dictionary of hashed owner names, I{key} is name.
+
+    @param names: Names to be hashed, in lower case presentation format (see
+    L{DNSWire.canonical_name()}).
+    @param salt: Salt in binary form.
+    @param iterations: Number of additional iterations.
+    '''
+    cache = self.__cache.setdefault((salt, int(iterations)), {})
+    todo = [name for name in set(names) if name not in cache]
+
+    batches = [(todo[i:i + self.batch_size], salt, int(iterations))
+               for i in range(0, len(todo), self.batch_size)]
+    if len(todo) >= self.parallel_min and (self.processes or multiprocessing.cpu_count()) > 1:
+      pool = multiprocessing.Pool(self.processes)
+      try:
+        results = pool.map(hash_names, batches)
+      finally:
+        pool.terminate()
+    else:
+      results = map(hash_names, batches)
+
+    for ((batch, salt, iterations), hashes) in zip(batches, results):
+      cache.update(zip(batch, hashes))
+
+    return dict([(name, cache[name]) for name in names])
@@ -0,0 +1,242 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Contains a cache of validated DNSKEY and DS record sets, that is shared by all
+zones checked during one run of the application and optionally also by
+subsequent runs using a local cache file.
+
+  - B{File}: I{TrustCache.py}
+  - B{Date}: I{19.10.2026}
+  - B{Author}: I{agent, U{agent@local<mailto:agent@local>}}
+'''
+
+import time
+import hashlib
+import logging
+import sqlite3
+import ldns
+
+from Statistics import Statistics
+
+class TrustCache(object):
+  '''
+  Remembers DNSKEY and DS record sets, which were already validated while
+  building a chain of trust, so they don't have to be fetched and validated
+  again for other zones under the same parent. Every entry has its own
+  expiration time (see L{store()}), expired entries are never returned.
+
+  Entries are bound to a set of trust anchors (see L{anchor_id()}), because
+  record set validated using one set of anchors does not have to be valid
+  using another one.
+  
+  When a path to a cache file is given, entries are also stored in a SQLite
+  database, so they can be used by next runs of the application. The database
+  can be shared by several processes running at the same time.
+  '''
+
+  DNSKEY = 'DNSKEY'
+  '''Kind of entry - validated DNSKEY record set of a domain.'''
+  DS = 'DS'
+  '''Kind of entry - validated DS record set of a domain.'''
+
+  __timeout = 30
+  '''How long to wait (in seconds) for cache file locked by other process.'''
+  
+  def __init__(self, path = None):
+    '''
+    @param path: Path to a cache file. If not set, entries are kept only in
+    memory.
+    @type path: String
+    '''
+    self.__entries = {}
+    '''
+    Dictionary of cached record sets, I{key} is a tuple C{(<anchor id>,
+    <domain>, <kind>)}, value a tuple C{(<expiration time>, <list of RRs>)}.
+    '''
+
+    self.stat = Statistics("Trust chain cache")
+    '''Cache usage L{Statistics} object (hits, misses, expired and stored entries).'''
+    
+    self.__db = None
+    '''Connection to the cache file database, None if not used.'''
+    
+    if path:
+      self.__open(path)
+      
+  def __open(self, path):
+    '''
+    Opens the cache file (creates it if needed) and removes expired entries
+    from it. On error the cache file is not used and a warning is written out
+    using L{logging} module.
+    '''
+    try:
+      self.__db = sqlite3.connect(path, self.__timeout)
+      try: #allows readers not to wait for writers, not supported everywhere
+        self.__db.execute("PRAGMA journal_mode=WAL")
+      except sqlite3.Error:
+        pass
+      
+      self.__db.execute("CREATE TABLE IF NOT EXISTS trust (anchor TEXT, domain TEXT, " +
+                        "kind TEXT, expires REAL, rrs TEXT, PRIMARY KEY (anchor, domain, kind))")
+      self.__db.execute("DELETE FROM trust WHERE expires <= ?", (time.time(),))
+      self.__db.commit()
+    except sqlite3.Error, detail:
+      logging.warning("Trust chain cache file " + str(path) + " can't be used (" +
+                      str(detail) + "). Cache will be kept in memory only.")
+      self.__db = None
+      
+  def __db_get(self, key):
+    '''
+    Reads an entry from the cache file. Returns a tuple C{(<expiration time>,
+    <list of RRs>)} or None, if there is no such entry.
+    '''
+    try:
+      row = self.__db.execute("SELECT expires, rrs FROM trust WHERE anchor = ? AND " +
+                              "domain = ? AND kind = ?", key).fetchone()
+    except sqlite3.Error, detail:
+      logging.warning("Trust chain cache file can't be read (" + str(detail) + ").")
+      return None
+    
+    if row is None:
+      return None
+    
+    rrs = []
+    for line in str(row[1]).split("\n"):
+      if line:
+        rrs.append(ldns.ldns_rr.new_frm_str(line))
+        
+    return (row[0], rrs)
+      
+  def __db_store(self, key, expires, rrs):
+    '''
+    Writes an entry to the cache file, replacing the old one.
+    '''
+    rrs_str = "\n".join([str(rr).strip() for rr in rrs])
+    
+    try:
+      self.__db.execute("INSERT OR REPLACE INTO trust VALUES (?, ?, ?, ?, ?)",
+                        key + (expires, rrs_str))
+      self.__db.commit()
+    except sqlite3.Error, detail:
+      logging.warning("Trust chain cache file can't be written (" + str(detail) + ").")
+
+  @staticmethod
+  def anchor_id(anchors):
+    '''
+    Returns an identificator of given set of trust anchors, which does not
+    depend on order of the anchors.
+
+    @param anchors: Trust anchors.
+    @type anchors: U{ldns_rr_list<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr__list.html>}
+    '''
+    rr_strs = [str(rr).strip() for rr in anchors.rrs()]
+    rr_strs.sort()
+    return hashlib.sha1("\n".join(rr_strs)).hexdigest()
+
+  @staticmethod
+  def normalize_name(domain):
+    '''
+    Returns lower case string representation of given domain name ending with
+    a dot.
+    '''
+    name = str(domain).strip().lower()
+    if not name.endswith('.'):
+      name += '.'
+    return name
+
+  def __lookup(self, key):
+    '''
+    Returns an entry for given key from memory or from the cache file. Entries
+    read from the file are remembered in memory.
+    '''
+    entry = self.__entries.get(key)
+    
+    if entry is None and self.__db: #maybe stored by some previous run
+      entry = self.__db_get(key)
+      if entry is not None:
+        self.stat.inc('file')
+        self.__entries[key] = entry
+        
+    return entry
+  
+  def has(self, anchor, domain, kind):
+    '''
+    Returns True, if there is an entry for given domain, that has not expired
+    yet. Unlike L{get()}, this does not count as cache hit or miss.
+    
+    @param anchor: Identificator of trust anchors obtained by L{anchor_id()}.
+    @param domain: Domain name.
+    @param kind: L{DNSKEY} or L{DS}.
+    '''
+    entry = self.__lookup((anchor, self.normalize_name(domain), kind))
+    return entry is not None and entry[0] > time.time()
+
+  def get(self, anchor, domain, kind):
+    '''
+    Returns a new
+    U{ldns_rr_list<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr__list.html>}
+    with cached records for given domain or None, if there is no such entry
+    or it has already expired.
+
+    @param anchor: Identificator of trust anchors obtained by L{anchor_id()}.
+    @param domain: Domain name.
+    @param kind: L{DNSKEY} or L{DS}.
+    '''
+    key = (anchor, self.normalize_name(domain), kind)
+    entry = self.__lookup(key)
+
+    if entry is None:
+      self.stat.inc('miss')
+      return None
+
+    (expires, rrs) = entry
+    if expires <= time.time(): #TTL or signature expired, forget it
+      del self.__entries[key]
+      self.stat.inc('expired')
+      self.stat.inc('miss')
+      return None
+
+    self.stat.inc('hit')
+
+    ret = ldns.ldns_rr_list()
+    for rr in rrs: #callers may change the list, so give them a copy
+      ret.push_rr(rr.clone())
+    return ret
+
+  def store(self, anchor, domain, kind, rr_list, expires):
+    '''
+    Stores validated record set in the cache.
+
+    @param anchor: Identificator of trust anchors obtained by L{anchor_id()}.
+    @param domain: Domain name.
+    @param kind: L{DNSKEY} or L{DS}.
+    @param rr_list: Validated records.
+    @type rr_list: U{ldns_rr_list<http://www.nlnetlabs.nl/projects/ldns/doc/structldns__struct__rr__list.html>}
+    @param expires: Time (in seconds since the epoch), after which the entry
+    can't be used - the lowest of records TTL counted from now and
+    I{Signature Expiration} of the RRSIG, that validated them.
+    @type expires: float
+    '''
+    if expires is None or expires <= time.time():
+      return
+
+    key = (anchor, self.normalize_name(domain), kind)
+    rrs = [rr.clone() for rr in rr_list.rrs()]
+    self.__entries[key] = (expires, rrs)
+    self.stat.inc('store')
+    
+    if self.__db:
+      self.__db_store(key, expires, rrs)
+
+  def log_stats(self):
+    '''
+    Writes out cache usage statistics using L{logging} module with info
+    severity. Nothing is written, when the cache was not used at all.
+    '''
+    if self.stat.get('hit') + self.stat.get('miss') == 0:
+      return
+    
+    logging.info(self.stat.title + ' - ' + str(self.stat.get('hit')) + ' hits, ' +
+                 str(self.stat.get('miss')) + ' misses (' + str(self.stat.get('expired')) +
+                 ' expired), ' + str(self.stat.get('file')) + ' read from cache file, ' +
+                 str(self.stat.get('store')) + ' record sets stored.')
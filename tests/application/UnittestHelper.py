@@ -21,7 +21,14 @@ class BasicDNSSECTest(unittest.TestCase):
   main_programm = "python Main.py"
   file_ok = "a.example.com.db.signed"
   file_bad = "a.example.com.db.signed.broken"
+  file_ixfr = "a.example.com.db.signed.ixfr"
   file_anchors = "anch1;anch2;anch3"
+  file_nsec3 = "nsec3.example.com.db.signed"
+  file_nsec3_anchor = "anch-nsec3"
+  file_glue = "glue.example.com.db.signed"
+  file_glue_anchor = "anch-glue"
+  file_wrap = "wrap.example.com.db.signed"
+  file_empty = "empty.db"
   axfr_resolver = '192.168.1.222;192.168.1.199'
   axfr_domain = "a.example.com"
   axfr_anchor = "anch1"
@@ -30,10 +37,14 @@ class BasicDNSSECTest(unittest.TestCase):
   axfr_sec_anchor = "Kexample.com.+005+37447.key"
   axfr_sec_key='example.com HMAC-SHA1 21pffl6ZCb34t6qKr4mP2A=='
   def_time = "2011-04-10 12:00:00"
+  local_port = 5353
+  local_resolver = "127.0.0.1#5353"
   
   SECTION_GENERAL = "general"
   SECTION_ZONE = "Zone0"
   TMP_CONF = "/tmp/temporary_configuration_file"
+  TMP_CACHE = "/tmp/temporary_trust_cache_file"
+  TMP_ANSWERS = "/tmp/temporary_answer_store_file"
   
   cmd_map = { "--level": ("outputLevel", SECTION_GENERAL), "--time": ("time", SECTION_GENERAL),
              "--sformat": ("outputFormat", SECTION_GENERAL), "--dformat": ("outputFormatDate", SECTION_GENERAL),
@@ -41,7 +52,12 @@ class BasicDNSSECTest(unittest.TestCase):
              "--anchor": ("trust", SECTION_ZONE), "--resolver": ("resolver", SECTION_ZONE),
              "--key": ("key", SECTION_ZONE), "--bs": ("buffersize", SECTION_ZONE),
              "--bw": ("bufferwarn", SECTION_ZONE), "--sn": ("sncheck", SECTION_ZONE),
-             "--check": ("check", SECTION_ZONE), "--nocheck": ("nocheck", SECTION_ZONE) }
+             "--check": ("check", SECTION_ZONE), "--nocheck": ("nocheck", SECTION_ZONE),
+             "--cache": ("cache", SECTION_GENERAL), "--offline": ("offline", SECTION_GENERAL),
+             "--record": ("record", SECTION_GENERAL), "--parallel": ("parallel", SECTION_GENERAL),
+             "--perserver": ("perserver", SECTION_GENERAL), "--spool": ("spool", SECTION_GENERAL),
+             "--metrics": ("metrics", SECTION_GENERAL), "--columns": ("columns", SECTION_GENERAL),
+             "--forecast": ("forecast", SECTION_GENERAL) }
   
   def runCmd(self, **options):
     '''
@@ -285,6 +301,7 @@ class OutputDNSSECTest(BasicDNSSECTest):
   list_NSEC = ["ERROR: test11.a.example.com. MX type present in NSEC but does not exist",
                "ERROR: test6.a.example.com. A type not present in NSEC",
                "ERROR: test5.a.example.com. NSEC type record not present",
+               "ERROR: test4.a.example.com. NSEC chain broken - next owner name test5.a.example.com. has no NSEC record",
                "INFO: a.example.com. NSEC record type coverage OK (NS SOA MX RRSIG NSEC DNSKEY)"]
   
   list_NSEC_S = ["Statistics - NSEC usage"]
@@ -164,6 +164,14 @@ class CmdWrongValuesTests(BasicDNSSECTest):
     self.no_value_test(self.runCmd(type="file", input=self.file_ok, bw=""))
     self.no_value_test(self.runCmd(type="file", input=self.file_ok, check=""))
     self.no_value_test(self.runCmd(type="file", input=self.file_ok, nocheck=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, cache=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, offline=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, record=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, parallel=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, perserver=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, metrics=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, columns=""))
+    self.no_value_test(self.runCmd(type="file", input=self.file_ok, forecast=""))
     
   def wrong_value_test(self, ret, expect):
     '''
@@ -210,12 +218,23 @@ class CmdWrongValuesTests(BasicDNSSECTest):
                       key='"examples.com HMAC-SHA1 21pffl6ZCb34t6qKr4mP2A=="'), "Error in AXFR: NOTAUTH")
     self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, bs="nan"),
                           "CRITICAL: Parameter --bs has invalid value")
+    self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, offline="ToTaLyR4nD0mNaM3"),
+                          "CRITICAL: Answer store file ToTaLyR4nD0mNaM3 can't be opened")
+    self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, offline="ToTaLyR4nD0mNaM3",
+                                      record="ToTaLyR4nD0mNaM3"),
+                          "CRITICAL: Parameters --offline and --record can't be used together.")
     self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, bs="-3"),
                           "CRITICAL: Parameter --bs has invalid value")
     self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, bs="0"),
                           "CRITICAL: Parameter --bs has invalid value")
     self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, bs='"2.3"'),
                           "CRITICAL: Parameter --bs has invalid value")
+    self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, parallel="0"),
+                          "CRITICAL: Parameter --parallel has invalid value")
+    self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, perserver="abc"),
+                          "CRITICAL: Parameter --perserver has invalid value")
+    self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, columns="0"),
+                          "CRITICAL: Parameter --columns has invalid value")
     self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, bw="nab"),
                           "CRITICAL: Parameter --bs has invalid value")
     self.wrong_value_test(self.runCmd(type="file", input=self.file_ok, check="not_a_option"),
@@ -10,6 +10,8 @@ Description: Contains positive automated tests for testing command line options.
 import unittest
 from subprocess import Popen, PIPE
 import subprocess
+import json
+import os
 
 from UnittestHelper import *
   
@@ -310,6 +312,50 @@ class CmdInputTests(OutputDNSSECTest):
     self.assertHasNoStdout(ret)
     self.assertHasNoStderr(ret)
     
+  def testFileTrustCache(self):
+    '''
+    Tests reading zone from file with --cache option. The second run should
+    take validated keys from the cache file.
+    '''
+    proc = Popen('rm ' + self.TMP_CACHE, shell=True, stdout=PIPE, stderr=PIPE)
+    tmp = proc.communicate()
+    
+    ret = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                      level="info", cache=self.TMP_CACHE)
+    self.assertRunOK(ret)
+    self.assertHasStdout(ret)
+    self.assertTrue(os.path.exists(self.TMP_CACHE), "Cache file was not created.")
+    
+    ret = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                      level="info", cache=self.TMP_CACHE)
+    self.assertRunOK(ret)
+    self.assertHasStdout(ret)
+    self.assertTrue(ret.stderr.find(" 0 read from cache file") == -1,
+                    "Keys should be read from cache file:\n" + ret.stderr)
+    
+    os.remove(self.TMP_CACHE)
+    
+  def testFileOffline(self):
+    '''
+    Tests reading zone from file with --record option and then with --offline
+    option using the recorded answers and a name server, that can't answer.
+    '''
+    ret = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                      record=self.TMP_ANSWERS)
+    self.assertRunOK(ret)
+    self.assertHasStdout(ret)
+    self.assertTrue(os.path.exists(self.TMP_ANSWERS), "Answer store file was not created.")
+    
+    ret = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                      level="info", offline=self.TMP_ANSWERS, resolver="192.0.2.1")
+    self.assertRunOK(ret)
+    self.assertHasStdout(ret)
+    self.assertTrue(ret.stderr.find("Answer store - ") != -1 and
+                    ret.stderr.find(" 0 queries answered") == -1,
+                    "Keys should be read from answer store file:\n" + ret.stderr)
+    
+    os.remove(self.TMP_ANSWERS)
+    
   def testFileCheckOption(self):
     '''
     Tests all --check and --nocheck options using file as an input.
@@ -354,6 +400,202 @@ class CmdInputTests(OutputDNSSECTest):
     self.assertTrue(retAll.stdout + retAll.stderr == retNone.stdout + retNone.stderr,
                     "Output of full check with --check and full check with no --check is not the same.")
     
+  def testFileColumns(self):
+    '''
+    Tests checks of RRSIG times and TTLs in blocks (--columns). Messages have
+    to be the same as without blocks, only their order may differ.
+    '''
+    outputs = []
+    for columns in (None, "3", "1000"):
+      options = {'type': "file", 'input': self.file_bad, 'anchor': '"' + self.file_anchors + '"',
+                 'level': "debug", 'check': '"RRSIG_T;TTL"', 'sformat': '"%(levelname)s: %(message)s"'}
+      if columns is not None:
+        options['columns'] = columns
+      ret = self.runCmd(**options)
+      self.assertRunOK(ret)
+      self.assertNoException(ret.stderr)
+      
+      output = ret.stdout + ret.stderr
+      for val in self.list_RRSIG_T + self.list_TTL:
+        self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+      outputs.append(sorted(output.splitlines()))
+    
+    self.assertTrue(outputs[0] == outputs[1] and outputs[0] == outputs[2],
+                    "Output of checks in blocks is not the same as without them.")
+    
+  def testFileRRSIGOrder(self):
+    '''
+    Tests checks of RRSIGs done in one pass (RRSIG, RRSIG_A and TTL together).
+    Messages have to be the same as of the single checks and for each owner
+    name signatures are written out first, then algorithms and TTLs last.
+    '''
+    ret = self.runCmd(type="file", input=self.file_bad, anchor='"' + self.file_anchors + '"',
+                      level="debug", check='"RRSIG;RRSIG_A;TTL"', sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    
+    output = ret.stdout + ret.stderr
+    for val in self.list_RRSIG + self.list_RRSIG_A + self.list_TTL:
+      self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+    for val in self.list_RRSIG_T:
+      self.assertTrue(output.find(val) == -1, "String \"" + val + '" found in output:\n' + output)
+    
+    #pairs of messages of one owner name in expected order
+    for (first, second) in [("ERROR: Signatures check - a.example.com. SOA",
+                             "WARNING: Minimum TTL from SOA should not be lower than 5-10 minutes"),
+                            ("INFO: Signatures check - test4.a.example.com. NSEC - 1 RRs not secured",
+                             "WARNING: test4.a.example.com. - RSASHA512 algorithm not used for creating RRSIG"),
+                            ("INFO: Signatures check - test2.a.example.com. A - 1 RRs, 2 RRSIGs, all valid",
+                             "WARNING: test2.a.example.com. NSEC - TTL of RRSIG does not match TTL of RR it covers")]:
+      self.assertTrue(output.find(first) < output.find(second),
+                      "String \"" + first + '" not found before "' + second + '" in output:\n' + output)
+    
+  def testFileNSECBitmap(self):
+    '''
+    Tests type coverage of NSEC records (Type Bitmap field compared with types
+    present at the owner name). Missing and superfluous types are written out
+    in order of type numbers, covered owner names have coverage OK message.
+    '''
+    ret = self.runCmd(type="file", input=self.file_bad, anchor='"' + self.file_anchors + '"',
+                      level="info", check="NSEC", sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    
+    output = ret.stdout + ret.stderr
+    for val in ["ERROR: test11.a.example.com. MX type present in NSEC but does not exist.",
+                "ERROR: test11.a.example.com. AAAA type present in NSEC but does not exist.",
+                "ERROR: test6.a.example.com. A type not present in NSEC.",
+                "ERROR: test7.a.example.com. NSEC type not present in NSEC.",
+                "ERROR: test8.a.example.com. RRSIG type not present in NSEC.",
+                "INFO: ns1.a.example.com. NSEC record type coverage OK (A RRSIG NSEC).",
+                "INFO: a.example.com. NSEC record type coverage OK (NS SOA MX RRSIG NSEC DNSKEY)."]:
+      self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+    for owner in ["test11", "test6", "test7", "test8"]:
+      val = "INFO: " + owner + ".a.example.com. NSEC record type coverage OK"
+      self.assertTrue(output.find(val) == -1, "String \"" + val + '" found in output:\n' + output)
+    self.assertTrue(output.find("test11.a.example.com. MX type present") <
+                    output.find("test11.a.example.com. AAAA type present"),
+                    "Types not in order of type numbers:\n" + output)
+    
+  def testFileNSEC3(self):
+    '''
+    Tests NSEC3 chain, coverage and Type Bitmap checks on a zone with opt-out
+    broken on purpose (see the zone file). Empty non-terminals above
+    authoritative data need NSEC3 record even with opt-out, insecure
+    delegations and empty non-terminals above them only do not.
+    '''
+    ret = self.runCmd(type="file", input=self.file_nsec3, anchor=self.file_nsec3_anchor,
+                      level="info", check="NSEC", sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    
+    output = ret.stdout + ret.stderr
+    zone = ".nsec3.example.com."
+    for val in ["ERROR: mail" + zone + " NSEC3 type record not present.",
+                "ERROR: a.b" + zone + " NSEC3 type record not present.",
+                "ERROR: jhqtuctcll6390jf00h4n0gk3248oeo7" + zone + " NSEC3 chain broken - next owner name " +
+                "kr4oqumm32g4tfn6dutusa0d1g0n7j17" + zone + " has no NSEC3 record.",
+                "ERROR: www" + zone + " AAAA type not present in NSEC3.",
+                "INFO: b" + zone + " NSEC3 record type coverage OK ().",
+                "INFO: host.a.b" + zone + " NSEC3 record type coverage OK (A RRSIG).",
+                "INFO: sec" + zone + " NSEC3 record type coverage OK (NS DS RRSIG).",
+                "INFO: nsec3.example.com. NSEC3 record type coverage OK (NS SOA RRSIG DNSKEY NSEC3PARAM)."]:
+      self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+    for val in [" deep" + zone, " sub" + zone, "ns.sub" + zone, "x.deep" + zone,
+                "NSEC3 chain OK", "does not match any owner name"]:
+      self.assertTrue(output.find(val) == -1, "String \"" + val + '" found in output:\n' + output)
+    
+  def testFileGlue(self):
+    '''
+    Tests checks of a zone with a delegation. Glue records below the zone cut
+    are not authoritative, so their signatures and NSEC records are not
+    checked. Data outside of the zone are skipped with a warning.
+    '''
+    ret = self.runCmd(type="file", input=self.file_glue, anchor=self.file_glue_anchor,
+                      level="debug", check='"RRSIG;NSEC"', sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    
+    output = ret.stdout + ret.stderr
+    for val in ["DEBUG: ns.sub.glue.example.com. is below a zone cut (glue), skipping checks.",
+                "WARNING: www.example.net. is outside of the zone glue.example.com., skipping checks.",
+                "INFO: Signatures check - www.glue.example.com. A - 1 RRs, 1 RRSIGs, all valid.",
+                "INFO: glue.example.com. NSEC chain OK (4 records)."]:
+      self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+    for val in ["Signatures check - ns.sub.glue.example.com.", "ns.sub.glue.example.com. NSEC",
+                "Signatures check - www.example.net.", "www.example.net. NSEC"]:
+      self.assertTrue(output.find(val) == -1, "String \"" + val + '" found in output:\n' + output)
+    
+  def testFileTimeWrap(self):
+    '''
+    Tests RRSIG time check with static time (--time) after the wrap of 32 bit
+    time values and time zone other than UTC. The time is local time, but
+    RRSIG times are in UTC, so 2106-02-10 00:00:00 EST is 05:00:00 UTC.
+    '''
+    tz = os.environ.get("TZ")
+    os.environ["TZ"] = "EST5EDT"
+    try:
+      ret = self.runCmd(type="file", input=self.file_wrap, anchor='"' + self.file_anchors + '"',
+                        level="info", check="RRSIG_T", time='"2106-02-10 00:00:00"',
+                        sformat='"%(levelname)s: %(message)s"')
+    finally:
+      if tz is None:
+        del os.environ["TZ"]
+      else:
+        os.environ["TZ"] = tz
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    
+    output = ret.stdout + ret.stderr
+    for val in ["INFO: Signatures time check - wrap.example.com. SOA - 1 total, 1 valid, 0 old, 0 future.",
+                "INFO: Signatures time check - a.wrap.example.com. A - 1 total, 1 valid, 0 old, 0 future.",
+                "ERROR: Signatures time check - b.wrap.example.com. A - 0 valid, 1 total, 1 old, 0 future.",
+                "INFO: Signatures time check - c.wrap.example.com. A - 1 total, 1 valid, 0 old, 0 future.",
+                "ERROR: Signatures time check - d.wrap.example.com. A - 0 valid, 1 total, 0 old, 1 future."]:
+      self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+    
+  def testFileEmpty(self):
+    '''
+    Tests, that a zone file without records is skipped and the next source is
+    checked.
+    '''
+    ret = self.runCmd(type="file", input='"' + self.file_empty + ";" + self.file_ok + '"',
+                      anchor='"' + self.file_anchors + '"', level="info",
+                      sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    
+    output = ret.stdout + ret.stderr
+    for val in ["CRITICAL: No SOA record available. Skipping this source.",
+                "INFO: Signatures time check - a.example.com. SOA"]:
+      self.assertTrue(output.find(val) != -1, "String \"" + val + '" not found in output:\n' + output)
+    
+  def testFileForecast(self):
+    '''
+    Tests RRSIG expiration forecast (--forecast). RRsets expiring first have
+    to be written out and saved in order of expiration.
+    '''
+    forecast = "/tmp/dnssec_test_forecast.json"
+    if os.path.exists(forecast):
+      os.remove(forecast)
+    ret = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                      level="info", forecast=forecast)
+    self.assertRunOK(ret)
+    self.assertNoException(ret.stderr)
+    self.assertTrue((ret.stdout + ret.stderr).find("Expiration forecast - ") != -1,
+                    "Forecast not written out.")
+    
+    data = json.load(open(forecast))
+    self.assertEqual(len(data["zones"]), 1)
+    zone = data["zones"].values()[0]
+    expirations = [rrset["expiration"] for rrset in zone["next"]]
+    self.assertTrue(0 < len(expirations) <= 10)
+    self.assertEqual(expirations, sorted(expirations))
+    self.assertEqual(zone["first_expiration"], expirations[0])
+    self.assertEqual(data["first_expiration"], expirations[0])
+    self.assertEqual(zone["time_left"], expirations[0] - zone["checked"])
+    self.assertEqual(sum(zone["histogram"]), zone["rrsets"])
+    
   def testFileBuffer(self):
     '''
     Tests buffer options --bw and --bs.
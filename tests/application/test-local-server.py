@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+'''
+File:        test-local-server.py
+Date:        19.10.2026
+Author:      agent, agent@local
+Description: Contains automated tests using a local DNS server, so they do not
+             need any network.
+'''
+import os
+import re
+import json
+import unittest
+
+from UnittestHelper import *
+from LocalDNSServer import LocalDNSServer
+from AXFRClient import AXFRFetcher
+from Exceptions import AXFRError
+
+class LocalServerTests(BasicDNSSECTest):
+  '''
+  Tests of zone transfer and queries using L{LocalDNSServer} serving the test
+  zone on 127.0.0.1.
+  '''
+
+  def setUp(self):
+    self.servers = []
+
+  def startServer(self, **options):
+    '''
+    Starts a local server serving the test zone with given options and
+    returns it. The first started server is also in attribute server.
+    '''
+    server = LocalDNSServer([self.file_ok], port=self.local_port, **options)
+    server.start()
+    self.servers.append(server)
+    self.server = self.servers[0]
+    return server
+
+  def tearDown(self):
+    for server in self.servers:
+      server.stop()
+
+  @staticmethod
+  def problems(ret):
+    '''
+    Returns lines of standard error output with severity warning or higher.
+    '''
+    return [line for line in ret.stderr.splitlines()
+            if line.split(":")[0] in ("WARNING", "ERROR", "CRITICAL")]
+
+  def testAXFRMinimal(self):
+    '''
+    Tests reading zone from axfr with minimal configuration.
+    '''
+    self.startServer()
+    ret = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"')
+    self.assertRunOK(ret)
+    self.assertHasStdout(ret)
+    self.assertHasNoStderr(ret)
+
+  def testAXFRSameAsFile(self):
+    '''
+    Tests, that zone fetched by axfr gives the same output as the zone file.
+    '''
+    self.startServer()
+    ret_axfr = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                           resolver='"' + self.local_resolver + '"', level="warning",
+                           sformat='"%(levelname)s: %(message)s"')
+    ret_file = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                           resolver='"' + self.local_resolver + '"', level="warning",
+                           sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret_axfr)
+    self.assertRunOK(ret_file)
+    self.assertEqual(ret_axfr.stderr, ret_file.stderr)
+
+  def testLatencyAndLoss(self):
+    '''
+    Tests, that queries are answered by a slow server losing packets.
+    '''
+    self.startServer(latency=0.05, loss=0.3)
+    ret = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"')
+    self.assertRunOK(ret)
+    self.assertHasStdout(ret)
+    self.assertHasNoStderr(ret)
+
+  def testAXFRSerialNumber(self):
+    '''
+    Tests, that an unchanged zone is skipped by SOA query without transfer.
+    '''
+    self.startServer()
+    self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                resolver='"' + self.local_resolver + '"', sn=None)
+    transfers = self.server.transfers
+    ret = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"', sn=None, level="info")
+    self.assertRunOK(ret)
+    self.assertHasNoStderr(ret)
+    self.assertEqual(transfers, self.server.transfers)
+
+  def testAXFRSerialNumberParallel(self):
+    '''
+    Tests, that an unchanged zone is not transferred in background either.
+    '''
+    self.startServer()
+    self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                resolver='"' + self.local_resolver + '"', sn=None)
+    transfers = self.server.transfers
+    ret = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"', sn=None, level="info",
+                      parallel="4")
+    self.assertRunOK(ret)
+    self.assertHasNoStderr(ret)
+    self.assertEqual(transfers, self.server.transfers)
+
+  def testMetrics(self):
+    '''
+    Tests, that transport metrics are written with the zone transfer.
+    '''
+    self.startServer()
+    metrics = "/tmp/dnssec_test_metrics.json"
+    ret = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"', metrics=metrics)
+    self.assertRunOK(ret)
+    data = json.load(open(metrics))
+    self.assertEqual([t["domain"] for t in data["transfers"]], [self.axfr_domain])
+    self.assertTrue(data["transfers"][0]["records"] > 0)
+    self.assertTrue(data["queries"]["answered"] > 0)
+    self.assertTrue(data["rtt_histograms"].has_key("127.0.0.1"))
+
+  def testAXFRParallel(self):
+    '''
+    Tests, that zones transferred in background give the same output as zones
+    transferred one after another.
+    '''
+    self.startServer()
+    zones = self.axfr_domain + ";" + self.axfr_domain + ";example.net"
+    ret_seq = self.runCmd(type="axfr", input='"' + zones + '"', anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + '"', level="warning",
+                          sformat='"%(levelname)s: %(message)s"')
+    ret_par = self.runCmd(type="axfr", input='"' + zones + '"', anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + '"', level="warning",
+                          sformat='"%(levelname)s: %(message)s"', parallel="4", perserver="1")
+    self.assertRunOK(ret_par)
+    self.assertEqual(ret_seq.stderr, ret_par.stderr)
+
+  def testAXFRParallelErrors(self):
+    '''
+    Tests, that transfers in background, which can't be written to spool or
+    have no name server, fail with an error instead of a hang.
+    '''
+    self.startServer()
+    fetcher = AXFRFetcher(2, 1, 1.0, "/tmp/dnssec_test_no_such_dir/spool")
+    fetcher.add(self.axfr_domain, [("127.0.0.1", self.local_port)])
+    fetcher.add("example.net", [])
+    fetcher.start()
+    try:
+      self.assertRaises(AXFRError, fetcher.reader, self.axfr_domain)
+      self.assertRaises(AXFRError, fetcher.reader, "example.net")
+    finally:
+      fetcher.close()
+
+  def testSpoolReplay(self):
+    '''
+    Tests, that zone replayed from spool gives the same output as its
+    transfer.
+    '''
+    self.startServer()
+    spool = "/tmp/dnssec_test_spool"
+    ret_axfr = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                           resolver='"' + self.local_resolver + '"', level="warning",
+                           sformat='"%(levelname)s: %(message)s"', spool=spool)
+    transfers = self.server.transfers
+    ret_spool = self.runCmd(type="spool", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                            resolver='"' + self.local_resolver + '"', level="warning",
+                            sformat='"%(levelname)s: %(message)s"', spool=spool)
+    self.assertRunOK(ret_axfr)
+    self.assertRunOK(ret_spool)
+    self.assertEqual(ret_axfr.stderr, ret_spool.stderr)
+    self.assertEqual(transfers, self.server.transfers)
+
+  def testAXFRBatches(self):
+    '''
+    Tests, that zone transferred in many small messages gives the same output
+    as the zone file, both from the transfer and replayed from spool.
+    '''
+    self.startServer()
+    self.server.axfr_records = 3
+    spool = "/tmp/dnssec_test_spool_batches"
+    metrics = "/tmp/dnssec_test_metrics.json"
+    ret_file = self.runCmd(type="file", input=self.file_ok, anchor='"' + self.file_anchors + '"',
+                           resolver='"' + self.local_resolver + '"', level="warning",
+                           sformat='"%(levelname)s: %(message)s"')
+    ret_axfr = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                           resolver='"' + self.local_resolver + '"', level="warning",
+                           sformat='"%(levelname)s: %(message)s"', spool=spool, metrics=metrics)
+    ret_spool = self.runCmd(type="spool", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                            resolver='"' + self.local_resolver + '"', level="warning",
+                            sformat='"%(levelname)s: %(message)s"', spool=spool)
+    self.assertRunOK(ret_file)
+    self.assertRunOK(ret_axfr)
+    self.assertRunOK(ret_spool)
+
+    transfer = json.load(open(metrics))["transfers"][0]
+    self.assertTrue(transfer["messages"] > 1)
+    #SOA record closing the transfer is not counted
+    self.assertEqual(transfer["messages"], (transfer["records"] + 3) // 3)
+    self.assertEqual(ret_axfr.stderr, ret_file.stderr)
+    self.assertEqual(ret_spool.stderr, ret_file.stderr)
+
+  def testServerPreference(self):
+    '''
+    Tests, that the next zone is transferred from the faster name server, even
+    when it is not the first one configured, and gives the same output.
+    '''
+    self.startServer(latency=1.0)
+    fast = self.startServer(address="127.0.0.2")
+    zones = self.axfr_domain + ";" + self.axfr_domain
+    metrics = "/tmp/dnssec_test_metrics.json"
+    ret_one = self.runCmd(type="axfr", input='"' + zones + '"', anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + '"', level="warning",
+                          sformat='"%(levelname)s: %(message)s"')
+    ret_two = self.runCmd(type="axfr", input='"' + zones + '"', anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + ";127.0.0.2#" + str(self.local_port) + '"',
+                          level="warning", sformat='"%(levelname)s: %(message)s"', metrics=metrics)
+    self.assertRunOK(ret_one)
+    self.assertRunOK(ret_two)
+    self.assertEqual(ret_one.stderr, ret_two.stderr)
+
+    #first zone from the first server, queries hedged to the second one show it is faster
+    data = json.load(open(metrics))
+    self.assertEqual([t["server"] for t in data["transfers"]], ["127.0.0.1", "127.0.0.2"])
+    self.assertEqual(fast.transfers, 1)
+    self.assertTrue(data["queries"]["failover"] > 0)
+
+  def testResponseCache(self):
+    '''
+    Tests, that queries for a zone checked again are answered from the
+    response cache, so only the transfer is sent, and the output stays the
+    same.
+    '''
+    self.startServer()
+    queries = self.server.queries
+    ret_one = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + '"', level="warning",
+                          sformat='"%(levelname)s: %(message)s"')
+    queries_one = self.server.queries - queries
+    queries = self.server.queries
+    ret_two = self.runCmd(type="axfr", input='"' + self.axfr_domain + ";" + self.axfr_domain + '"',
+                          anchor='"' + self.file_anchors + '"', resolver='"' + self.local_resolver + '"',
+                          level="info", sformat='"%(levelname)s: %(message)s"')
+    queries_two = self.server.queries - queries
+    self.assertRunOK(ret_one)
+    self.assertRunOK(ret_two)
+    self.assertEqual(self.problems(ret_two), self.problems(ret_one) * 2)
+
+    self.assertEqual(queries_two, queries_one + 1) #only the second transfer
+    hits = re.search(r"Response cache - (\d+) hits", ret_two.stderr)
+    self.assertTrue(hits is not None and int(hits.group(1)) > 0,
+                    "Answers from response cache expected:\n" + ret_two.stderr)
+
+  def testTCPConnectionReuse(self):
+    '''
+    Tests, that queries with answers truncated over UDP are sent over one TCP
+    connection and give the same output as over UDP.
+    '''
+    self.startServer()
+    metrics = "/tmp/dnssec_test_metrics.json"
+    ret_udp = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + '"', level="warning",
+                          sformat='"%(levelname)s: %(message)s"')
+    self.server.udp_size = 0 #truncate all answers
+    connections = self.server.connections
+    ret_tcp = self.runCmd(type="axfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                          resolver='"' + self.local_resolver + '"', level="warning",
+                          sformat='"%(levelname)s: %(message)s"', metrics=metrics)
+    self.assertRunOK(ret_udp)
+    self.assertRunOK(ret_tcp)
+    self.assertEqual(ret_udp.stderr, ret_tcp.stderr)
+
+    self.assertTrue(json.load(open(metrics))["queries"]["tcp"] > 1)
+    #one connection for the transfer, one for all queries
+    self.assertEqual(self.server.connections - connections, 2)
+
+  def testIXFRFallback(self):
+    '''
+    Tests ixfr against a server without IXFR support. Both the first run
+    (without snapshot) and the second one (with it) should use AXFR.
+    '''
+    self.startServer()
+    snapshot = "/tmp/dnssec_zone_snapshots/" + self.axfr_domain + ".zone"
+    if os.path.exists(snapshot):
+      os.remove(snapshot)
+
+    for i in range(2):
+      ret = self.runCmd(type="ixfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                        resolver='"' + self.local_resolver + '"')
+      self.assertRunOK(ret)
+      self.assertHasStdout(ret)
+    self.assertTrue(os.path.exists(snapshot), "Zone snapshot expected: " + snapshot)
+
+  def testIXFRChanges(self):
+    '''
+    Tests ixfr against a server with IXFR support. After the next version of
+    the zone is loaded, only its changes are transferred. Owner names touched
+    by them, their neighbours and the zone apex are checked and the snapshot
+    is updated.
+    '''
+    self.startServer(ixfr=True)
+    snapshot = "/tmp/dnssec_zone_snapshots/" + self.axfr_domain + ".zone"
+    if os.path.exists(snapshot):
+      os.remove(snapshot)
+
+    ret = self.runCmd(type="ixfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"', check="RRSIG_T")
+    self.assertRunOK(ret)
+    transfers = self.server.transfers
+
+    self.server.load(self.file_ixfr) #changed test14, deleted test5, added test20
+    ret = self.runCmd(type="ixfr", input=self.axfr_domain, anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"', check="RRSIG_T", level="info",
+                      sformat='"%(levelname)s: %(message)s"')
+    self.assertRunOK(ret)
+    self.assertEqual(transfers, self.server.transfers)
+    self.assertEqual(self.server.incremental, 1)
+    val = "INFO: IXFR of " + self.axfr_domain + " - 3 owner names changed, 9 of 21 owner names will be checked."
+    self.assertTrue(ret.stderr.find(val) != -1, "String \"" + val + '" not found in output:\n' + ret.stderr)
+
+    checked = set(re.findall(r"Signatures time check - (\S+) ", ret.stderr))
+    expected = set([self.axfr_domain + "."] +
+                   [owner + "." + self.axfr_domain + "." for owner in
+                    ("test13", "test14", "test15", "test4", "test6", "test2", "test20", "test3")])
+    self.assertEqual(checked, expected)
+
+    data = open(snapshot).read()
+    self.assertTrue(data.find("192.168.0.114") != -1)
+    self.assertTrue(data.find("test20." + self.axfr_domain + ".") != -1)
+    self.assertTrue(data.find("test5." + self.axfr_domain + ".") == -1)
+
+  def testWrongDomain(self):
+    '''
+    Tests axfr of a zone, which is not served.
+    '''
+    self.startServer()
+    ret = self.runCmd(type="axfr", input="example.net", anchor='"' + self.file_anchors + '"',
+                      resolver='"' + self.local_resolver + '"')
+    self.assertHasStderr(ret)
+    self.assertTrue(ret.stderr.find("CRITICAL: Can't start AXFR.") != -1 or
+                    ret.stderr.find("Error in AXFR") != -1,
+                    "Error caused by wrong domain expected:\n" + ret.stderr)
+
+if __name__ == "__main__":
+    unittest.main()
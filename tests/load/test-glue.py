@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+File:        test-glue.py
+Date:        19.10.2026
+Author:      agent, agent@local
+Description: Contains load test of NSEC check on zones with many delegations.
+             Glue records coming before their NS records have to be matched
+             with NS records, glue records after them are below a known zone
+             cut and skipped.
+'''
+
+import sys
+from subprocess import Popen, PIPE
+from time import time
+
+def makeZone(fname, delegations, glue_first):
+  '''
+  Writes a synthetic zone with given count of delegations. Each delegation has
+  one NS record and one A glue record. When L{glue_first} is set, all glue
+  records come before NS records in reversed order, so unmatched glue
+  records pile up and the matching ones are far from the start. Otherwise
+  each glue record follows its NS record, like in canonical order.
+  '''
+  f = open(fname, "w")
+  f.write("$ORIGIN example.\n$TTL 3600\n")
+  f.write("@\tIN\tSOA\tns.example. root.example. 1 3600 900 604800 3600\n")
+  f.write("@\tIN\tNS\tns.example.\nns\tIN\tA\t192.0.2.1\n")
+
+  if glue_first:
+    for i in reversed(range(delegations)):
+      f.write("ns.d%d\tIN\tA\t192.0.2.2\n" % i)
+    for i in range(delegations):
+      f.write("d%d\tIN\tNS\tns.d%d.example.\n" % (i, i))
+  else:
+    for i in range(delegations):
+      f.write("d%d\tIN\tNS\tns.d%d.example.\n" % (i, i))
+      f.write("ns.d%d\tIN\tA\t192.0.2.2\n" % i)
+  f.close()
+
+def runCmd(test_title, fname, anchors):
+  '''
+  Runs NSEC check of given zone and prints how long it took.
+  '''
+  print '{: <20}\t'.format(test_title),
+  sys.stdout.flush()
+
+  start = time()
+  proc = Popen('python Main.py --type=file --input="' + fname + '" --anchor=' + anchors +
+               ' --check=NSEC --bw=0', shell=True, stdout=PIPE, stderr=PIPE)
+  proc.communicate()
+
+  print '{:.2f}'.format(time() - start)
+  sys.stdout.flush()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+      print >>sys.stderr, "Script requires trust anchor file as parameter."
+    else:
+      print '{: <20}\t'.format("Delegations") + "Time"
+      for glue_first in (True, False):
+        for count in (10000, 50000, 100000, 200000):
+          fname = "/tmp/dnssec_glue_" + str(count) + ".zone"
+          makeZone(fname, count, glue_first)
+          runCmd(str(count) + (" glue first" if glue_first else " NS first"), fname, sys.argv[1])